@@ -0,0 +1,80 @@
+from collections import namedtuple
+import hashlib
+import http.client
+import logging
+logger = logging.getLogger()
+
+WEB_PORT = 9093
+
+ConfigMetrics = namedtuple('ConfigMetrics',
+                           ['config_hash', 'last_reload_successful'])
+
+
+def config_hash(config_file_content):
+    """
+    Returns the value a replica reports as its alertmanager_config_hash
+    once it has loaded a config file with the given content: the first 6
+    bytes of the file's md5 digest read as a little-endian integer.
+    """
+    digest = hashlib.md5(config_file_content.encode('utf-8')).digest()
+    return float(int.from_bytes(digest[:6], 'little'))
+
+
+class AlertManagerAPI:
+    """
+    Wraps the HTTP API of a single AlertManager replica as reachable from
+    the operator pod.
+    """
+
+    def __init__(self, host, port=WEB_PORT, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def get_config_metrics(self):
+        """
+        Returns the hash of the config file the replica last loaded and
+        whether its latest attempt at loading one succeeded, as reported
+        by its own metrics.
+        """
+        status, body = self._request('GET', '/metrics')
+        if status != 200:
+            return None
+
+        samples = _parse_metrics(body.decode('utf-8'))
+        return ConfigMetrics(
+            config_hash=samples['alertmanager_config_hash'],
+            last_reload_successful=bool(
+                samples['alertmanager_config_last_reload_successful']))
+
+    def reload(self):
+        """
+        Makes the replica re-read its config file without restarting, thus
+        keeping its in-memory aggregation groups and cluster membership.
+        """
+        status, _ = self._request('POST', '/-/reload')
+        return status == 200
+
+    def _request(self, method, path):
+        conn = http.client.HTTPConnection(self.host,
+                                          self.port,
+                                          timeout=self.timeout)
+        logger.debug("%s %s:%s%s", method, self.host, self.port, path)
+        try:
+            conn.request(method=method, url=path)
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+
+
+def _parse_metrics(text):
+    # Samples are keyed by their name and labels, if any. The config
+    # metrics have none.
+    samples = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) < 2 or fields[0].startswith('#'):
+            continue
+        samples[fields[0]] = float(fields[1])
+    return samples
@@ -0,0 +1,93 @@
+from collections import OrderedDict
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger()
+
+# Generous enough for a handful of very large AlertManager configs while
+# keeping the charm directory from growing without bound.
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+MEMORY_MAX_ENTRIES = 8
+
+
+class RenderCache:
+    '''
+    A content-addressed cache of rendered text. The key is expected to be a
+    digest of everything the text was rendered from, so an entry never
+    needs to be invalidated, only evicted.
+
+    Entries are kept in memory for the life of the process and on disk
+    under directory so that they survive across hooks. Once the entries on
+    disk add up to more than max_bytes, the least recently used ones are
+    evicted.
+
+    directory is a pathlib.Path which is only created once an entry is
+    written to it.
+    '''
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def get(self, key):
+        if key in _memory:
+            _memory.move_to_end(key)
+            return _memory[key]
+
+        path = self.directory / key
+        try:
+            text = path.read_text()
+            # Bump the mtime so that eviction is least-recently-used
+            os.utime(str(path))
+        except OSError:
+            return None
+
+        _remember(key, text)
+        return text
+
+    def put(self, key, text):
+        _remember(key, text)
+
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Write to a temp file first so that a hook that gets killed
+            # midway never leaves a truncated entry behind.
+            fd, tmp_path = tempfile.mkstemp(dir=str(self.directory),
+                                            prefix='.tmp-')
+            with os.fdopen(fd, 'w') as tmp_file:
+                tmp_file.write(text)
+            os.replace(tmp_path, str(self.directory / key))
+            self._evict()
+        except OSError as err:
+            logger.warning("Could not write render cache entry %s: %s",
+                           key, err)
+
+    def _evict(self):
+        entries = sorted(
+            (entry.stat().st_mtime_ns, entry.stat().st_size, entry)
+            for entry in self.directory.iterdir()
+            if not entry.name.startswith('.tmp-')
+        )
+        total_bytes = sum(size for _, size, _ in entries)
+
+        for _, size, entry in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            logger.debug("Evicting render cache entry %s", entry.name)
+            entry.unlink()
+            total_bytes -= size
+
+
+# MODULE STATE
+# Shared by all RenderCache instances. Since keys are content-addressed,
+# an entry is valid regardless of which directory it came from.
+
+_memory = OrderedDict()
+
+
+def _remember(key, text):
+    _memory[key] = text
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_MAX_ENTRIES:
+        _memory.popitem(last=False)
@@ -6,6 +6,10 @@ from ops.model import (
 )
 import os
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 logger = logging.getLogger()
 
@@ -46,6 +50,12 @@ def _fetch_image_meta(image_name, resources_repo):
         msg = 'Resource not found at {}'.format(path)
         raise ResourceError(image_name, msg)
 
+    # Juju only replaces the file when a new revision of the resource is
+    # attached, so the path and mtime identify its content.
+    cache_key = (str(path), path.stat().st_mtime_ns)
+    if cache_key in _image_meta_cache:
+        return _image_meta_cache[cache_key]
+
     resource_yaml = path.read_text()
 
     if not resource_yaml:
@@ -53,16 +63,18 @@ def _fetch_image_meta(image_name, resources_repo):
         raise ResourceError(image_name, msg)
 
     try:
-        resource_dict = yaml.safe_load(resource_yaml)
+        resource_dict = yaml.load(resource_yaml, Loader=SafeLoader)
     except yaml.error.YAMLError:
         msg = 'Invalid YAML at {}'.format(path)
         raise ResourceError(image_name, msg)
     else:
-        return ImageMeta(resource_dict=resource_dict)
+        image_meta = ImageMeta(resource_dict=resource_dict)
+        _image_meta_cache[cache_key] = image_meta
+        return image_meta
 
 
 def _read_resource_file(resource_name, resources_repo):
-    logger.debug("Fetch path for resource {}".format(resource_name))
+    logger.debug("Fetch path for resource %s", resource_name)
 
     try:
         path = resources_repo.fetch(resource_name)
@@ -76,7 +88,7 @@ def _read_resource_file(resource_name, resources_repo):
         logger.error(msg)
         raise ResourceError(resource_name, msg)
 
-    logger.debug("Resource found at {}".format(path))
+    logger.debug("Resource found at %s", path)
 
     file_contents = path.read_text()
 
@@ -93,31 +105,49 @@ class FrameworkAdapter:
     so that our Charm object's code is decoupled from it and simplifies
     its own implementation. This is inspired by Alistair Cockburn's
     Hexagonal Architecture.
+
+    With memoize set, values read from the model are kept for the life of
+    the adapter, which in a charm is a single dispatch, and only read again
+    after the charm writes something through it.
     '''
 
-    def __init__(self, framework):
+    def __init__(self, framework, memoize=False):
         self._framework = framework
+        self._memo = {} if memoize else None
 
     def am_i_leader(self):
         return self._framework.model.unit.is_leader()
 
     def get_app_name(self):
-        return self._framework.model.app.name
+        return self._memoized('app_name',
+                              lambda: self._framework.model.app.name)
+
+    def get_charm_dir(self):
+        return self._framework.charm_dir
 
     def get_config(self, key=None):
+        config = self._memoized('config',
+                                lambda: self._framework.model.config)
         if key:
-            return self._framework.model.config[key]
+            return config[key]
         else:
-            return self._framework.model.config
+            return config
 
     def get_image_meta(self, image_name):
-        return _fetch_image_meta(image_name, self.get_resources_repo())
+        return self._memoized(
+            ('image_meta', image_name),
+            lambda: _fetch_image_meta(image_name, self.get_resources_repo()))
 
     def get_model_name(self):
         return os.environ["JUJU_MODEL_NAME"]
 
+    def get_relation(self, relation_name, relation_id):
+        return self._framework.model.get_relation(relation_name, relation_id)
+
     def get_relations(self, relation_name):
-        return self._framework.model.relations[relation_name]
+        return self._memoized(
+            ('relations', relation_name),
+            lambda: self._framework.model.relations[relation_name])
 
     def read_resource_file(self, resource_name):
         return _read_resource_file(resource_name, self.get_resources_repo())
@@ -131,11 +161,47 @@ class FrameworkAdapter:
     def get_unit_name(self):
         return os.environ["JUJU_UNIT_NAME"]
 
+    def get_unit_status(self):
+        return self._framework.model.unit.status
+
     def observe(self, event, handler):
         self._framework.observe(event, handler)
 
     def set_pod_spec(self, spec_obj):
         self._framework.model.pod.set_spec(spec_obj)
+        self._invalidate()
+
+    def set_relation_data(self, relation, data_dict):
+        '''
+        Only writes the values that differ from those already in this
+        unit's bag since each write shells out to relation-set. Returns
+        whether anything was written.
+        '''
+        relation_data = relation.data[self.get_unit()]
+        stale_dict = {key: value for key, value in data_dict.items()
+                      if relation_data.get(key) != value}
+        if not stale_dict:
+            return False
+
+        relation_data.update(stale_dict)
+        self._invalidate()
+        return True
 
     def set_unit_status(self, state_obj):
         self._framework.model.unit.status = state_obj
+
+    def _invalidate(self):
+        if self._memo is not None:
+            self._memo.clear()
+
+    def _memoized(self, key, fetch):
+        if self._memo is None:
+            return fetch()
+        if key not in self._memo:
+            self._memo[key] = fetch()
+        return self._memo[key]
+
+
+# MODULE STATE
+
+_image_meta_cache = {}
@@ -1,59 +1,504 @@
+from email.utils import parsedate_to_datetime
 import json
 import http.client
 import logging
 logger = logging.getLogger()
+import os
+import random
 import ssl
+import time
+from urllib.parse import urlencode
+
+from adapters import metrics
+
+SERVICE_ACCOUNT_DIR = '/var/run/secrets/kubernetes.io/serviceaccount'
+TOKEN_PATH = os.path.join(SERVICE_ACCOUNT_DIR, 'token')
+CA_PATH = os.path.join(SERVICE_ACCOUNT_DIR, 'ca.crt')
+API_HOST = 'kubernetes.default.svc'
+API_PORT = 443
+# Number of items per page when listing resources. This bounds how much of
+# a large list is held in memory at any one time.
+PAGE_SIZE = 100
+# Responses that mean the API server is overloaded or briefly unavailable
+# and that the same request may well succeed if retried later.
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
 
 
 def get_pod_status(juju_model, juju_app, juju_unit):
     namespace = juju_model
+    label_selector = 'juju-app={}'.format(juju_app)
+    api_server = APIServer()
 
-    path = '/api/v1/namespaces/{}/pods?' \
-           'labelSelector=juju-app={}'.format(namespace, juju_app)
+    # Juju deploys the workload as a StatefulSet so the pod for unit
+    # <app>/<n> is normally named <app>-<n>. Asking the API server for just
+    # that pod keeps the response the same size no matter how many units
+    # the application has.
+    path = _pods_path(namespace,
+                      labelSelector=label_selector,
+                      fieldSelector='metadata.name={}'.format(
+                          _pod_name_from_unit(juju_unit)))
+    pods_by_name = api_server.get(path).get('items') or []
+    status_dict = _find_unit_pod(pods_by_name, juju_unit)
 
-    api_server = APIServer()
-    response = api_server.get(path)
-    status_dict = None
-
-    if response.get('kind', '') == 'PodList' and response['items']:
-        status_dict = next(
-            (i for i in response['items']
-             if i['metadata']['annotations'].get('juju.io/unit') == juju_unit),
-            None
-        )
+    if status_dict is None:
+        # Juju never reuses unit numbers but the StatefulSet reuses pod
+        # ordinals, so after scaling down and back up unit <app>/5 may well
+        # run in pod <app>-2. Fall back to going through the pods of the
+        # application page by page.
+        logger.debug("Pod for %s not found by name. Listing all pods of %s",
+                     juju_unit, juju_app)
+        status_dict = _find_unit_pod(
+            PodPager(api_server, namespace, labelSelector=label_selector),
+            juju_unit)
 
     return PodStatus(status_dict)
 
 
+class PodPager:
+    """
+    Iterates over the pods in a namespace one at a time, fetching them from
+    the API server in pages of page_size using limit and continue tokens.
+    Pages are only fetched as they are needed, so a caller that stops early
+    never downloads the rest of the list.
+    """
+
+    def __init__(self, api_server, namespace, page_size=None, **query):
+        self._api_server = api_server
+        self._namespace = namespace
+        self._page_size = page_size or PAGE_SIZE
+        self._query = query
+
+    def __iter__(self):
+        continue_token = None
+
+        while True:
+            query = dict(self._query, limit=self._page_size)
+            if continue_token:
+                query['continue'] = continue_token
+
+            page = self._api_server.get(_pods_path(self._namespace, **query))
+            if page.get('kind', '') != 'PodList':
+                return
+
+            yield from page['items'] or []
+
+            continue_token = page.get('metadata', {}).get('continue')
+            if not continue_token:
+                return
+
+
+def get_pod_ips(juju_model, juju_app):
+    pods = PodPager(APIServer(),
+                    juju_model,
+                    labelSelector='juju-app={}'.format(juju_app))
+
+    return [p['status']['podIP'] for p in pods
+            if p.get('status', {}).get('podIP')]
+
+
+def update_mounted_file(juju_model, juju_app, mount_path, file_name, content):
+    """
+    Replaces the content of a file that Juju mounts into the app's pods from
+    a ConfigMap, without touching the pod spec. The kubelet propagates the
+    change to the running pods on its next sync, which can take a minute.
+    """
+    namespace = juju_model
+    api_server = APIServer()
+    pods = PodPager(api_server,
+                    namespace,
+                    labelSelector='juju-app={}'.format(juju_app))
+
+    config_map_name = next(
+        (name for name in (_find_config_map_mounted_at(p, mount_path)
+                           for p in pods)
+         if name),
+        None
+    )
+    if not config_map_name:
+        raise APIError("No ConfigMap is mounted at {} in the pods of "
+                       "{}".format(mount_path, juju_app))
+
+    path = '/api/v1/namespaces/{}/configmaps/{}'.format(namespace,
+                                                        config_map_name)
+    api_server.patch(path, {'data': {file_name: content}})
+
+
+def _find_config_map_mounted_at(pod_dict, mount_path):
+    spec = pod_dict.get('spec', {})
+
+    volume_names = [m['name']
+                    for c in spec.get('containers', [])
+                    for m in c.get('volumeMounts', [])
+                    if m.get('mountPath') == mount_path]
+
+    return next(
+        (v['configMap']['name'] for v in spec.get('volumes', [])
+         if v['name'] in volume_names and 'configMap' in v),
+        None
+    )
+
+
+def _find_unit_pod(pods, juju_unit):
+    return next(
+        (i for i in pods
+         if i['metadata']['annotations'].get('juju.io/unit') == juju_unit),
+        None
+    )
+
+
+def _pod_name_from_unit(juju_unit):
+    return str(juju_unit).replace('/', '-')
+
+
+def _pods_path(namespace, **query):
+    return '/api/v1/namespaces/{}/pods?{}'.format(namespace,
+                                                  urlencode(query))
+
+
 class APIServer:
     """
     Wraps the logic needed to access the k8s API server from inside a pod.
     It does this by reading the service account token which is mounted onto
     the pod.
+
+    Connections are taken from a module-level pool so that repeated calls
+    within the same hook (e.g. while waiting for the pod to become ready)
+    reuse a single TLS session instead of paying for a new handshake each
+    time.
+
+    Failed requests are retried as per retry_policy. Once too many of them
+    failed in a row, a circuit breaker shared by all instances fails any
+    further requests to the same server straight away for a while.
     """
 
+    def __init__(self,
+                 host=API_HOST,
+                 port=API_PORT,
+                 token_path=TOKEN_PATH,
+                 ca_path=CA_PATH,
+                 pool=None,
+                 retry_policy=None):
+        self.host = host
+        self.port = port
+        self.token_path = token_path
+        self.ca_path = ca_path
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._pool = pool or _pool
+
     def get(self, path):
         return self.request('GET', path)
 
-    def request(self, method, path):
-        with open("/var/run/secrets/kubernetes.io/serviceaccount/token") \
-                as token_file:
-            kube_token = token_file.read()
+    def patch(self, path, patch_dict):
+        return self.request('PATCH', path,
+                            body=json.dumps(patch_dict),
+                            content_type='application/merge-patch+json')
+
+    def request(self, method, path, body=None, content_type=None):
+        """
+        Raises APIError if the API server rejected the request, if no
+        attempt succeeded before the retry policy's deadline or if the
+        circuit breaker is open.
+        """
+        policy = self.retry_policy
+        breaker = _get_breaker(self.host, self.port, policy)
+        deadline = policy.clock() + policy.deadline
+        attempt = 0
+
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(
+                    "Not calling {} after {} failures in a row".format(
+                        self.host, breaker.failures))
+
+            attempt += 1
+            retry_after = None
+            logger.debug("%s %s/%s", method, self.host, path)
+            kwargs = self._connection_kwargs()
+            if content_type:
+                kwargs['headers']['Content-Type'] = content_type
+
+            start = time.monotonic()
+            try:
+                response, response_body = self._pool.request(
+                    method=method,
+                    path=path,
+                    body=body,
+                    timeouts=(policy.connect_timeout, policy.read_timeout),
+                    **kwargs)
+            except (http.client.HTTPException, OSError) as err:
+                _record_request(method, 'error', start)
+                error = err
+            else:
+                _record_request(method, response.status, start)
+                if response.status not in RETRY_STATUSES:
+                    # Even a rejected request shows the server is up
+                    breaker.record_success()
+                    if not 200 <= response.status < 300:
+                        raise APIError(
+                            "{} {} failed with status {}: {}".format(
+                                method, path, response.status,
+                                _status_message(response_body)))
+                    return json.loads(response_body)
+
+                error = "status {}".format(response.status)
+                retry_after = _parse_retry_after(
+                    response.getheader('Retry-After'))
+
+            breaker.record_failure()
 
-        ssl_context = ssl.SSLContext()
-        ssl_context.load_verify_locations(
-            '/var/run/secrets/kubernetes.io/serviceaccount/ca.crt')
+            delay = policy.backoff(attempt) if retry_after is None \
+                else retry_after
+            if attempt >= policy.max_attempts or \
+                    policy.clock() + delay > deadline:
+                raise APIError("{} {} failed after {} attempts: {}".format(
+                    method, path, attempt, error))
 
-        headers = {
-            'Authorization': 'Bearer {}'.format(kube_token)
+            logger.debug("%s %s failed (%s). Retrying in %.2fs",
+                         method, path, error, delay)
+            policy.sleep(delay)
+
+    def _connection_kwargs(self):
+        credentials = _get_credentials(self.token_path, self.ca_path)
+
+        return {
+            'host': self.host,
+            'port': self.port,
+            'ssl_context': credentials.ssl_context,
+            'headers': {
+                'Authorization': 'Bearer {}'.format(credentials.token)
+            },
         }
 
-        host = 'kubernetes.default.svc'
-        conn = http.client.HTTPSConnection(host, context=ssl_context)
-        logger.debug("{} {}/{}".format(method, host, path))
-        conn.request(method=method, url=path, headers=headers)
 
-        return json.loads(conn.getresponse().read())
+class APIError(Exception):
+    pass
+
+
+class CircuitOpenError(APIError):
+    pass
+
+
+class RetryPolicy:
+    """
+    Governs how long a single API call may take and how it is retried.
+
+    connect_timeout bounds establishing a connection, TLS handshake
+    included, and read_timeout every read from it. A call is attempted at
+    most max_attempts times, with the backoff in between growing
+    exponentially from base_delay up to max_delay. The backoff is drawn at
+    random from that range ("full jitter") so that units that failed at
+    the same time do not all retry at the same time. A Retry-After header
+    sent by the server is used as is instead. No retry is started that
+    would end past deadline seconds from the first attempt.
+
+    After failure_threshold failed attempts in a row, the circuit breaker
+    for the server opens and calls fail right away until reset_timeout
+    seconds have passed.
+
+    clock and sleep are only meant to be replaced in tests.
+    """
+
+    def __init__(self,
+                 connect_timeout=5,
+                 read_timeout=30,
+                 deadline=60,
+                 max_attempts=6,
+                 base_delay=0.5,
+                 max_delay=10,
+                 failure_threshold=5,
+                 reset_timeout=30,
+                 clock=time.monotonic,
+                 sleep=time.sleep):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.sleep = sleep
+
+    def backoff(self, attempt):
+        """
+        Returns how long to wait after the given failed attempt, counting
+        from 1.
+        """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failures against a server. Once there are
+    failure_threshold of them, allow() returns False until reset_timeout
+    seconds have passed. After that, calls are let through again; the
+    first success closes the circuit and the first failure opens it again.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, clock):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._clock = clock
+        self._opened_at = None
+
+    def allow(self):
+        return self._opened_at is None or \
+            self._clock() - self._opened_at >= self.reset_timeout
+
+    def record_success(self):
+        self.failures = 0
+        self._opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self._opened_at is None or self.allow():
+                logger.warning("Opening the circuit breaker after %s "
+                               "failures in a row", self.failures)
+            self._opened_at = self._clock()
+
+
+class ConnectionPool:
+    """
+    Keeps one keep-alive HTTPS connection per API server endpoint for the
+    lifetime of the process. A pooled connection that the server has since
+    closed is transparently replaced with a fresh one.
+    """
+
+    def __init__(self):
+        self._connections = {}
+
+    def close(self):
+        for conn, _ in self._connections.values():
+            conn.close()
+        self._connections.clear()
+
+    def request(self, host, port, ssl_context, method, path, headers,
+                body=None, timeouts=None):
+        """
+        Returns the response along with its body, which has already been
+        read. timeouts is a (connect_timeout, read_timeout) pair.
+        """
+        key = (host, port)
+        conn, response = self._open(key, ssl_context, timeouts, method, path,
+                                    headers, body)
+
+        try:
+            body = response.read()
+        except Exception:
+            conn.close()
+            raise
+
+        self._release(key, conn, ssl_context, response)
+        return response, body
+
+    def _checkout(self, key, ssl_context, timeouts):
+        connect_timeout, read_timeout = timeouts or (None, None)
+        conn, conn_context = self._connections.pop(key, (None, None))
+
+        if conn is not None and conn_context is ssl_context:
+            conn.set_read_timeout(read_timeout)
+            return conn, True
+
+        if conn is not None:
+            conn.close()
+
+        host, port = key
+        return _HTTPSConnection(host, port,
+                                context=ssl_context,
+                                connect_timeout=connect_timeout,
+                                read_timeout=read_timeout), False
+
+    def _open(self, key, ssl_context, timeouts, method, path, headers,
+              body=None):
+        conn, is_reused = self._checkout(key, ssl_context, timeouts)
+
+        try:
+            conn.request(method=method, url=path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except (http.client.RemoteDisconnected,
+                http.client.CannotSendRequest,
+                ConnectionResetError,
+                BrokenPipeError):
+            conn.close()
+            if not is_reused:
+                raise
+        except Exception:
+            conn.close()
+            raise
+
+        # The server closed the idle connection since we last used it.
+        # This is expected with keep-alive so we retry once on a new one.
+        logger.debug("Pooled connection to %s was closed by the server. "
+                     "Reconnecting", key[0])
+        conn, _ = self._checkout(key, ssl_context, timeouts)
+
+        try:
+            conn.request(method=method, url=path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def _release(self, key, conn, ssl_context, response):
+        if response.will_close:
+            conn.close()
+        else:
+            self._connections[key] = (conn, ssl_context)
+
+
+class _HTTPSConnection(http.client.HTTPSConnection):
+    """
+    An HTTPSConnection that applies separate timeouts to establishing the
+    connection, TLS handshake included, and to every read from it.
+    """
+
+    def __init__(self, host, port, context, connect_timeout, read_timeout):
+        super().__init__(host, port, context=context, timeout=connect_timeout)
+        self.read_timeout = read_timeout
+
+    def connect(self):
+        super().connect()
+        self.sock.settimeout(self.read_timeout)
+
+    def set_read_timeout(self, read_timeout):
+        self.read_timeout = read_timeout
+        if self.sock is not None:
+            self.sock.settimeout(read_timeout)
+
+
+class ServiceAccountCredentials:
+    """
+    Holds the service account token and the SSL context built from its CA
+    certificate. Both are only re-read from disk when the mtime of their
+    underlying file changes, which is how the kubelet signals a rotation.
+    """
+
+    def __init__(self, token_path, ca_path):
+        self.token_path = token_path
+        self.ca_path = ca_path
+        self.token = None
+        self.ssl_context = None
+        self._token_mtime = None
+        self._ca_mtime = None
+
+    def refresh(self):
+        token_mtime = _get_mtime(self.token_path)
+        if token_mtime is None or token_mtime != self._token_mtime:
+            with open(self.token_path) as token_file:
+                self.token = token_file.read()
+            self._token_mtime = token_mtime
+
+        ca_mtime = _get_mtime(self.ca_path)
+        if ca_mtime is None or ca_mtime != self._ca_mtime:
+            ssl_context = ssl.create_default_context(cafile=self.ca_path)
+            self.ssl_context = ssl_context
+            self._ca_mtime = ca_mtime
+
+        return self
 
 
 class PodStatus:
@@ -85,3 +530,76 @@ class PodStatus:
     @property
     def is_unknown(self):
         return not self._status
+
+
+# MODULE STATE
+# Shared by all APIServer instances so that connections and credentials
+# survive across calls for the lifetime of the hook process.
+
+_pool = ConnectionPool()
+_credentials = {}
+_breakers = {}
+
+
+def _get_breaker(host, port, retry_policy):
+    key = (host, port)
+    if key not in _breakers:
+        _breakers[key] = CircuitBreaker(
+            failure_threshold=retry_policy.failure_threshold,
+            reset_timeout=retry_policy.reset_timeout,
+            clock=retry_policy.clock)
+    return _breakers[key]
+
+
+def _get_credentials(token_path, ca_path):
+    key = (token_path, ca_path)
+    if key not in _credentials:
+        _credentials[key] = ServiceAccountCredentials(token_path, ca_path)
+    return _credentials[key].refresh()
+
+
+def _get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        # A missing file is never cached so that the subsequent open()
+        # surfaces the real error to the caller.
+        return None
+
+
+def _status_message(response_body):
+    # Errors come as a Status object, unless a proxy answered instead
+    try:
+        return json.loads(response_body).get('message')
+    except (ValueError, AttributeError):
+        return None
+
+
+def _parse_retry_after(value):
+    """
+    Returns the number of seconds to wait as per a Retry-After header,
+    which holds either that number or an HTTP date, or None if the header
+    is missing or malformed.
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0, int(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        retry_at = None
+    if retry_at is None:
+        return None
+    return max(0, retry_at.timestamp() - time.time())
+
+
+def _record_request(method, code, start):
+    metrics.observe('k8s_request_duration_seconds',
+                    time.monotonic() - start,
+                    method=method)
+    metrics.inc('k8s_requests_total', method=method, code=code)
@@ -0,0 +1,159 @@
+from contextlib import contextmanager
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger()
+
+PREFIX = 'alertmanager_charm_'
+
+# Every metric the charm exposes, with its Prometheus type and help text.
+# Summaries are exposed as a _sum and a _count sample.
+METRICS = {
+    'handler_duration_seconds': (
+        'summary', 'Time spent in each event handler.'),
+    'k8s_request_duration_seconds': (
+        'summary', 'Latency of requests to the Kubernetes API server.'),
+    'k8s_requests_total': (
+        'counter', 'Requests to the Kubernetes API server by status code.'),
+    'config_render_duration_seconds': (
+        'summary', 'Time spent building the AlertManager config file.'),
+    'pod_readiness_wait_seconds': (
+        'gauge', 'How long the pod last took to become ready after its '
+                 'spec was set.'),
+    'pod_spec_writes_total': (
+        'counter', 'Number of times the pod spec was set.'),
+}
+
+_SAMPLE_RE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def inc(name, value=1, **labels):
+    _add(name, labels, value)
+
+
+def observe(name, value, **labels):
+    _add(name + '_sum', labels, value)
+    _add(name + '_count', labels, 1)
+
+
+def set_gauge(name, value, **labels):
+    _samples[(name, _label_key(labels))] = value
+
+
+@contextmanager
+def timed(name, **labels):
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - start, **labels)
+
+
+def flush(path):
+    '''
+    Adds the samples recorded by this process to those already in the
+    textfile at path and atomically replaces it, so that a scraper never
+    sees a partially written file. Samples are only kept in memory until
+    then since every hook runs in a new process.
+    '''
+    samples = _read_samples(path)
+    for (name, label_key), value in _samples.items():
+        if _metric_type(name) == 'gauge':
+            samples[(name, label_key)] = value
+        else:
+            samples[(name, label_key)] = \
+                samples.get((name, label_key), 0) + value
+
+    tmp_path = path.with_name('.{}.tmp'.format(path.name))
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_text(_render(samples))
+        os.replace(str(tmp_path), str(path))
+    except OSError as err:
+        logger.warning("Could not write metrics to %s: %s", path, err)
+        return
+
+    _samples.clear()
+
+
+def _add(name, labels, value):
+    key = (name, _label_key(labels))
+    _samples[key] = _samples.get(key, 0) + value
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _metric_type(sample_name):
+    for suffix in ('_sum', '_count'):
+        if sample_name.endswith(suffix) and \
+                sample_name[:-len(suffix)] in METRICS:
+            return METRICS[sample_name[:-len(suffix)]][0]
+    return METRICS[sample_name][0]
+
+
+def _read_samples(path):
+    try:
+        text = path.read_text()
+    except OSError:
+        return {}
+
+    samples = {}
+    for line in text.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if not match:
+            continue
+        full_name, labels, value = match.groups()
+        name = full_name[len(PREFIX):]
+        try:
+            _metric_type(name)
+        except KeyError:
+            # A metric that is no longer exposed
+            continue
+        label_key = tuple(sorted(
+            (key, _unescape(value))
+            for key, value in _LABEL_RE.findall(labels or '')))
+        samples[(name, label_key)] = float(value)
+    return samples
+
+
+def _render(samples):
+    lines = []
+    for metric_name, (metric_type, help_text) in sorted(METRICS.items()):
+        lines.append('# HELP {}{} {}'.format(PREFIX, metric_name, help_text))
+        lines.append('# TYPE {}{} {}'.format(PREFIX, metric_name,
+                                             metric_type))
+        sample_names = [metric_name + '_sum', metric_name + '_count'] \
+            if metric_type == 'summary' else [metric_name]
+        for (name, label_key), value in sorted(samples.items()):
+            if name not in sample_names:
+                continue
+            labels = ','.join('{}="{}"'.format(key, _escape(value))
+                              for key, value in label_key)
+            lines.append('{}{}{} {}'.format(
+                PREFIX, name, '{' + labels + '}' if labels else '',
+                repr(float(value))))
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _unescape(value):
+    return re.sub(r'\\(.)',
+                  lambda match: '\n' if match.group(1) == 'n'
+                  else match.group(1),
+                  value)
+
+
+# MODULE STATE
+# Samples recorded by this process and not yet flushed, keyed by
+# (sample_name, ((label, value), ...)).
+
+_samples = {}
@@ -0,0 +1,109 @@
+import cProfile
+from datetime import datetime
+import functools
+import io
+import logging
+import os
+import pstats
+
+logger = logging.getLogger()
+
+# Profiles are written here, relative to the charm dir
+PROFILE_DIR = '.hook-profiles'
+PROFILE_SUFFIX = '.pstats'
+# Only this many of the most recent profiles are kept around
+MAX_PROFILES = 20
+# Number of functions listed in the summary written to the unit log
+SUMMARY_LINES = 15
+
+# Whether a handler is being profiled right now. Only one profiler can be
+# active at a time.
+_active = False
+
+
+class HookProfiler:
+    '''
+    Runs event handlers under cProfile. Each run is written to its own
+    .pstats file under directory and a summary of the functions with the
+    highest cumulative time is logged.
+
+    When not enabled, wrap() returns the handler unchanged so that
+    profiling costs nothing unless it is asked for.
+    '''
+
+    def __init__(self, directory, enabled=False, max_profiles=MAX_PROFILES,
+                 summary_lines=SUMMARY_LINES):
+        self.directory = directory
+        self.enabled = enabled
+        self.max_profiles = max_profiles
+        self.summary_lines = summary_lines
+
+    def wrap(self, handler):
+        if not self.enabled:
+            return handler
+
+        @functools.wraps(handler)
+        def profiled_handler(event):
+            global _active
+            if _active:
+                # A handler that emits an event runs that event's handlers
+                # itself, so they are already part of its profile.
+                return handler(event)
+
+            profile = cProfile.Profile()
+            _active = True
+            try:
+                return profile.runcall(handler, event)
+            finally:
+                _active = False
+                self._save(profile, handler.__name__)
+
+        return profiled_handler
+
+    def latest_profiles(self, count):
+        '''
+        Returns the paths of the count most recent profiles, newest first.
+        '''
+        try:
+            paths = [path for path in self.directory.iterdir()
+                     if path.name.endswith(PROFILE_SUFFIX)]
+        except OSError:
+            return []
+        # The names start with a timestamp so they sort chronologically
+        return sorted(paths, key=lambda path: path.name, reverse=True)[:count]
+
+    def summarize(self, path):
+        output = io.StringIO()
+        stats = pstats.Stats(str(path), stream=output)
+        stats.sort_stats('cumulative').print_stats(self.summary_lines)
+        return output.getvalue()
+
+    def _save(self, profile, handler_name):
+        dispatch_name = os.environ.get('JUJU_HOOK_NAME') \
+            or os.environ.get('JUJU_ACTION_NAME') \
+            or 'unknown'
+        # A handler can run more than once in the same dispatch, e.g. when
+        # deferred events are emitted again, hence the microseconds.
+        timestamp = datetime.now().strftime('%Y%m%dT%H%M%S.%f')
+        name = '{}-{}-{}{}'.format(timestamp,
+                                   dispatch_name,
+                                   handler_name,
+                                   PROFILE_SUFFIX)
+        path = self.directory / name
+
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            profile.dump_stats(str(path))
+            self._prune()
+            summary = self.summarize(path)
+        except (OSError, TypeError, ValueError) as err:
+            # pstats raises TypeError for a profile that collected nothing
+            logger.warning("Could not write hook profile %s: %s", path, err)
+            return
+
+        logger.info("Profile of %s written to %s\n%s",
+                    handler_name, path, summary)
+
+    def _prune(self):
+        for path in self.latest_profiles(count=None)[self.max_profiles:]:
+            path.unlink()
@@ -1,4 +1,7 @@
 #!/usr/bin/env python3
+from base64 import b64encode
+import functools
+import importlib.util
 import logging
 
 logger = logging.getLogger()
@@ -9,24 +12,65 @@ sys.path.append('lib')
 
 from ops.charm import (
     CharmBase,
+    CharmEvents,
+)
+from ops.framework import (
+    EventBase,
+    EventSource,
+    StoredState,
 )
 from ops.main import main
 from ops.model import (
     ActiveStatus,
+    BlockedStatus,
     MaintenanceStatus,
 )
 
 from adapters.framework import FrameworkAdapter
-from domain import (
-    build_alertmanager_config,
-    build_juju_pod_spec,
-    build_juju_unit_status,
-    PrometheusAlertingConfig,
-)
-from adapters import k8s
 from interface_prometheus import PrometheusInterface
 
 
+def _lazy_import(name):
+    '''
+    Returns the named module without executing it. It is only loaded once
+    one of its attributes is first accessed, so that hooks which never use
+    it, such as stop, don't pay for importing it.
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+
+    parent_name, _, child_name = name.rpartition('.')
+    if parent_name:
+        setattr(sys.modules[parent_name], child_name, module)
+    return module
+
+
+# These pull in yaml rendering, ssl and http.client between them and are
+# only needed by some of the hooks.
+alertmanager = _lazy_import('adapters.alertmanager')
+cache = _lazy_import('adapters.cache')
+domain = _lazy_import('domain')
+http_client = _lazy_import('http.client')
+k8s = _lazy_import('adapters.k8s')
+metrics = _lazy_import('adapters.metrics')
+profiler = _lazy_import('adapters.profiler')
+
+# How long to keep asking AlertManager replicas to reload their config
+# before giving up and updating the pod spec instead. This needs to cover
+# the kubelet's sync period plus its ConfigMap cache TTL.
+CONFIG_RELOAD_TIMEOUT = 120
+# Rendered AlertManager configs are cached here, relative to the charm dir
+CONFIG_CACHE_DIR = '.alertmanager-config-cache'
+# The peer relation that every unit of this app joins
+CLUSTER_RELATION_NAME = 'cluster'
+
+
 # CHARM
 
 # This charm class mainly does self-configuration via its initializer and
@@ -34,16 +78,56 @@ from interface_prometheus import PrometheusInterface
 # of which is further discussed below (just before the delegator definitions)
 
 
+class CheckPodReadinessEvent(EventBase):
+    '''
+    Emitted once the pod spec is set. It is deferred, and therefore emitted
+    again at the start of every following hook, until the pod is ready.
+    started_at is the time it was first emitted.
+    '''
+
+    def __init__(self, handle, started_at=None):
+        super().__init__(handle)
+        self.started_at = started_at
+
+    def snapshot(self):
+        return {'started_at': self.started_at}
+
+    def restore(self, snapshot):
+        self.started_at = snapshot['started_at']
+
+
+class AlertManagerCharmEvents(CharmEvents):
+    check_pod_readiness = EventSource(CheckPodReadinessEvent)
+
+
 class Charm(CharmBase):
+    on = AlertManagerCharmEvents()
+    state = StoredState()
 
     def __init__(self, *args):
         super().__init__(*args)
 
+        self.state.set_default(pod_spec_hash=None,
+                               pod_layout_hash=None,
+                               readiness_check_pending=False,
+                               config_reload_hash=None,
+                               config_reload_deadline=None,
+                               config_errors={})
+
         # Abstract out framework and friends so that this object is not
         # too tightly coupled with the underlying framework's implementation.
         # From this point forward, our Charm object will only interact with the
         # adapter and not directly with the framework.
-        self.fw_adapter = FrameworkAdapter(self.framework)
+        self.fw_adapter = FrameworkAdapter(self.framework, memoize=True)
+
+        # Several of the events below need the pod spec updated, and more
+        # than one of them can be emitted in the same dispatch, e.g. when
+        # deferred events are re-emitted. They only mark it as dirty and
+        # the actual work is done once, right before the framework commits.
+        self.pod_spec_reconciler = PodSpecReconciler(
+            self.fw_adapter,
+            self.state,
+            self.on.check_pod_readiness)
 
         self.prom_relation_name = 'prometheus'
         self.prom_interface = \
@@ -53,12 +137,35 @@ class Charm(CharmBase):
         event_handler_bindings = {
             self.on.start: self.on_start,
             self.on.config_changed: self.on_config_changed,
+            self.on.update_status: self.on_update_status,
+            self.on.check_pod_readiness: self.on_check_pod_readiness,
             self.on.upgrade_charm: self.on_upgrade,
             self.on.stop: self.on_stop,
-            self.prom_interface.on.new_prom_rel: self.on_new_prom_rel
+            self.prom_interface.on.new_prom_rel: self.on_new_prom_rel,
+            self.on[CLUSTER_RELATION_NAME].relation_joined:
+                self.on_cluster_changed,
+            self.on[CLUSTER_RELATION_NAME].relation_departed:
+                self.on_cluster_changed,
+            self.framework.on.pre_commit: self.on_pre_commit,
+            self.on.get_profiles_action: self.on_get_profiles_action,
         }
         for event, handler in event_handler_bindings.items():
             self.fw_adapter.observe(event, handler)
+        # Metrics are written last, once every other handler has run
+        self.fw_adapter.observe(self.framework.on.commit, self.on_commit)
+
+        # The framework looks handlers up by name each time it emits an
+        # event, so shadowing them on this instance is enough to time and
+        # profile them. Unless profiling is on, its module is not even
+        # loaded so that it costs nothing.
+        profile_hooks = self.fw_adapter.get_config().get('profile-hooks')
+        if profile_hooks:
+            hook_profiler = build_hook_profiler(self.fw_adapter, enabled=True)
+        for handler in set(event_handler_bindings.values()):
+            wrapped_handler = time_handler(handler)
+            if profile_hooks:
+                wrapped_handler = hook_profiler.wrap(wrapped_handler)
+            setattr(self, handler.__name__, wrapped_handler)
 
     # DELEGATORS
 
@@ -71,22 +178,90 @@ class Charm(CharmBase):
     # mocks. These tests tend to be hard to follow. To counter that, the
     # logic is moved away from this class.
 
+    def on_cluster_changed(self, event):
+        on_cluster_changed_handler(event,
+                                   self.pod_spec_reconciler,
+                                   self.fw_adapter,
+                                   self.state,
+                                   self.prom_relation_name)
+
+    def on_check_pod_readiness(self, event):
+        on_check_pod_readiness_handler(event,
+                                       self.pod_spec_reconciler,
+                                       self.fw_adapter,
+                                       self.state)
+
+    def on_commit(self, event):
+        on_commit_handler(event, self.fw_adapter)
+
     def on_config_changed(self, event):
-        on_config_changed_handler(event, self.fw_adapter)
+        on_config_changed_handler(event,
+                                  self.pod_spec_reconciler,
+                                  self.fw_adapter,
+                                  self.state,
+                                  self.prom_relation_name)
+
+    def on_get_profiles_action(self, event):
+        on_get_profiles_action_handler(event, self.fw_adapter)
 
     def on_new_prom_rel(self, event):
         on_new_prom_rel_handler(event,
+                                self.pod_spec_reconciler,
                                 self.fw_adapter,
+                                self.state,
                                 self.prom_relation_name)
 
+    def on_pre_commit(self, event):
+        on_pre_commit_handler(event, self.pod_spec_reconciler)
+
     def on_start(self, event):
-        on_start_handler(event, self.fw_adapter)
+        on_start_handler(event, self.pod_spec_reconciler)
 
     def on_stop(self, event):
         on_stop_handler(event, self.fw_adapter)
 
+    def on_update_status(self, event):
+        on_update_status_handler(event, self.fw_adapter, self.state)
+
     def on_upgrade(self, event):
-        on_upgrade_handler(event, self.fw_adapter)
+        on_upgrade_handler(event, self.pod_spec_reconciler)
+
+
+class PodSpecReconciler:
+    '''
+    Coalesces any number of requests to update the pod spec into a single
+    update, done when reconcile() is called.
+    '''
+
+    def __init__(self, fw_adapter, state, check_pod_readiness):
+        self.fw_adapter = fw_adapter
+        self.state = state
+        self.check_pod_readiness = check_pod_readiness
+        self.is_dirty = False
+
+    def mark_dirty(self):
+        self.is_dirty = True
+
+    def reconcile(self):
+        if not self.is_dirty:
+            return
+        self.is_dirty = False
+
+        # Rather than wait for the pod here, which would hold up every other
+        # queued event, its readiness is checked once now and then again on
+        # every following hook until it is ready.
+        if set_juju_pod_spec(self.fw_adapter, self.state):
+            self.check_readiness()
+
+    def check_readiness(self):
+        '''
+        Emits check_pod_readiness unless one is still pending. A pending
+        check is deferred and so already runs again on every hook.
+        '''
+        if self.state.readiness_check_pending:
+            return
+        self.state.readiness_check_pending = True
+        self.check_pod_readiness.emit(time.time())
 
 
 # EVENT HANDLERS
@@ -97,86 +272,394 @@ class Charm(CharmBase):
 # similar to controllers in an MVC app in that they are only concerned with
 # coordinating domain models and services.
 
-def on_config_changed_handler(event, fw_adapter):
-    set_juju_pod_spec(fw_adapter)
-    juju_model = fw_adapter.get_model_name()
-    juju_app = fw_adapter.get_app_name()
-    juju_unit = fw_adapter.get_unit_name()
+def on_cluster_changed_handler(event, pod_spec_reconciler, fw_adapter, state,
+                               prom_relation_name):
+    # The cluster flags in the pod spec depend on the number of units and
+    # so do the static targets published to Prometheus.
+    pod_spec_reconciler.mark_dirty()
+    if fw_adapter.get_config().get('prometheus-discovery') == \
+            domain.DISCOVERY_STATIC:
+        publish_alerting_config(pod_spec_reconciler,
+                                fw_adapter,
+                                state,
+                                fw_adapter.get_relations(prom_relation_name))
+
+
+def on_check_pod_readiness_handler(event, pod_spec_reconciler, fw_adapter,
+                                   state):
+    if not check_config_reload(pod_spec_reconciler, fw_adapter, state):
+        logging.debug("Config is not reloaded yet, trying again next hook")
+        event.defer()
+        return
+
+    if not check_unit_status(fw_adapter, state):
+        logging.debug("Pod is not ready yet, checking again next hook")
+        event.defer()
+        return
+
+    state.readiness_check_pending = False
 
-    pod_is_ready = False
+    if event.started_at is not None:
+        metrics.set_gauge('pod_readiness_wait_seconds',
+                          time.time() - event.started_at)
 
-    while not pod_is_ready:
-        logging.debug("Checking k8s pod readiness")
 
-        k8s_pod_status = k8s.get_pod_status(juju_model=juju_model,
-                                            juju_app=juju_app,
-                                            juju_unit=juju_unit)
-        logging.debug("Received k8s pod status: {0}".format(k8s_pod_status))
+def on_commit_handler(event, fw_adapter):
+    # Relative to the charm dir unless absolute
+    textfile = fw_adapter.get_config().get('metrics-textfile')
+    if textfile:
+        metrics.flush(fw_adapter.get_charm_dir() / textfile)
 
-        juju_unit_status = build_juju_unit_status(k8s_pod_status)
-        logging.debug("Built unit status: {0}".format(juju_unit_status))
 
-        fw_adapter.set_unit_status(juju_unit_status)
-        pod_is_ready = isinstance(juju_unit_status, ActiveStatus)
-        time.sleep(1)
+def on_config_changed_handler(event, pod_spec_reconciler, fw_adapter, state,
+                              prom_relation_name):
+    pod_spec_reconciler.mark_dirty()
+    # In case prometheus-discovery changed. Relations whose data is already
+    # up to date are not written to.
+    publish_alerting_config(pod_spec_reconciler,
+                            fw_adapter,
+                            state,
+                            fw_adapter.get_relations(prom_relation_name))
 
 
-def on_new_prom_rel_handler(event, fw_adapter, relation_name):
+def on_get_profiles_action_handler(event, fw_adapter):
+    hook_profiler = build_hook_profiler(fw_adapter)
+    paths = hook_profiler.latest_profiles(event.params['count'])
+    if not paths:
+        event.fail("No hook profiles found. Set profile-hooks to true "
+                   "and run some hooks first")
+        return
+
+    results = {}
+    for index, path in enumerate(paths, start=1):
+        results['profile-{}'.format(index)] = {
+            'name': path.name,
+            'summary': hook_profiler.summarize(path),
+            # Decode with base64 -d and load with pstats
+            'pstats': b64encode(path.read_bytes()).decode('ascii'),
+        }
+    event.set_results(results)
+
+
+def on_new_prom_rel_handler(event, pod_spec_reconciler, fw_adapter, state,
+                            relation_name):
     logger.debug("on_new_prom_rel_handler")
-    juju_model = fw_adapter.get_model_name()
-    juju_app = fw_adapter.get_app_name()
-    label_selector = 'juju-app={}'.format(juju_app)
+    if event.relation_id is None:
+        relations = fw_adapter.get_relations(relation_name)
+    else:
+        relations = [fw_adapter.get_relation(relation_name,
+                                             event.relation_id)]
+    publish_alerting_config(pod_spec_reconciler, fw_adapter, state, relations)
 
-    alerting_config = PrometheusAlertingConfig(
-        namespace=juju_model,
-        label_selector=label_selector
-    )
 
-    logger.debug("Built alerting_config: {}".format(alerting_config))
+def on_pre_commit_handler(event, pod_spec_reconciler):
+    pod_spec_reconciler.reconcile()
 
-    for relation in fw_adapter.get_relations(relation_name):
-        logger.debug("Setting alerting_config for {}".format(relation))
-        relation.data[fw_adapter.get_unit()].update({
-            'alerting_config': alerting_config.to_json()
-        })
 
+def on_start_handler(event, pod_spec_reconciler):
+    pod_spec_reconciler.mark_dirty()
 
-def on_start_handler(event, fw_adapter):
-    set_juju_pod_spec(fw_adapter)
 
+def on_update_status_handler(event, fw_adapter, state):
+    check_unit_status(fw_adapter, state)
 
-def on_upgrade_handler(event, fw_adapter):
-    on_start_handler(event, fw_adapter)
+
+def on_upgrade_handler(event, pod_spec_reconciler):
+    on_start_handler(event, pod_spec_reconciler)
 
 
 def on_stop_handler(event, fw_adapter):
     fw_adapter.set_unit_status(MaintenanceStatus("Pod is terminating"))
 
 
-def set_juju_pod_spec(fw_adapter):
+def publish_alerting_config(pod_spec_reconciler, fw_adapter, state,
+                            relations):
+    # Without any relation, nothing is built from the config and so it
+    # cannot be what keeps the unit blocked either.
+    if relations:
+        try:
+            alerting_config = domain.build_prometheus_alerting_config(
+                app_name=fw_adapter.get_app_name(),
+                namespace=fw_adapter.get_model_name(),
+                charm_config=fw_adapter.get_config(),
+                unit_count=get_unit_count(fw_adapter))
+        except domain.InvalidConfigError as err:
+            block_unit(fw_adapter, state, 'alerting-config', err)
+            return
+
+        # Serialized once for all relations
+        relation_data = {'alerting_config': alerting_config.to_json()}
+        logger.debug("Built alerting_config: %s", relation_data)
+
+        updated = [relation for relation in relations
+                   if fw_adapter.set_relation_data(relation, relation_data)]
+        logger.debug("Updated alerting_config on %s of %s relations",
+                     len(updated), len(relations))
+
+    if unblock_unit(fw_adapter, state, 'alerting-config'):
+        pod_spec_reconciler.check_readiness()
+
+
+def set_juju_pod_spec(fw_adapter, state):
+    '''
+    Returns False only if this unit is the leader and either the pod spec it
+    built is identical to the one it last set, in which case the write is
+    skipped so as not to needlessly re-roll the pod, or the charm config is
+    invalid. An unchanged pod spec still returns True if the config was
+    just fixed, so that the unit gets its status back. Non-leaders cannot
+    tell, so they always return True.
+    '''
     if not fw_adapter.am_i_leader():
         logging.debug("Unit is not a leader, skip pod spec configuration")
-        return
+        # Another leader may set a different pod spec in the meantime so,
+        # should this unit be elected again, it must not take what it set
+        # before for what Juju is running.
+        state.pod_spec_hash = None
+        state.pod_layout_hash = None
+        state.config_reload_hash = None
+        unblock_unit(fw_adapter, state, 'pod-spec')
+        return True
 
     charm_config = fw_adapter.get_config()
 
-    logging.debug("Building AlertManager config file")
-    alertmanager_config = build_alertmanager_config(
-        base64_config_yaml=charm_config["alertmanager-config"],
-        base64_secrets_yaml=charm_config["alertmanager-secrets"]
-    )
-
-    logging.debug("Building Juju pod spec")
-    juju_pod_spec = build_juju_pod_spec(
-        app_name=fw_adapter.get_app_name(),
-        charm_config=charm_config,
-        image_meta=fw_adapter.get_image_meta('alertmanager-image'),
-        alertmanager_config=alertmanager_config
-    )
+    try:
+        logging.debug("Building AlertManager config file")
+        with metrics.timed('config_render_duration_seconds'):
+            alertmanager_config = domain.build_alertmanager_config(
+                base64_config_yaml=charm_config["alertmanager-config"],
+                base64_secrets_yaml=charm_config["alertmanager-secrets"],
+                cache=cache.RenderCache(
+                    fw_adapter.get_charm_dir() / CONFIG_CACHE_DIR),
+                secrets_merge_mode=charm_config["alertmanager-secrets-merge"]
+            )
+
+        logging.debug("Building Juju pod spec")
+        juju_pod_spec = domain.build_juju_pod_spec(
+            app_name=fw_adapter.get_app_name(),
+            charm_config=charm_config,
+            image_meta=fw_adapter.get_image_meta('alertmanager-image'),
+            alertmanager_config=alertmanager_config,
+            unit_count=get_unit_count(fw_adapter)
+        )
+    except domain.InvalidConfigError as err:
+        # Leave the running pods alone until the config is fixed
+        block_unit(fw_adapter, state, 'pod-spec', err)
+        return False
+
+    is_unblocked = unblock_unit(fw_adapter, state, 'pod-spec')
+
+    pod_spec_hash = juju_pod_spec.content_hash()
+    if pod_spec_hash == state.pod_spec_hash:
+        logging.debug("Pod spec is unchanged, skip pod configuration")
+        return is_unblocked
+
+    pod_layout_hash = juju_pod_spec.layout_hash()
+    if pod_layout_hash == state.pod_layout_hash:
+        logging.debug("Only the AlertManager config changed. Reloading it")
+        if deliver_alertmanager_config(fw_adapter, juju_pod_spec):
+            # The replicas are asked to reload it by the readiness check
+            fw_adapter.set_unit_status(
+                MaintenanceStatus("Reloading AlertManager config"))
+            # Juju still holds the pod spec with the previous file and
+            # writes it back to the ConfigMap whenever it re-applies it,
+            # e.g. on scaling. Not recording this pod spec as set makes the
+            # next reconcile deliver the file again, or set the whole pod
+            # spec if the layout changed by then.
+            state.pod_spec_hash = None
+            state.config_reload_hash = alertmanager.config_hash(
+                juju_pod_spec.config_file_content)
+            state.config_reload_deadline = time.time() + CONFIG_RELOAD_TIMEOUT
+            return True
+
+        logging.warning("Could not deliver the AlertManager config. "
+                        "Falling back to a pod spec update")
 
     logging.debug("Configuring pod")
     fw_adapter.set_pod_spec(juju_pod_spec.to_dict())
+    metrics.inc('pod_spec_writes_total')
     fw_adapter.set_unit_status(MaintenanceStatus("Configuring pod"))
+    state.pod_spec_hash = pod_spec_hash
+    state.pod_layout_hash = pod_layout_hash
+    # The new pods start with the new config anyway
+    state.config_reload_hash = None
+    return True
+
+
+def block_unit(fw_adapter, state, source, err):
+    '''
+    Blocks the unit until the part of the charm config that source is
+    built from is fixed. The running pods are left as they are.
+    '''
+    logging.error("Invalid config: %s", err)
+    state.config_errors[source] = str(err)
+    fw_adapter.set_unit_status(BlockedStatus(str(err)))
+
+
+def unblock_unit(fw_adapter, state, source):
+    '''
+    Forgets about the invalid config that source was built from, if any.
+    Returns True if no other invalid config is left, in which case the pod
+    needs checking for the unit to get its status back.
+    '''
+    if source not in state.config_errors:
+        return False
+
+    del state.config_errors[source]
+    if state.config_errors:
+        fw_adapter.set_unit_status(
+            BlockedStatus(_get_config_error(state)))
+        return False
+
+    fw_adapter.set_unit_status(MaintenanceStatus("Checking pod readiness"))
+    return True
+
+
+def _get_config_error(state):
+    return state.config_errors[min(state.config_errors)]
+
+
+def get_unit_count(fw_adapter):
+    # A peer relation lists every unit of the app except this one
+    return 1 + sum(len(relation.units)
+                   for relation in fw_adapter.get_relations(
+                       CLUSTER_RELATION_NAME))
+
+
+def deliver_alertmanager_config(fw_adapter, juju_pod_spec):
+    '''
+    Replaces the config file mounted into the running pods, which the
+    kubelet propagates to them on its next sync. Returns False if it
+    could not be delivered.
+    '''
+    try:
+        k8s.update_mounted_file(juju_model=fw_adapter.get_model_name(),
+                                juju_app=fw_adapter.get_app_name(),
+                                mount_path=juju_pod_spec.config_mount_path,
+                                file_name=juju_pod_spec.config_file_name,
+                                content=juju_pod_spec.config_file_content)
+    except (k8s.APIError, OSError, ValueError) as err:
+        logging.warning("Could not deliver the config file: %s", err)
+        return False
+
+    return True
+
+
+def check_config_reload(pod_spec_reconciler, fw_adapter, state):
+    '''
+    Has every replica reload the config file delivered by set_juju_pod_spec,
+    which unlike a restart keeps their in-memory state. Returns False while
+    any of them is still running another config. Past the deadline, the
+    pod spec is updated instead.
+    '''
+    if state.config_reload_hash is None:
+        return True
+
+    if reload_alertmanager_config(fw_adapter, state.config_reload_hash):
+        state.config_reload_hash = None
+        return True
+    elif time.time() < state.config_reload_deadline:
+        return False
+
+    logging.warning("Replicas did not reload the config in time. "
+                    "Falling back to a pod spec update")
+    state.config_reload_hash = None
+    state.pod_spec_hash = None
+    state.pod_layout_hash = None
+    pod_spec_reconciler.mark_dirty()
+    return False
+
+
+def reload_alertmanager_config(fw_adapter, config_hash):
+    '''
+    Asks every replica not yet running the config with the given hash to
+    reload it, once. Returns True if all of them are now running it.
+    '''
+    try:
+        hosts = k8s.get_pod_ips(juju_model=fw_adapter.get_model_name(),
+                                juju_app=fw_adapter.get_app_name())
+    except (k8s.APIError, OSError, ValueError) as err:
+        logging.warning("Could not list the replicas: %s", err)
+        return False
+
+    # The kubelet only syncs the mounted file periodically so a replica may
+    # well reload the previous config, in which case it is asked again on
+    # the next hook.
+    pending_hosts = [host for host in hosts
+                     if not _reload_replica(host, config_hash)]
+    if pending_hosts:
+        logging.debug("Replicas %s did not reload the config yet",
+                      pending_hosts)
+    return not pending_hosts
+
+
+def _reload_replica(host, config_hash):
+    api = alertmanager.AlertManagerAPI(host=host)
+
+    try:
+        if _is_running_config(api, config_hash):
+            return True
+
+        return api.reload() and _is_running_config(api, config_hash)
+    except (OSError, http_client.HTTPException, ValueError, KeyError) as err:
+        logging.debug("Could not reload %s: %s", host, err)
+        return False
+
+
+def _is_running_config(api, config_hash):
+    config_metrics = api.get_config_metrics()
+    return config_metrics is not None \
+        and config_metrics.last_reload_successful \
+        and config_metrics.config_hash == config_hash
+
+
+def time_handler(handler):
+    @functools.wraps(handler)
+    def timed_handler(event):
+        with metrics.timed('handler_duration_seconds',
+                           handler=handler.__name__):
+            return handler(event)
+
+    return timed_handler
+
+
+def build_hook_profiler(fw_adapter, enabled=False):
+    return profiler.HookProfiler(
+        fw_adapter.get_charm_dir() / profiler.PROFILE_DIR,
+        enabled=enabled)
+
+
+def check_unit_status(fw_adapter, state):
+    '''
+    Sets the unit status from a single look at the pod. Returns False if
+    the pod is not ready yet and needs checking again later.
+    '''
+    if state.config_errors:
+        # Whatever the pod is up to, only fixing the config can unblock
+        # the unit. Checking the pod again is requested when it is fixed.
+        fw_adapter.set_unit_status(BlockedStatus(_get_config_error(state)))
+        return True
+
+    logging.debug("Checking k8s pod readiness")
+    try:
+        k8s_pod_status = k8s.get_pod_status(
+            juju_model=fw_adapter.get_model_name(),
+            juju_app=fw_adapter.get_app_name(),
+            juju_unit=fw_adapter.get_unit_name())
+    except (k8s.APIError, OSError, ValueError) as err:
+        logging.warning("Could not check k8s pod readiness: %s", err)
+        return False
+
+    return set_juju_unit_status(fw_adapter, k8s_pod_status)
+
+
+def set_juju_unit_status(fw_adapter, k8s_pod_status):
+    logging.debug("Received k8s pod status: %s", k8s_pod_status)
+
+    juju_unit_status = domain.build_juju_unit_status(k8s_pod_status)
+    logging.debug("Built unit status: %s", juju_unit_status)
+
+    fw_adapter.set_unit_status(juju_unit_status)
+    return isinstance(juju_unit_status, ActiveStatus)
 
 
 if __name__ == "__main__":
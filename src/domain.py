@@ -1,8 +1,24 @@
 from base64 import b64decode
-import copy
+from collections import namedtuple
+import hashlib
 import json
 import logging
+import math
+import re
 import yaml
+# libyaml's C implementation is an order of magnitude faster on large
+# configs and produces the same output. Fall back to the pure-Python one
+# if PyYAML was built without it.
+try:
+    from yaml import (
+        CSafeDumper as SafeDumper,
+        CSafeLoader as SafeLoader,
+    )
+except ImportError:
+    from yaml import (
+        SafeDumper,
+        SafeLoader,
+    )
 
 import sys
 sys.path.append('lib')
@@ -14,84 +30,176 @@ from ops.model import (
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_CONFIG_PATH = 'templates/alertmanager-config-default.yml'
+# Bump this whenever a change to this module alters the rendered output of
+# build_alertmanager_config so that previously cached renders are not used.
+CONFIG_RENDER_VERSION = '1'
+
+# How lists in alertmanager-secrets are merged into alertmanager-config
+MERGE_REPLACE = 'replace'
+MERGE_KEYED = 'keyed'
+MERGE_MODES = (MERGE_REPLACE, MERGE_KEYED)
+
+DEFAULT_TUNING_PROFILE = 'default'
+
+# How related Prometheus instances find the AlertManager replicas. Either
+# through their own Kubernetes service discovery or from a static list of
+# addresses published by the charm.
+DISCOVERY_KUBERNETES = 'kubernetes'
+DISCOVERY_STATIC = 'static'
+DISCOVERY_MODES = (DISCOVERY_KUBERNETES, DISCOVERY_STATIC)
+# Versions of the AlertManager API that Prometheus can send alerts to
+ALERTING_API_VERSIONS = ('v1', 'v2')
+
+ADVERTISED_PORT = 9093
+CLUSTER_PORT = 9094
+# The most peers that a replica is told to join the cluster through
+MAX_BOOTSTRAP_PEERS = 3
+
 
 # DOMAIN MODELS
 
+_CONTAINER_ARGS = (
+    '--config.file=/etc/alertmanager/alertmanager.yml',
+    '--storage.path=/alertmanager',
+    '--cluster.listen-address=0.0.0.0:9094',
+)
+
+
 class AlertManagerJujuPodSpec:
 
+    config_mount_path = '/etc/alertmanager'
+    config_file_name = 'alertmanager.yml'
+
     def __init__(self,
                  app_name,
                  image_path,
                  repo_username,
                  repo_password,
                  advertised_port,
-                 alertmanager_config):
-
-        self._spec = {
-            'containers': [{
-                'name': app_name,
-                'imageDetails': {
-                    'imagePath': image_path,
-                    'username': repo_username,
-                    'password': repo_password
+                 alertmanager_config,
+                 cluster_peers=(),
+                 gossip_tuning=None,
+                 tuning_profile=None):
+
+        self._app_name = app_name
+        self._image_path = image_path
+        self._repo_username = repo_username
+        self._repo_password = repo_password
+        self._advertised_port = advertised_port
+        # Rendered once here. Being a str it is immutable, so every dict
+        # returned by to_dict can share it rather than carry its own copy.
+        self._config_file_content = alertmanager_config.yaml_dump()
+
+        cluster_args = ['--cluster.peer={}'.format(peer)
+                        for peer in cluster_peers]
+        if gossip_tuning is not None:
+            cluster_args.extend([
+                '--cluster.gossip-interval={}'.format(
+                    gossip_tuning.gossip_interval),
+                '--cluster.pushpull-interval={}'.format(
+                    gossip_tuning.pushpull_interval),
+                '--cluster.settle-timeout={}'.format(
+                    gossip_tuning.settle_timeout),
+            ])
+        self._args = _CONTAINER_ARGS + tuple(cluster_args)
+
+        if tuning_profile is None:
+            tuning_profile = TUNING_PROFILES[DEFAULT_TUNING_PROFILE]
+        self._tuning_profile = tuning_profile
+        if tuning_profile.data_retention:
+            self._args += ('--data.retention={}'.format(
+                tuning_profile.data_retention),)
+        if tuning_profile.alerts_gc_interval:
+            self._args += ('--alerts.gc-interval={}'.format(
+                tuning_profile.alerts_gc_interval),)
+
+    def to_dict(self):
+        '''
+        Builds a fresh dict on every call so that callers are free to
+        mutate it. Only the containers are new; all the values in them are
+        immutable and shared, which is much cheaper than a deepcopy.
+        '''
+        advertised_port = self._advertised_port
+        tuning = self._tuning_profile
+        container = {
+            'name': self._app_name,
+            'imageDetails': {
+                'imagePath': self._image_path,
+                'username': self._repo_username,
+                'password': self._repo_password
+            },
+            'args': list(self._args),
+            'ports': [
+                {
+                    'name': 'web',
+                    'containerPort': advertised_port,
+                    'protocol': 'TCP'
                 },
-                'args': [
-                    '--config.file=/etc/alertmanager/alertmanager.yml',
-                    '--storage.path=/alertmanager',
-                    '--cluster.listen-address=0.0.0.0:9094',
-                    # Note that this is only ever needed during cluster
-                    # initialization. Once the cluster has settled, every peer
-                    # will "gossip" with three other peers (as per the gossip
-                    # protocol) to ensure that they all know about healthy and
-                    # unhealthy peers and act accordingly.
-                    '--cluster.peer=alertmanager-0.alertmanager-endpoints:9094'
-                ],
-                'ports': [
-                    {
-                        'name': 'web',
-                        'containerPort': advertised_port,
-                        'protocol': 'TCP'
-                    },
-                    {
-                        'name': 'peering-tcp',
-                        'containerPort': 9094,
-                        'protocol': 'TCP'
-                    },
-                    {
-                        'name': 'peering-udp',
-                        'containerPort': 9094,
-                        'protocol': 'UDP'
-                    }
-                ],
-                'readinessProbe': {
-                    'httpGet': {
-                        'path': '/-/ready',
-                        'port': advertised_port
-                    },
-                    'initialDelaySeconds': 10,
-                    'timeoutSeconds': 30
+                {
+                    'name': 'peering-tcp',
+                    'containerPort': 9094,
+                    'protocol': 'TCP'
                 },
-                'livenessProbe': {
-                    'httpGet': {
-                        'path': '/-/healthy',
-                        'port': advertised_port
-                    },
-                    'initialDelaySeconds': 30,
-                    'timeoutSeconds': 30
+                {
+                    'name': 'peering-udp',
+                    'containerPort': 9094,
+                    'protocol': 'UDP'
+                }
+            ],
+            'readinessProbe': {
+                'httpGet': {
+                    'path': '/-/ready',
+                    'port': advertised_port
                 },
-                'files': [{
-                    'name': 'config',
-                    'mountPath': '/etc/alertmanager',
-                    'files': {
-                        'alertmanager.yml': alertmanager_config.yaml_dump()
-                    }
-                }]
+                'initialDelaySeconds': tuning.readiness_initial_delay,
+                'timeoutSeconds': tuning.probe_timeout
+            },
+            'livenessProbe': {
+                'httpGet': {
+                    'path': '/-/healthy',
+                    'port': advertised_port
+                },
+                'initialDelaySeconds': tuning.liveness_initial_delay,
+                'timeoutSeconds': tuning.probe_timeout
+            },
+            'files': [{
+                'name': 'config',
+                'mountPath': self.config_mount_path,
+                'files': {
+                    self.config_file_name: self._config_file_content
+                }
             }]
         }
 
-    def to_dict(self):
-        final = copy.deepcopy(self._spec)
-        return final
+        if tuning.gomaxprocs:
+            # The Go runtime otherwise sizes its thread pool by the cores
+            # of the node, not the CPU limit, and gets throttled for it.
+            container['config'] = {'GOMAXPROCS': str(tuning.gomaxprocs)}
+
+        return {'containers': [container]}
+
+    @property
+    def config_file_content(self):
+        return self._config_file_content
+
+    def content_hash(self):
+        '''
+        A digest of the spec that only changes when its content does,
+        regardless of dict ordering.
+        '''
+        return _hash_dict(self.to_dict())
+
+    def layout_hash(self):
+        '''
+        Like content_hash but leaves out the contents of the config file.
+        If only the config file changed, this stays the same and the
+        running pods can reload it rather than be restarted.
+        '''
+        layout = self.to_dict()
+        layout['containers'][0]['files'][0]['files'] = \
+            sorted(layout['containers'][0]['files'][0]['files'])
+        return _hash_dict(layout)
 
 
 class AlertManagerConfigFile:
@@ -101,30 +209,246 @@ class AlertManagerConfigFile:
 
     def __init__(self, config_dict):
         self._config_dict = config_dict
-
-    # Algorithm adapted from https://stackoverflow.com/a/7205107
-    def _merge(self, a, b, path=None):
-        "merges b into a"
-        if path is None:
-            path = []
-        for key in b:
-            if key in a:
-                if isinstance(a[key], dict) and isinstance(b[key], dict):
-                    self._merge(a[key], b[key], path + [str(key)])
-                elif a[key] == b[key]:
-                    pass  # same leaf value
+        self._yaml_dump = None
+
+    @classmethod
+    def from_yaml_dump(cls, yaml_dump):
+        '''
+        Restores a config file from a previous yaml_dump() without parsing
+        it. The YAML is only loaded again if the config needs updating.
+        '''
+        config_file = cls(None)
+        config_file._yaml_dump = yaml_dump
+        return config_file
+
+    @property
+    def config_dict(self):
+        if self._config_dict is None:
+            self._config_dict = yaml.load(self._yaml_dump, Loader=SafeLoader)
+        return self._config_dict
+
+    # Algorithm adapted from https://stackoverflow.com/a/7205107 but walks
+    # the dicts with an explicit stack instead of recursing so that no
+    # amount of nesting can exceed the interpreter's recursion limit.
+    def _merge(self, a, b, schema=None):
+        '''
+        merges b into a
+
+        Lists in b replace those in a unless schema says how to match up
+        their entries, in which case matching entries are merged instead.
+        '''
+        pending = [(a, b, schema)]
+        while pending:
+            a_node, b_node, node_schema = pending.pop()
+            if node_schema is None:
+                # Nothing below this node is matched up by key
+                _merge_dicts(a_node, b_node)
+                continue
+
+            for key, b_value in b_node.items():
+                a_value = a_node.get(key)
+                child_schema = _child_schema(node_schema, key)
+
+                if isinstance(a_value, dict) and isinstance(b_value, dict):
+                    pending.append((a_value, b_value, child_schema))
+                elif isinstance(a_value, list) and \
+                        isinstance(b_value, list) and \
+                        isinstance(child_schema, ListSchema):
+                    pending.extend(_pair_list_entries(a_value,
+                                                      b_value,
+                                                      child_schema))
                 else:
-                    # b always takes precedence
-                    a[key] = b[key]
-            else:
-                a[key] = b[key]
+                    a_node[key] = b_value
         return a
 
-    def update(self, other_dict):
-        self._config_dict = self._merge(self._config_dict, other_dict)
+    def update(self, other_dict, mode=MERGE_REPLACE):
+        '''
+        In MERGE_KEYED mode, the entries of the lists described by
+        KEYED_MERGE_SCHEMA are merged with their counterparts in this config
+        rather than replace the whole list. That way other_dict can be a
+        sparse overlay that only holds credentials.
+        '''
+        _check_merge_mode(mode)
+
+        schema = KEYED_MERGE_SCHEMA if mode == MERGE_KEYED else None
+        self._config_dict = self._merge(self.config_dict, other_dict, schema)
+        self._yaml_dump = None
 
     def yaml_dump(self):
-        return yaml.dump(self._config_dict)
+        if self._yaml_dump is None:
+            self._yaml_dump = yaml.dump(self._config_dict, Dumper=SafeDumper)
+        return self._yaml_dump
+
+
+def _check_merge_mode(mode):
+    if mode not in MERGE_MODES:
+        raise InvalidConfigError(
+            "Unknown alertmanager-secrets-merge {!r}. Expected one of "
+            "{}".format(mode, ', '.join(MERGE_MODES)))
+
+
+class GossipTuning(namedtuple('GossipTuning', ['gossip_interval',
+                                               'pushpull_interval',
+                                               'settle_timeout'])):
+    '''
+    Values for AlertManager's --cluster.* flags of the same names, as Go
+    duration strings.
+    '''
+
+
+class TuningProfile(namedtuple('TuningProfile', ['gomaxprocs',
+                                                 'data_retention',
+                                                 'alerts_gc_interval',
+                                                 'readiness_initial_delay',
+                                                 'liveness_initial_delay',
+                                                 'probe_timeout'])):
+    '''
+    Sizes the AlertManager container. The retention and GC interval are Go
+    durations. Any of them may be None to leave it unset.
+
+    Juju pod specs cannot hold resource requests or limits. Juju sets the
+    container's limits from the mem and cpu-power constraints instead, so
+    gomaxprocs is meant to match the latter.
+    '''
+
+
+TUNING_PROFILES = {
+    # Exactly what the charm deployed before profiles existed
+    'default': TuningProfile(gomaxprocs=None,
+                             data_retention=None,
+                             alerts_gc_interval=None,
+                             readiness_initial_delay=10,
+                             liveness_initial_delay=30,
+                             probe_timeout=30),
+    'small': TuningProfile(gomaxprocs=1,
+                           data_retention='120h',
+                           alerts_gc_interval='30m',
+                           readiness_initial_delay=10,
+                           liveness_initial_delay=30,
+                           probe_timeout=30),
+    'medium': TuningProfile(gomaxprocs=1,
+                            data_retention='120h',
+                            alerts_gc_interval='15m',
+                            readiness_initial_delay=10,
+                            liveness_initial_delay=30,
+                            probe_timeout=30),
+    # Large configs take longer to load and many silences take more memory
+    # to keep around, so they are retained for less long.
+    'large': TuningProfile(gomaxprocs=2,
+                           data_retention='72h',
+                           alerts_gc_interval='10m',
+                           readiness_initial_delay=15,
+                           liveness_initial_delay=60,
+                           probe_timeout=30),
+}
+
+# The charm config options that override each TuningProfile field
+_TUNING_OPTIONS = {
+    'gomaxprocs': 'gomaxprocs',
+    'data_retention': 'data-retention',
+    'alerts_gc_interval': 'alerts-gc-interval',
+    'readiness_initial_delay': 'readiness-probe-initial-delay',
+    'liveness_initial_delay': 'liveness-probe-initial-delay',
+    'probe_timeout': 'probe-timeout',
+}
+
+
+class InvalidConfigError(ValueError):
+    '''
+    Raised when the charm config cannot produce a working AlertManager.
+    The message is meant to be shown to the operator as is.
+    '''
+
+
+class ListSchema(namedtuple('ListSchema', ['key', 'entry_schema'])):
+    '''
+    Describes how to match up the entries of a list when merging. Entries
+    that are dicts with the same value under key are merged using
+    entry_schema. If key is None, entries are matched up by their position
+    in the list instead.
+    '''
+
+
+_ROUTE_SCHEMA = {}
+# Routes nest arbitrarily deep and have no identifying field
+_ROUTE_SCHEMA['routes'] = ListSchema(key=None, entry_schema=_ROUTE_SCHEMA)
+
+KEYED_MERGE_SCHEMA = {
+    'route': _ROUTE_SCHEMA,
+    'inhibit_rules': ListSchema(key=None, entry_schema={}),
+    'receivers': ListSchema(key='name', entry_schema={
+        # Stands in for email_configs, pagerduty_configs, and so on
+        '*_configs': ListSchema(key=None, entry_schema={}),
+    }),
+    'mute_time_intervals': ListSchema(key='name', entry_schema={}),
+    'time_intervals': ListSchema(key='name', entry_schema={}),
+}
+
+
+def _merge_dicts(a, b):
+    '''
+    merges b into a, replacing lists. Most values are leaves, so only dicts
+    in b are looked up in a.
+    '''
+    pending = [(a, b)]
+    while pending:
+        a_node, b_node = pending.pop()
+        for key, b_value in b_node.items():
+            if isinstance(b_value, dict):
+                a_value = a_node.get(key)
+                if isinstance(a_value, dict):
+                    pending.append((a_value, b_value))
+                    continue
+            # b always takes precedence. Assigning an equal value is a
+            # no-op and cheaper than comparing the two.
+            a_node[key] = b_value
+
+
+def _child_schema(schema, key):
+    if not schema:
+        return None
+    elif key in schema:
+        return schema[key]
+    elif isinstance(key, str) and key.endswith('_configs'):
+        return schema.get('*_configs')
+    return None
+
+
+def _pair_list_entries(a_list, b_list, list_schema):
+    '''
+    Appends the entries of b_list that have no counterpart in a_list and
+    returns the (a_entry, b_entry, schema) pairs that still need merging.
+    '''
+    pairs = []
+
+    if list_schema.key is None:
+        for index, b_entry in enumerate(b_list):
+            if index >= len(a_list):
+                a_list.append(b_entry)
+            elif isinstance(a_list[index], dict) and \
+                    isinstance(b_entry, dict):
+                pairs.append((a_list[index], b_entry,
+                              list_schema.entry_schema))
+            else:
+                a_list[index] = b_entry
+        return pairs
+
+    # Index a_list once so that matching every entry of b_list stays
+    # linear rather than scanning a_list for each of them.
+    key = list_schema.key
+    index = {}
+    for a_entry in a_list:
+        if isinstance(a_entry, dict) and key in a_entry:
+            index.setdefault(a_entry[key], a_entry)
+
+    for b_entry in b_list:
+        a_entry = index.get(b_entry.get(key)) \
+            if isinstance(b_entry, dict) else None
+        if a_entry is None:
+            a_list.append(b_entry)
+        else:
+            pairs.append((a_entry, b_entry, list_schema.entry_schema))
+    return pairs
 
 
 class PrometheusAlertingConfig:
@@ -133,27 +457,57 @@ class PrometheusAlertingConfig:
     https://prometheus.io/docs/prometheus/latest/configuration/configuration
     '''
 
-    def __init__(self, namespace, label_selector):
+    def __init__(self, namespace, label_selector, static_targets=None,
+                 timeout=None, api_version=None, path_prefix=None):
+        if static_targets is None:
+            alertmanager_dict = {
+                'kubernetes_sd_configs': [
+                    {
+                        'role': 'pod',
+                        'namespaces': {
+                            'names': [
+                                namespace
+                            ]
+                        },
+                        'selectors': [
+                            {
+                                'role': 'pod',
+                                'label': label_selector
+                            }
+                        ]
+                    }
+                ],
+                # Every declared container port becomes a target. Only
+                # the web one takes alerts, the others are for gossip.
+                'relabel_configs': [
+                    {
+                        'source_labels': [
+                            '__meta_kubernetes_pod_container_port_number'
+                        ],
+                        'regex': str(ADVERTISED_PORT),
+                        'action': 'keep'
+                    }
+                ]
+            }
+        else:
+            alertmanager_dict = {
+                'static_configs': [
+                    {
+                        'targets': list(static_targets)
+                    }
+                ]
+            }
+
+        if timeout:
+            alertmanager_dict['timeout'] = timeout
+        if api_version:
+            alertmanager_dict['api_version'] = api_version
+        if path_prefix:
+            alertmanager_dict['path_prefix'] = path_prefix
+
         self.config_dict = {
             'alertmanagers': [
-                {
-                    'kubernetes_sd_configs': [
-                        {
-                            'role': 'pod',
-                            'namespaces': {
-                                'names': [
-                                    namespace
-                                ]
-                            },
-                            'selectors': [
-                                {
-                                    'role': 'pod',
-                                    'label': label_selector
-                                }
-                            ]
-                        }
-                    ]
-                }
+                alertmanager_dict
             ]
         }
 
@@ -161,7 +515,11 @@ class PrometheusAlertingConfig:
         return self.to_json()
 
     def to_json(self):
-        return json.dumps(self.config_dict)
+        # Canonical so that the same config always serializes the same and
+        # can be compared with what was written before.
+        return json.dumps(self.config_dict,
+                          sort_keys=True,
+                          separators=(',', ':'))
 
 
 # DOMAIN SERVICES
@@ -169,23 +527,45 @@ class PrometheusAlertingConfig:
 # More stateless functions. This group is purely business logic that take
 # simple values or data structures and produce new values from them.
 
-def build_alertmanager_config(base64_config_yaml, base64_secrets_yaml):
+def build_alertmanager_config(base64_config_yaml,
+                              base64_secrets_yaml,
+                              cache=None,
+                              secrets_merge_mode=MERGE_REPLACE):
+    '''
+    See AlertManagerConfigFile.update for secrets_merge_mode.
+
+    If a cache is given, the rendered config is looked up by a digest of
+    the inputs first so that unchanged inputs skip the decoding, parsing
+    and merging altogether. The cache only needs get(key) and
+    put(key, text).
+    '''
+    # Checked even without any secrets to merge, so that a typo does not
+    # only block the unit once secrets are added.
+    _check_merge_mode(secrets_merge_mode)
+
+    if cache is not None:
+        cache_key = alertmanager_config_digest(base64_config_yaml,
+                                               base64_secrets_yaml,
+                                               secrets_merge_mode)
+        rendered = cache.get(cache_key)
+        if rendered is not None:
+            logger.debug("Using cached AlertManager config %s", cache_key)
+            return AlertManagerConfigFile.from_yaml_dump(rendered)
 
     if base64_config_yaml:
         logger.debug("Decoding base64_config_yaml")
         config_yaml = b64decode(base64_config_yaml)
 
         logger.debug("Loading config_yaml to dict")
-        config_dict = yaml.safe_load(config_yaml)
+        config_dict = yaml.load(config_yaml, Loader=SafeLoader)
     else:
-        default_config_path = 'templates/alertmanager-config-default.yml'
         logger.warning("Could not find alertmanager-config string. "
-                       "Loading default config from {} instead. This instance"
-                       "is NOT RECOMMENDED for production use".format(
-                           default_config_path
-                       ))
-        with open(default_config_path) as default_config_yaml:
-            config_dict = yaml.safe_load(default_config_yaml)
+                       "Loading default config from %s instead. This instance"
+                       "is NOT RECOMMENDED for production use",
+                       DEFAULT_CONFIG_PATH)
+        with open(DEFAULT_CONFIG_PATH) as default_config_yaml:
+            config_dict = yaml.load(default_config_yaml,
+                                    Loader=SafeLoader)
 
     alertmanager_config = AlertManagerConfigFile(config_dict)
 
@@ -194,25 +574,251 @@ def build_alertmanager_config(base64_config_yaml, base64_secrets_yaml):
         secrets_yaml = b64decode(base64_secrets_yaml)
 
         logger.debug("Loading secrets_yaml to dict")
-        secrets_dict = yaml.safe_load(secrets_yaml)
+        secrets_dict = yaml.load(secrets_yaml, Loader=SafeLoader)
 
         logger.debug("Updating AlertManager configuration with secrets")
-        alertmanager_config.update(secrets_dict)
+        alertmanager_config.update(secrets_dict, mode=secrets_merge_mode)
     else:
         logger.info("alertmanager-secrets not provided. Ignoring")
 
+    if cache is not None:
+        cache.put(cache_key, alertmanager_config.yaml_dump())
+
     return alertmanager_config
 
 
+def alertmanager_config_digest(base64_config_yaml,
+                               base64_secrets_yaml,
+                               secrets_merge_mode=MERGE_REPLACE):
+    '''
+    Identifies a rendered AlertManager config by everything it is rendered
+    from, including the default config file when no config is given.
+    '''
+    digest = hashlib.sha256()
+    digest.update(CONFIG_RENDER_VERSION.encode('utf-8'))
+
+    if base64_config_yaml:
+        inputs = [base64_config_yaml]
+    else:
+        with open(DEFAULT_CONFIG_PATH, 'rb') as default_config_yaml:
+            inputs = [default_config_yaml.read()]
+    inputs.append(base64_secrets_yaml or '')
+    inputs.append(secrets_merge_mode)
+
+    for value in inputs:
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        # Length-prefix each input so that no two sets of inputs can
+        # produce the same byte stream.
+        digest.update(str(len(value)).encode('ascii') + b':' + value)
+
+    return digest.hexdigest()
+
+
+def build_cluster_peers(app_name, unit_count):
+    '''
+    The peers are only needed while a replica joins the cluster. After
+    that, membership spreads through gossip. Giving every replica more than
+    one of them means a single slow or missing pod cannot stall it.
+    '''
+    peer_count = min(max(unit_count, 1), MAX_BOOTSTRAP_PEERS)
+    return [
+        # Juju fronts the pods of a StatefulSet with a headless service
+        # named after the app, which gives each of them a stable DNS name.
+        '{app}-{index}.{app}-endpoints:{port}'.format(app=app_name,
+                                                      index=index,
+                                                      port=CLUSTER_PORT)
+        for index in range(peer_count)
+    ]
+
+
+def build_prometheus_alerting_config(app_name, namespace, charm_config,
+                                     unit_count=1):
+    '''
+    In static mode, every related Prometheus is handed the stable DNS name
+    of each replica rather than having to watch the pods of our namespace
+    through the API server itself. The list only changes with the number
+    of units. Raises InvalidConfigError if the options could not work.
+    '''
+    label_selector = 'juju-app={}'.format(app_name)
+    mode = charm_config.get('prometheus-discovery') or DISCOVERY_KUBERNETES
+    options = _build_alerting_options(charm_config)
+
+    if mode == DISCOVERY_KUBERNETES:
+        return PrometheusAlertingConfig(namespace=namespace,
+                                        label_selector=label_selector,
+                                        **options)
+    elif mode == DISCOVERY_STATIC:
+        # Qualified with the namespace as Prometheus may well be deployed
+        # in another model.
+        static_targets = [
+            '{app}-{index}.{app}-endpoints.{namespace}.svc:{port}'.format(
+                app=app_name,
+                index=index,
+                namespace=namespace,
+                port=ADVERTISED_PORT)
+            for index in range(max(unit_count, 1))
+        ]
+        return PrometheusAlertingConfig(namespace=namespace,
+                                        label_selector=label_selector,
+                                        static_targets=static_targets,
+                                        **options)
+
+    raise InvalidConfigError(
+        "Unknown prometheus-discovery {!r}. Expected one of {}".format(
+            mode, ', '.join(DISCOVERY_MODES)))
+
+
+def _build_alerting_options(charm_config):
+    timeout = charm_config.get('prometheus-alerting-timeout') or None
+    if timeout is not None and \
+            not _PROMETHEUS_DURATION_RE.fullmatch(str(timeout)):
+        raise InvalidConfigError(
+            "prometheus-alerting-timeout is not a valid {}: {!r}".format(
+                _QUANTITY_NAMES['prometheus_duration'], timeout))
+
+    api_version = charm_config.get('prometheus-alerting-api-version') or None
+    if api_version is not None and api_version not in ALERTING_API_VERSIONS:
+        raise InvalidConfigError(
+            "Unknown prometheus-alerting-api-version {!r}. "
+            "Expected one of {}".format(api_version,
+                                        ', '.join(ALERTING_API_VERSIONS)))
+
+    path_prefix = charm_config.get('prometheus-alerting-path-prefix') or None
+    if path_prefix is not None and not path_prefix.startswith('/'):
+        raise InvalidConfigError(
+            "prometheus-alerting-path-prefix must start with /, "
+            "not {!r}".format(path_prefix))
+
+    return {
+        'timeout': timeout,
+        'api_version': api_version,
+        'path_prefix': path_prefix,
+    }
+
+
+def build_gossip_tuning(unit_count):
+    '''
+    Gossip reaches every member in a number of rounds that grows with the
+    log of the cluster size, so that is what the timings scale by. This
+    also means they only change, and the pods only restart over them, when
+    the cluster size crosses a power of two. Up to two replicas get
+    AlertManager's defaults.
+    '''
+    scale = max(1, math.ceil(math.log2(max(unit_count, 1))))
+
+    return GossipTuning(
+        # Every round already reaches more members as the cluster grows so
+        # the interval itself can stay at the default.
+        gossip_interval='200ms',
+        # Full state syncs grow with the cluster so they happen less often
+        pushpull_interval='{}s'.format(60 * scale),
+        # Give the extra gossip rounds time to converge before the replica
+        # starts sending notifications.
+        settle_timeout='{}s'.format(45 + 15 * scale),
+    )
+
+
+def build_tuning_profile(charm_config):
+    '''
+    Starts from the profile named by the tuning-profile option and applies
+    the options that override its individual fields. Raises
+    InvalidConfigError if the result could not work.
+    '''
+    profile_name = charm_config.get('tuning-profile') or \
+        DEFAULT_TUNING_PROFILE
+    if profile_name not in TUNING_PROFILES:
+        raise InvalidConfigError(
+            "Unknown tuning-profile {!r}. Expected one of {}".format(
+                profile_name, ', '.join(sorted(TUNING_PROFILES))))
+
+    overrides = {}
+    for field, option in _TUNING_OPTIONS.items():
+        # Both "" and 0 mean that the option is not set
+        value = charm_config.get(option)
+        if value:
+            overrides[field] = value
+    profile = TUNING_PROFILES[profile_name]._replace(**overrides)
+
+    _check_range('duration', parse_duration,
+                 profile.alerts_gc_interval, profile.data_retention,
+                 options=('alerts-gc-interval', 'data-retention'))
+
+    gomaxprocs = profile.gomaxprocs
+    if gomaxprocs is not None and \
+            not (isinstance(gomaxprocs, int) and gomaxprocs >= 1):
+        raise InvalidConfigError(
+            "gomaxprocs must be a positive whole number, not {!r}".format(
+                gomaxprocs))
+
+    for field in ('readiness_initial_delay',
+                  'liveness_initial_delay',
+                  'probe_timeout'):
+        value = getattr(profile, field)
+        if not isinstance(value, int) or value < 0:
+            raise InvalidConfigError(
+                "{} must be a whole number of seconds, not {!r}".format(
+                    _TUNING_OPTIONS[field], value))
+
+    return profile
+
+
+def _check_range(kind, parse, lower, upper, options):
+    values = []
+    for option, value in zip(options, (lower, upper)):
+        try:
+            values.append(None if value is None else parse(value))
+        except ValueError:
+            raise InvalidConfigError(
+                "{} is not a valid {}: {!r}".format(option,
+                                                    _QUANTITY_NAMES[kind],
+                                                    value))
+
+    if None not in values and values[0] > values[1]:
+        raise InvalidConfigError("{} ({}) cannot be more than {} ({})".format(
+            options[0], lower, options[1], upper))
+
+
+_QUANTITY_NAMES = {
+    'duration': 'duration such as 30m or 120h',
+    'prometheus_duration': 'Prometheus duration such as 30s or 1d',
+}
+
+_DURATION_UNITS = {
+    'ns': 1e-9, 'us': 1e-6, '\u00b5s': 1e-6, 'ms': 1e-3,
+    's': 1, 'm': 60, 'h': 3600,
+}
+
+
+# Prometheus parses durations in its own config with model.ParseDuration,
+# which unlike Go's time.ParseDuration takes no fractions and no units
+# below milliseconds, but does take days, weeks and years.
+_PROMETHEUS_DURATION_RE = re.compile(
+    r'(?=.)((\d+)y)?((\d+)w)?((\d+)d)?((\d+)h)?((\d+)m)?((\d+)s)?((\d+)ms)?')
+
+
+def parse_duration(duration):
+    '''
+    Returns the number of seconds in a Go duration such as 1h30m
+    '''
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ns|us|\u00b5s|ms|s|m|h)',
+                       str(duration))
+    if not parts or ''.join(n + u for n, u in parts) != str(duration):
+        raise ValueError("Invalid duration {!r}".format(duration))
+    return sum(float(number) * _DURATION_UNITS[unit]
+               for number, unit in parts)
+
+
 def build_juju_pod_spec(app_name,
                         charm_config,
                         image_meta,
-                        alertmanager_config):
+                        alertmanager_config,
+                        unit_count=1):
 
     # There is never ever a need to customize the advertised port of a
     # containerized Prometheus instance so we are removing that config
     # option and making it statically default to its typical 9090
-    advertised_port = 9093
+    advertised_port = ADVERTISED_PORT
 
     # TODO: Add logic here to decide whether to use V1 or V2 JujuPodSpec
     #       based on Juju version. NOTE: Only Juju 2.7 up supports V2.
@@ -222,7 +828,10 @@ def build_juju_pod_spec(app_name,
         repo_username=image_meta.repo_username,
         repo_password=image_meta.repo_password,
         advertised_port=advertised_port,
-        alertmanager_config=alertmanager_config)
+        alertmanager_config=alertmanager_config,
+        cluster_peers=build_cluster_peers(app_name, unit_count),
+        gossip_tuning=build_gossip_tuning(unit_count),
+        tuning_profile=build_tuning_profile(charm_config))
 
     return spec
 
@@ -238,3 +847,10 @@ def build_juju_unit_status(pod_status):
         unit_status = ActiveStatus()
 
     return unit_status
+
+
+def _hash_dict(dict_obj):
+    canonical_json = json.dumps(dict_obj,
+                                sort_keys=True,
+                                separators=(',', ':'))
+    return hashlib.sha256(canonical_json.encode('utf-8')).hexdigest()
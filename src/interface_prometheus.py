@@ -1,3 +1,5 @@
+import hashlib
+import json
 import logging
 
 logger = logging.getLogger()
@@ -6,13 +8,27 @@ from ops.framework import (
     EventSource,
     Object,
     ObjectEvents,
+    StoredState,
 )
 from ops.framework import EventBase
 from adapters.framework import FrameworkAdapter
 
 
 class NewPrometheusRelationEvent(EventBase):
-    pass
+    '''
+    relation_id is that of the relation that needs its data updated. When
+    it is None, all of them do.
+    '''
+
+    def __init__(self, handle, relation_id=None):
+        super().__init__(handle)
+        self.relation_id = relation_id
+
+    def snapshot(self):
+        return {'relation_id': self.relation_id}
+
+    def restore(self, snapshot):
+        self.relation_id = snapshot['relation_id']
 
 
 class PrometheusEvents(ObjectEvents):
@@ -20,18 +36,48 @@ class PrometheusEvents(ObjectEvents):
 
 
 class PrometheusInterface(Object):
+    '''
+    Emits new_prom_rel only when something the charm depends on changed on
+    the remote side of a relation, i.e. which Prometheus units are related.
+    A fleet of Prometheus units updating their own data while being
+    redeployed therefore doesn't have every such hook redo the same work.
+    '''
     on = PrometheusEvents()
+    state = StoredState()
 
     def __init__(self, charm, relation_name):
         super().__init__(charm, relation_name)
 
+        self.state.set_default(fingerprints={})
+
         self.fw_adapter = FrameworkAdapter(self.framework)
         self.relation_name = relation_name
 
         self.fw_adapter.observe(charm.on[relation_name].relation_changed,
                                 self.on_relation_changed)
+        self.fw_adapter.observe(charm.on[relation_name].relation_broken,
+                                self.on_relation_broken)
 
     def on_relation_changed(self, event):
+        relation_key = str(event.relation.id)
+        fingerprint = _fingerprint(event.relation)
+        if self.state.fingerprints.get(relation_key) == fingerprint:
+            logger.debug("Nothing changed in relation %s", relation_key)
+            return
+
+        self.state.fingerprints[relation_key] = fingerprint
         logger.debug("Emitting new_prom_rel event")
-        self.on.new_prom_rel.emit()
+        self.on.new_prom_rel.emit(event.relation.id)
         logger.debug("Done emitting new_prom_rel_event")
+
+    def on_relation_broken(self, event):
+        self.state.fingerprints.pop(str(event.relation.id), None)
+
+
+def _fingerprint(relation):
+    remote = {
+        'app': relation.app.name if relation.app else None,
+        'units': sorted(unit.name for unit in relation.units),
+    }
+    return hashlib.sha256(
+        json.dumps(remote, sort_keys=True).encode('utf-8')).hexdigest()
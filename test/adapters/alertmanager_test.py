@@ -0,0 +1,75 @@
+import sys
+import unittest
+from uuid import uuid4
+
+sys.path.append('src')
+from adapters.alertmanager import (
+    AlertManagerAPI,
+    config_hash,
+)
+
+sys.path.append('test')
+from fake_alertmanager import FakeAlertManager
+
+
+class ConfigHashTest(unittest.TestCase):
+
+    def test__it_matches_the_hash_alertmanager_reports(self):
+        # Exercise
+        value = config_hash('route:\n  receiver: default\n')
+
+        # Assert
+        # The first 6 bytes of the file's md5 digest,
+        # 19 4d ac 70 08 a2..., read little-endian
+        assert value == float(0xa20870ac4d19)
+
+
+class AlertManagerAPITest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake_alertmanager = FakeAlertManager().start()
+        self.addCleanup(self.fake_alertmanager.stop)
+
+        self.api = AlertManagerAPI(host='127.0.0.1',
+                                   port=self.fake_alertmanager.port)
+
+    def test__get_config_metrics__returns_the_hash_of_the_loaded_config(self):
+        # Setup
+        config = str(uuid4())
+        self.fake_alertmanager.loaded_config = config
+
+        # Exercise
+        config_metrics = self.api.get_config_metrics()
+
+        # Assert
+        assert config_metrics.config_hash == config_hash(config)
+        assert config_metrics.last_reload_successful
+
+    def test__reload__makes_the_replica_load_the_config_file(self):
+        # Setup
+        config = str(uuid4())
+        self.fake_alertmanager.config_file = config
+
+        # Exercise
+        is_reloaded = self.api.reload()
+
+        # Assert
+        assert is_reloaded
+        assert self.fake_alertmanager.reloads == 1
+        assert self.api.get_config_metrics().config_hash == \
+            config_hash(config)
+
+    def test__reload__reports_a_config_file_that_failed_to_load(self):
+        # Setup
+        config = str(uuid4())
+        self.fake_alertmanager.loaded_config = config
+        self.fake_alertmanager.config_file = None
+
+        # Exercise
+        is_reloaded = self.api.reload()
+
+        # Assert
+        assert not is_reloaded
+        config_metrics = self.api.get_config_metrics()
+        assert config_metrics.config_hash == config_hash(config)
+        assert not config_metrics.last_reload_successful
@@ -0,0 +1,80 @@
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import unittest
+from uuid import uuid4
+
+sys.path.append('src')
+from adapters import cache
+from adapters.cache import (
+    RenderCache,
+)
+
+
+class RenderCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        # Ensure that we clean up the tmp directory even when the test
+        # fails or errors out for whatever reason.
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.addCleanup(cache._memory.clear)
+
+    def test__get__returns_None_on_a_miss(self):
+        # Setup
+        render_cache = RenderCache(self.tmpdir / 'cache')
+
+        # Exercise
+        text = render_cache.get(str(uuid4()))
+
+        # Assert
+        assert text is None
+
+    def test__entries_survive_across_processes(self):
+        # Setup
+        key = str(uuid4())
+        text = str(uuid4())
+        RenderCache(self.tmpdir / 'cache').put(key, text)
+        # What a new hook process starts with
+        cache._memory.clear()
+
+        # Exercise
+        cached_text = RenderCache(self.tmpdir / 'cache').get(key)
+
+        # Assert
+        assert cached_text == text
+
+    def test__entries_are_served_from_memory_within_a_process(self):
+        # Setup
+        key = str(uuid4())
+        text = str(uuid4())
+        render_cache = RenderCache(self.tmpdir / 'cache')
+        render_cache.put(key, text)
+        shutil.rmtree(self.tmpdir / 'cache')
+
+        # Exercise
+        cached_text = render_cache.get(key)
+
+        # Assert
+        assert cached_text == text
+
+    def test__least_recently_used_entries_are_evicted_past_max_bytes(self):
+        # Setup
+        render_cache = RenderCache(self.tmpdir / 'cache', max_bytes=300)
+        keys = [str(uuid4()) for _ in range(4)]
+
+        # Exercise
+        for index, key in enumerate(keys):
+            render_cache.put(key, 'x' * 100)
+            # Make the write order visible to mtime-based eviction
+            os.utime(str(self.tmpdir / 'cache' / key), ns=(index, index))
+
+        render_cache.put(str(uuid4()), 'x' * 100)
+
+        # Assert
+        remaining = sorted(p.name for p in (self.tmpdir / 'cache').iterdir())
+        assert len(remaining) == 3
+        assert keys[0] not in remaining
+        assert keys[1] not in remaining
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 import pytest
 import shutil
@@ -5,10 +6,13 @@ import sys
 import tempfile
 import unittest
 from uuid import uuid4
+import yaml
 from unittest.mock import (
     call,
     create_autospec,
+    MagicMock,
     patch,
+    PropertyMock,
 )
 sys.path.append('lib')
 from ops.charm import (
@@ -26,6 +30,7 @@ from ops.model import (
 sys.path.append('src')
 from adapters.framework import (
     _fetch_image_meta,
+    _image_meta_cache,
     _read_resource_file,
     FrameworkAdapter,
     ResourceError,
@@ -313,3 +318,138 @@ class FrameworkAdapterTest(unittest.TestCase):
             call(image_name, mock_framework.model.resources)
 
         assert image_meta == mock_fetch_image_meta_func.return_value
+
+
+class MemoizedFrameworkAdapterTest(unittest.TestCase):
+
+    def build_mock_framework(self):
+        mock_framework = MagicMock()
+        mock_model = mock_framework.model
+        self.mock_config = PropertyMock(return_value={'a': 'b'})
+        type(mock_model).config = self.mock_config
+        self.mock_app_name = PropertyMock(return_value=str(uuid4()))
+        type(mock_model.app).name = self.mock_app_name
+        return mock_framework
+
+    def read_everything(self, adapter, times):
+        for _ in range(times):
+            adapter.get_app_name()
+            adapter.get_config()
+            adapter.get_config('a')
+            adapter.get_relations('prometheus')
+            adapter.get_image_meta('alertmanager-image')
+
+    @patch('adapters.framework._fetch_image_meta', spec_set=True)
+    def test__each_value_is_read_from_the_model_once(
+            self, mock_fetch_image_meta_func):
+        # Setup
+        mock_framework = self.build_mock_framework()
+        adapter = FrameworkAdapter(mock_framework, memoize=True)
+
+        # Exercise
+        self.read_everything(adapter, times=3)
+
+        # Assert
+        assert self.mock_app_name.call_count == 1
+        assert self.mock_config.call_count == 1
+        assert mock_framework.model.relations.__getitem__.call_count == 1
+        assert mock_fetch_image_meta_func.call_count == 1
+
+    @patch('adapters.framework._fetch_image_meta', spec_set=True)
+    def test__writes_invalidate_the_memoized_values(
+            self, mock_fetch_image_meta_func):
+        # Setup
+        mock_framework = self.build_mock_framework()
+        adapter = FrameworkAdapter(mock_framework, memoize=True)
+        self.read_everything(adapter, times=1)
+
+        # Exercise
+        adapter.set_pod_spec({})
+        self.read_everything(adapter, times=1)
+        adapter.set_relation_data(MagicMock(), {'a': 'b'})
+        self.read_everything(adapter, times=1)
+
+        # Assert
+        assert self.mock_app_name.call_count == 3
+        assert self.mock_config.call_count == 3
+        assert mock_fetch_image_meta_func.call_count == 3
+
+    @patch('adapters.framework._fetch_image_meta', spec_set=True)
+    def test__nothing_is_memoized_by_default(
+            self, mock_fetch_image_meta_func):
+        # Setup
+        mock_framework = self.build_mock_framework()
+        adapter = FrameworkAdapter(mock_framework)
+
+        # Exercise
+        self.read_everything(adapter, times=3)
+
+        # Assert
+        assert self.mock_app_name.call_count == 3
+        assert self.mock_config.call_count == 6
+        assert mock_fetch_image_meta_func.call_count == 3
+
+
+class SetRelationDataTest(unittest.TestCase):
+
+    def test__only_stale_values_are_written(self):
+        # Setup
+        mock_framework = MagicMock()
+        unit = mock_framework.model.unit
+        relation_data = MagicMock()
+        relation_data.get.side_effect = {'a': '1', 'b': '2'}.get
+        mock_relation = MagicMock()
+        mock_relation.data = {unit: relation_data}
+        adapter = FrameworkAdapter(mock_framework)
+
+        # Exercise
+        written = adapter.set_relation_data(mock_relation,
+                                            {'a': '1', 'b': '3', 'c': '4'})
+        unchanged = adapter.set_relation_data(mock_relation,
+                                              {'a': '1', 'b': '2'})
+
+        # Assert
+        assert written is True
+        assert unchanged is False
+        assert relation_data.update.call_args_list == [
+            call({'b': '3', 'c': '4'}),
+        ]
+
+
+class ImageMetaCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.addCleanup(_image_meta_cache.clear)
+
+        self.resource_path = self.tmpdir / 'alertmanager-image'
+        self.resource_path.write_text(
+            "registrypath: {}\nusername: ''\npassword: ''\n".format(
+                uuid4()))
+        self.mock_resources_repo = create_autospec(Resources, spec_set=True)
+        self.mock_resources_repo.fetch.return_value = self.resource_path
+
+    @patch('adapters.framework.yaml.load', wraps=yaml.load)
+    def test__the_resource_is_only_parsed_again_once_it_changes(
+            self, mock_yaml_load_func):
+        # Exercise
+        first = _fetch_image_meta('alertmanager-image',
+                                  self.mock_resources_repo)
+        second = _fetch_image_meta('alertmanager-image',
+                                   self.mock_resources_repo)
+
+        new_image_path = str(uuid4())
+        self.resource_path.write_text(
+            "registrypath: {}\nusername: ''\npassword: ''\n".format(
+                new_image_path))
+        stat = self.resource_path.stat()
+        os.utime(str(self.resource_path),
+                 ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        third = _fetch_image_meta('alertmanager-image',
+                                  self.mock_resources_repo)
+
+        # Assert
+        assert mock_yaml_load_func.call_count == 2
+        assert second is first
+        assert third.image_path == new_image_path
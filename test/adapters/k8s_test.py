@@ -1,21 +1,54 @@
 import io
 import json
+import os
+import shutil
 import sys
 import unittest
 from unittest.mock import (
     patch,
 )
+from urllib.parse import (
+    parse_qs,
+    urlparse,
+)
 from uuid import (
     uuid4,
 )
 
 sys.path.append('src')
-from adapters import k8s
+from adapters import (
+    k8s,
+    metrics,
+)
 from adapters.k8s import (
     APIServer,
     PodStatus,
 )
 
+sys.path.append('test')
+from fake_apiserver import start_fake_api_server
+
+
+def build_pod(juju_app, juju_unit, ready):
+    return {
+        'metadata': {
+            'name': juju_unit.replace('/', '-'),
+            'labels': {
+                'juju-app': juju_app
+            },
+            'annotations': {
+                'juju.io/unit': juju_unit
+            }
+        },
+        'status': {
+            'phase': 'Running' if ready else 'Pending',
+            'conditions': [{
+                'type': 'ContainersReady',
+                'status': 'True' if ready else 'False'
+            }]
+        }
+    }
+
 
 class GetPodStatusTest(unittest.TestCase):
 
@@ -65,27 +98,135 @@ class GetPodStatusTest(unittest.TestCase):
         # Assert
         assert type(pod_status) == PodStatus
 
+    @patch('adapters.k8s.APIServer', autospec=True, spec_set=True)
+    def test__asks_the_api_server_for_the_units_pod_only(
+            self,
+            mock_api_server_cls):
+        # Setup
+        juju_app = str(uuid4())
+        juju_unit = '{}/3'.format(juju_app)
+
+        mock_api_server = mock_api_server_cls.return_value
+        mock_api_server.get.return_value = {
+            'kind': 'PodList',
+            'items': [build_pod(juju_app, juju_unit, ready=True)]
+        }
+
+        # Exercise
+        pod_status = k8s.get_pod_status(juju_model=uuid4(),
+                                        juju_app=juju_app,
+                                        juju_unit=juju_unit)
+
+        # Assert
+        assert pod_status.is_ready
+        assert mock_api_server.get.call_count == 1
+        path = mock_api_server.get.call_args[0][0]
+        assert parse_qs(urlparse(path).query)['fieldSelector'] == \
+            ['metadata.name={}-3'.format(juju_app)]
+
+    @patch('adapters.k8s.APIServer', autospec=True, spec_set=True)
+    def test__falls_back_to_listing_all_pods_if_the_name_is_taken(
+            self,
+            mock_api_server_cls):
+        # Setup
+        juju_app = str(uuid4())
+        juju_unit = '{}/3'.format(juju_app)
+        pod = build_pod(juju_app, juju_unit, ready=True)
+        pod['metadata']['name'] = str(uuid4())
+        other_pod = build_pod(juju_app, '{}/7'.format(juju_app), ready=True)
+        other_pod['metadata']['name'] = '{}-3'.format(juju_app)
+
+        mock_api_server = mock_api_server_cls.return_value
+        mock_api_server.get.side_effect = [
+            {'kind': 'PodList', 'items': [other_pod]},
+            {'kind': 'PodList', 'items': [other_pod, pod]},
+        ]
+
+        # Exercise
+        pod_status = k8s.get_pod_status(juju_model=uuid4(),
+                                        juju_app=juju_app,
+                                        juju_unit=juju_unit)
+
+        # Assert
+        assert pod_status.is_ready
+        assert mock_api_server.get.call_count == 2
+        path = mock_api_server.get.call_args[0][0]
+        assert 'fieldSelector' not in parse_qs(urlparse(path).query)
+
+    @patch('adapters.k8s.APIServer', autospec=True, spec_set=True)
+    def test__finds_the_pod_of_a_unit_numbered_past_the_pod_ordinals(
+            self,
+            mock_api_server_cls):
+        # Setup
+        # Scaled down and back up: unit 5 runs in the pod with ordinal 2
+        juju_app = str(uuid4())
+        juju_unit = '{}/5'.format(juju_app)
+        pods = []
+        for ordinal, unit_number in enumerate([0, 1, 5]):
+            pod = build_pod(juju_app,
+                            '{}/{}'.format(juju_app, unit_number),
+                            ready=True)
+            pod['metadata']['name'] = '{}-{}'.format(juju_app, ordinal)
+            pods.append(pod)
+
+        mock_api_server = mock_api_server_cls.return_value
+        mock_api_server.get.side_effect = [
+            {'kind': 'PodList', 'items': []},
+            {'kind': 'PodList', 'items': pods},
+        ]
+
+        # Exercise
+        pod_status = k8s.get_pod_status(juju_model=uuid4(),
+                                        juju_app=juju_app,
+                                        juju_unit=juju_unit)
+
+        # Assert
+        assert pod_status.is_ready
+        assert mock_api_server.get.call_count == 2
+        path = mock_api_server.get.call_args[0][0]
+        assert 'fieldSelector' not in parse_qs(urlparse(path).query)
+
+    @patch('adapters.k8s.APIServer', autospec=True, spec_set=True)
+    def test__returns_an_unknown_status_if_the_pod_does_not_exist_yet(
+            self,
+            mock_api_server_cls):
+        # Setup
+        mock_api_server = mock_api_server_cls.return_value
+        mock_api_server.get.return_value = {'kind': 'PodList', 'items': []}
+
+        # Exercise
+        pod_status = k8s.get_pod_status(juju_model=uuid4(),
+                                        juju_app=uuid4(),
+                                        juju_unit=uuid4())
+
+        # Assert
+        assert pod_status.is_unknown
+
 
 class APIServerTest(unittest.TestCase):
 
+    def setUp(self):
+        self.addCleanup(k8s._pool.close)
+
     @patch('adapters.k8s.open', create=True)
-    @patch('adapters.k8s.ssl.SSLContext', autospec=True, spec_set=True)
-    @patch('adapters.k8s.http.client.HTTPSConnection',
+    @patch('adapters.k8s.ssl.create_default_context',
            autospec=True, spec_set=True)
+    @patch('adapters.k8s._HTTPSConnection', autospec=True, spec_set=True)
     def test__get__loads_json_string_successfully(
             self,
             mock_https_connection_cls,
-            mock_ssl_context_cls,
+            mock_create_default_context_func,
             mock_open):
         # Setup
         mock_token = str(uuid4())
         mock_token_file = io.StringIO(mock_token)
         mock_open.return_value = mock_token_file
         mock_response_dict = {}
-        mock_response_json = io.StringIO(json.dumps(mock_response_dict))
 
         mock_conn = mock_https_connection_cls.return_value
-        mock_conn.getresponse.return_value = mock_response_json
+        mock_response = mock_conn.getresponse.return_value
+        mock_response.status = 200
+        mock_response.read.return_value = json.dumps(mock_response_dict)
 
         # Exercise
         api_server = APIServer()
@@ -95,6 +236,362 @@ class APIServerTest(unittest.TestCase):
         assert response == mock_response_dict
 
 
+@unittest.skipUnless(shutil.which('openssl'), 'openssl is required')
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake_api_server = start_fake_api_server(self)
+
+        self.juju_model = str(uuid4())
+        self.juju_app = str(uuid4())
+        self.juju_unit = '{}/0'.format(self.juju_app)
+
+    def wait_for_pod_readiness(self, polls_until_ready):
+        # Polls once per hook, as the deferred check_pod_readiness event
+        # does until the pod is ready
+        polls = 0
+        pod_status = PodStatus(None)
+        while not pod_status.is_ready:
+            polls += 1
+            self.fake_api_server.pods = [
+                build_pod(self.juju_app,
+                          '{}/{}'.format(self.juju_app, i),
+                          ready=True)
+                for i in range(1, 10)
+            ] + [
+                build_pod(self.juju_app,
+                          self.juju_unit,
+                          ready=polls >= polls_until_ready)
+            ]
+            pod_status = k8s.get_pod_status(juju_model=self.juju_model,
+                                            juju_app=self.juju_app,
+                                            juju_unit=self.juju_unit)
+        return polls
+
+    def test__readiness_wait_costs_a_single_handshake(self):
+        # Exercise
+        polls = self.wait_for_pod_readiness(polls_until_ready=5)
+
+        # Assert
+        assert polls == 5
+        assert len(self.fake_api_server.requests) == 5
+        assert self.fake_api_server.handshakes == 1
+
+    def test__reconnects_after_the_server_closes_the_connection(self):
+        # Setup
+        self.wait_for_pod_readiness(polls_until_ready=1)
+        self.fake_api_server.drop_connection_after_response = True
+        self.wait_for_pod_readiness(polls_until_ready=1)
+
+        # Exercise
+        polls = self.wait_for_pod_readiness(polls_until_ready=2)
+
+        # Assert
+        assert polls == 2
+        assert self.fake_api_server.handshakes == 2
+
+    def test__token_is_reloaded_only_when_its_mtime_changes(self):
+        # Setup
+        new_token = str(uuid4())
+        self.wait_for_pod_readiness(polls_until_ready=2)
+
+        # Exercise
+        self.fake_api_server.set_token(new_token)
+        stat = os.stat(self.fake_api_server.token_path)
+        os.utime(self.fake_api_server.token_path,
+                 ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.wait_for_pod_readiness(polls_until_ready=1)
+
+        # Assert
+        authorizations = [r['authorization']
+                          for r in self.fake_api_server.requests]
+        assert authorizations == [
+            'Bearer fake-token',
+            'Bearer fake-token',
+            'Bearer {}'.format(new_token),
+        ]
+        assert self.fake_api_server.handshakes == 1
+
+    def test__a_revoked_token_is_an_error(self):
+        # Setup
+        self.fake_api_server.token = str(uuid4())
+
+        # Exercise and assert
+        with self.assertRaises(k8s.APIError) as context:
+            k8s.get_pod_status(juju_model=self.juju_model,
+                               juju_app=self.juju_app,
+                               juju_unit=self.juju_unit)
+        assert 'status 401: Unauthorized' in str(context.exception)
+        assert len(self.fake_api_server.requests) == 1
+
+
+@unittest.skipUnless(shutil.which('openssl'), 'openssl is required')
+class PodPagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake_api_server = start_fake_api_server(self)
+
+        self.juju_app = str(uuid4())
+        self.fake_api_server.pods = [
+            build_pod(self.juju_app, '{}/{}'.format(self.juju_app, i), True)
+            for i in range(250)
+        ]
+        self.api_server = \
+            APIServer(**self.fake_api_server.api_server_kwargs())
+
+    def test__yields_every_pod_across_pages(self):
+        # Exercise
+        pods = k8s.PodPager(self.api_server,
+                            str(uuid4()),
+                            page_size=100,
+                            labelSelector='juju-app={}'.format(self.juju_app))
+        pod_names = [p['metadata']['name'] for p in pods]
+
+        # Assert
+        assert pod_names == [p['metadata']['name']
+                             for p in self.fake_api_server.pods]
+        assert [r['query']['limit'] for r in self.fake_api_server.requests] \
+            == [['100'], ['100'], ['100']]
+        assert [r['query'].get('continue')
+                for r in self.fake_api_server.requests] == \
+            [None, ['100'], ['200']]
+
+    def test__stops_fetching_pages_once_the_caller_stops(self):
+        # Setup
+        pods = k8s.PodPager(self.api_server,
+                            str(uuid4()),
+                            page_size=100,
+                            labelSelector='juju-app={}'.format(self.juju_app))
+
+        # Exercise
+        pod = next(p for p in pods
+                   if p['metadata']['name'] == '{}-150'.format(self.juju_app))
+
+        # Assert
+        assert pod is not None
+        assert len(self.fake_api_server.requests) == 2
+
+
+@unittest.skipUnless(shutil.which('openssl'), 'openssl is required')
+class UpdateMountedFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake_api_server = start_fake_api_server(self)
+
+        self.juju_app = str(uuid4())
+        self.config_map_name = '{}-config-config'.format(self.juju_app)
+
+        pod = build_pod(self.juju_app, '{}/0'.format(self.juju_app), True)
+        pod['spec'] = {
+            'containers': [{
+                'name': self.juju_app,
+                'volumeMounts': [
+                    {'name': 'juju-data-dir', 'mountPath': '/var/lib/juju'},
+                    {'name': 'config', 'mountPath': '/etc/alertmanager'},
+                ]
+            }],
+            'volumes': [
+                {'name': 'juju-data-dir', 'emptyDir': {}},
+                {'name': 'config',
+                 'configMap': {'name': self.config_map_name}},
+            ]
+        }
+        pod['status']['podIP'] = '10.1.2.3'
+        self.fake_api_server.pods = [pod]
+        self.fake_api_server.config_maps = {
+            self.config_map_name: {'data': {'alertmanager.yml': ''}}
+        }
+
+    def test__patches_the_config_map_mounted_at_the_path(self):
+        # Setup
+        content = str(uuid4())
+
+        # Exercise
+        k8s.update_mounted_file(juju_model=str(uuid4()),
+                                juju_app=self.juju_app,
+                                mount_path='/etc/alertmanager',
+                                file_name='alertmanager.yml',
+                                content=content)
+
+        # Assert
+        config_map = self.fake_api_server.config_maps[self.config_map_name]
+        assert config_map['data'] == {'alertmanager.yml': content}
+
+    def test__raises_APIError_if_nothing_is_mounted_at_the_path(self):
+        # Exercise
+        with self.assertRaises(k8s.APIError):
+            k8s.update_mounted_file(juju_model=str(uuid4()),
+                                    juju_app=self.juju_app,
+                                    mount_path=str(uuid4()),
+                                    file_name='alertmanager.yml',
+                                    content=str(uuid4()))
+
+    def test__get_pod_ips__returns_the_ip_of_every_pod(self):
+        # Setup
+        juju_model = str(uuid4())
+        other_app_pod = build_pod(str(uuid4()), 'other/0', True)
+        other_model_pod = build_pod(self.juju_app,
+                                    '{}/1'.format(self.juju_app), True)
+        other_model_pod['metadata']['namespace'] = str(uuid4())
+        for pod, pod_ip in [(other_app_pod, '10.1.2.4'),
+                            (other_model_pod, '10.1.2.5')]:
+            pod['status']['podIP'] = pod_ip
+            self.fake_api_server.pods.append(pod)
+
+        # Exercise
+        pod_ips = k8s.get_pod_ips(juju_model=juju_model,
+                                  juju_app=self.juju_app)
+
+        # Assert
+        assert pod_ips == ['10.1.2.3']
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@unittest.skipUnless(shutil.which('openssl'), 'openssl is required')
+class RetryPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.retry_policy = k8s.RetryPolicy(read_timeout=0.5,
+                                            deadline=60,
+                                            max_attempts=5,
+                                            failure_threshold=8,
+                                            reset_timeout=30,
+                                            clock=self.clock.monotonic,
+                                            sleep=self.clock.sleep)
+        self.fake_api_server = \
+            start_fake_api_server(self, retry_policy=self.retry_policy)
+
+        self.juju_model = str(uuid4())
+        self.juju_app = str(uuid4())
+        self.juju_unit = '{}/0'.format(self.juju_app)
+        self.fake_api_server.pods = [
+            build_pod(self.juju_app, self.juju_unit, ready=True)
+        ]
+
+    def get_pod_status(self):
+        return k8s.get_pod_status(juju_model=self.juju_model,
+                                  juju_app=self.juju_app,
+                                  juju_unit=self.juju_unit)
+
+    def test__retries_server_errors_with_jittered_exponential_backoff(self):
+        # Setup
+        self.fake_api_server.faults = [
+            {'status': 500}, {'status': 502}, {'status': 503},
+        ]
+
+        # Exercise
+        pod_status = self.get_pod_status()
+
+        # Assert
+        assert pod_status.is_ready
+        assert len(self.fake_api_server.requests) == 4
+        assert len(self.clock.sleeps) == 3
+        for attempt, delay in enumerate(self.clock.sleeps, start=1):
+            assert 0 <= delay <= \
+                self.retry_policy.base_delay * 2 ** (attempt - 1)
+
+    def test__every_attempt_is_recorded_in_the_metrics(self):
+        # Setup
+        self.addCleanup(metrics._samples.clear)
+        metrics._samples.clear()
+        self.fake_api_server.faults = [{'status': 503}, {'delay': 2}]
+
+        # Exercise
+        self.get_pod_status()
+
+        # Assert
+        requests_total = {
+            dict(labels)['code']: value
+            for (name, labels), value in metrics._samples.items()
+            if name == 'k8s_requests_total'
+        }
+        assert requests_total == {'503': 1, 'error': 1, '200': 1}
+        assert metrics._samples[
+            ('k8s_request_duration_seconds_count', (('method', 'GET'),))
+        ] == 3
+
+    def test__honors_retry_after(self):
+        # Setup
+        self.fake_api_server.fail_next(429, retry_after=7)
+
+        # Exercise
+        pod_status = self.get_pod_status()
+
+        # Assert
+        assert pod_status.is_ready
+        assert self.clock.sleeps == [7]
+
+    def test__gives_up_if_retry_after_is_past_the_deadline(self):
+        # Setup
+        self.fake_api_server.fail_next(503, retry_after=120)
+
+        # Exercise
+        with self.assertRaises(k8s.APIError):
+            self.get_pod_status()
+
+        # Assert
+        assert len(self.fake_api_server.requests) == 1
+        assert self.clock.sleeps == []
+
+    def test__retries_a_response_that_takes_longer_than_the_timeout(self):
+        # Setup
+        self.fake_api_server.slow_down(2)
+
+        # Exercise
+        pod_status = self.get_pod_status()
+
+        # Assert
+        assert pod_status.is_ready
+        assert len(self.clock.sleeps) == 1
+
+    def test__gives_up_after_max_attempts(self):
+        # Setup
+        self.fake_api_server.fail_next(503, times=10)
+
+        # Exercise
+        with self.assertRaises(k8s.APIError):
+            self.get_pod_status()
+
+        # Assert
+        assert len(self.fake_api_server.requests) == \
+            self.retry_policy.max_attempts
+
+    def test__circuit_breaker_cuts_off_calls_until_reset_timeout(self):
+        # Setup
+        self.fake_api_server.fail_next(503, times=8)
+        for _ in range(2):
+            with self.assertRaises(k8s.APIError):
+                self.get_pod_status()
+        request_count = len(self.fake_api_server.requests)
+
+        # Exercise
+        with self.assertRaises(k8s.CircuitOpenError):
+            self.get_pod_status()
+        cut_off_request_count = len(self.fake_api_server.requests)
+
+        self.clock.now += self.retry_policy.reset_timeout
+        pod_status = self.get_pod_status()
+
+        # Assert
+        assert request_count == 8
+        assert cut_off_request_count == request_count
+        assert pod_status.is_ready
+
+
 class PodStatusTest(unittest.TestCase):
 
     def test__pod_is_not_running_yet(self):
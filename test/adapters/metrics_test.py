@@ -0,0 +1,90 @@
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('src')
+from adapters import metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        # Ensure that we clean up the tmp directory even when the test
+        # fails or errors out for whatever reason.
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        # Other tests record samples as a side effect
+        metrics._samples.clear()
+        self.addCleanup(metrics._samples.clear)
+        self.textfile = self.tmpdir / 'metrics' / 'charm.prom'
+
+    def test__flush__writes_the_prometheus_text_format(self):
+        # Setup
+        metrics.observe('handler_duration_seconds', 0.5, handler='on_start')
+        metrics.inc('pod_spec_writes_total')
+
+        # Exercise
+        metrics.flush(self.textfile)
+
+        # Assert
+        lines = self.textfile.read_text().splitlines()
+        assert '# TYPE alertmanager_charm_handler_duration_seconds ' \
+            'summary' in lines
+        assert 'alertmanager_charm_handler_duration_seconds_sum' \
+            '{handler="on_start"} 0.5' in lines
+        assert 'alertmanager_charm_handler_duration_seconds_count' \
+            '{handler="on_start"} 1.0' in lines
+        assert 'alertmanager_charm_pod_spec_writes_total 1.0' in lines
+        assert [path.name for path in self.textfile.parent.iterdir()] == \
+            ['charm.prom']
+        assert metrics._samples == {}
+
+    def test__flush__adds_to_what_earlier_hooks_recorded(self):
+        # Setup
+        metrics.inc('k8s_requests_total', method='GET', code=200)
+        metrics.set_gauge('pod_readiness_wait_seconds', 30)
+        metrics.flush(self.textfile)
+
+        metrics.inc('k8s_requests_total', method='GET', code=200)
+        metrics.inc('k8s_requests_total', method='GET', code='error')
+        metrics.set_gauge('pod_readiness_wait_seconds', 12)
+
+        # Exercise
+        metrics.flush(self.textfile)
+
+        # Assert
+        lines = self.textfile.read_text().splitlines()
+        assert 'alertmanager_charm_k8s_requests_total' \
+            '{code="200",method="GET"} 2.0' in lines
+        assert 'alertmanager_charm_k8s_requests_total' \
+            '{code="error",method="GET"} 1.0' in lines
+        assert 'alertmanager_charm_pod_readiness_wait_seconds 12.0' in lines
+
+    def test__flush__escapes_label_values(self):
+        # Setup
+        handler = 'a "quoted"\\name\n'
+        metrics.observe('handler_duration_seconds', 1, handler=handler)
+        metrics.flush(self.textfile)
+        metrics.observe('handler_duration_seconds', 1, handler=handler)
+
+        # Exercise
+        metrics.flush(self.textfile)
+
+        # Assert
+        assert 'alertmanager_charm_handler_duration_seconds_count' \
+            '{handler="a \\"quoted\\"\\\\name\\n"} 2.0' in \
+            self.textfile.read_text().splitlines()
+
+    def test__flush__keeps_the_samples_if_the_file_cannot_be_written(self):
+        # Setup
+        (self.tmpdir / 'metrics').write_text('not a directory')
+        metrics.inc('pod_spec_writes_total')
+
+        # Exercise
+        with self.assertLogs(level='WARNING'):
+            metrics.flush(self.textfile)
+
+        # Assert
+        assert metrics._samples == {('pod_spec_writes_total', ()): 1}
@@ -0,0 +1,121 @@
+import os
+from pathlib import Path
+import pstats
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.append('src')
+from adapters.profiler import (
+    HookProfiler,
+)
+
+
+def handler(event):
+    return event
+
+
+class HookProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        # Ensure that we clean up the tmp directory even when the test
+        # fails or errors out for whatever reason.
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test__handlers_are_left_alone_when_disabled(self):
+        # Setup
+        hook_profiler = HookProfiler(self.tmpdir / 'profiles')
+
+        # Exercise
+        wrapped_handler = hook_profiler.wrap(handler)
+
+        # Assert
+        assert wrapped_handler is handler
+
+    @patch.dict(os.environ, {'JUJU_HOOK_NAME': 'config-changed'})
+    def test__each_run_is_written_to_a_profile(self):
+        # Setup
+        hook_profiler = HookProfiler(self.tmpdir / 'profiles', enabled=True)
+
+        # Exercise
+        with self.assertLogs(level='INFO') as logs:
+            result = hook_profiler.wrap(handler)('event')
+
+        # Assert
+        assert result == 'event'
+
+        paths = hook_profiler.latest_profiles(count=5)
+        assert len(paths) == 1
+        assert paths[0].name.endswith('-config-changed-handler.pstats')
+        assert pstats.Stats(str(paths[0])).total_calls > 0
+
+        assert str(paths[0]) in logs.output[0]
+
+    def test__only_the_most_recent_profiles_are_kept(self):
+        # Setup
+        hook_profiler = HookProfiler(self.tmpdir / 'profiles',
+                                     enabled=True,
+                                     max_profiles=3)
+        (self.tmpdir / 'profiles').mkdir()
+        for index in range(5):
+            name = '20200101T00000{}-start-x.pstats'.format(index)
+            (self.tmpdir / 'profiles' / name).touch()
+
+        # Exercise
+        with self.assertLogs(level='INFO'):
+            hook_profiler.wrap(handler)('event')
+
+        # Assert
+        names = [path.name for path in hook_profiler.latest_profiles(10)]
+        assert len(names) == 3
+        assert names[1:] == ['20200101T000004-start-x.pstats',
+                             '20200101T000003-start-x.pstats']
+
+    def test__failing_to_write_a_profile_does_not_fail_the_handler(self):
+        # Setup
+        (self.tmpdir / 'profiles').write_text('not a directory')
+        hook_profiler = HookProfiler(self.tmpdir / 'profiles', enabled=True)
+
+        # Exercise
+        with self.assertLogs(level='WARNING'):
+            result = hook_profiler.wrap(handler)('event')
+
+        # Assert
+        assert result == 'event'
+        assert hook_profiler.latest_profiles(count=5) == []
+
+    def test__handlers_run_by_a_profiled_handler_are_not_profiled_again(self):
+        # Setup
+        hook_profiler = HookProfiler(self.tmpdir / 'profiles', enabled=True)
+        inner_handler = hook_profiler.wrap(handler)
+
+        def outer_handler(event):
+            return inner_handler(event)
+
+        # Exercise
+        with self.assertLogs(level='INFO'):
+            result = hook_profiler.wrap(outer_handler)('event')
+
+        # Assert
+        assert result == 'event'
+        paths = hook_profiler.latest_profiles(count=5)
+        assert len(paths) == 1
+        assert paths[0].name.endswith('-outer_handler.pstats')
+        assert pstats.Stats(str(paths[0])).total_calls > 0
+
+    def test__failing_to_summarize_a_profile_does_not_fail_the_handler(self):
+        # Setup
+        hook_profiler = HookProfiler(self.tmpdir / 'profiles', enabled=True)
+
+        # Exercise
+        with patch.object(HookProfiler, 'summarize', spec_set=True,
+                          autospec=True,
+                          side_effect=TypeError('empty profile')), \
+                self.assertLogs(level='WARNING'):
+            result = hook_profiler.wrap(handler)('event')
+
+        # Assert
+        assert result == 'event'
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+'''
+Compares the results that pytest-benchmark saved with --benchmark-json
+against the baseline checked in next to this file and exits non-zero if
+any benchmark got slower than the baseline by more than the tolerance.
+
+With --update, the baseline is replaced by the results instead. Only the
+median of each benchmark is kept so that the baseline stays small and
+readable in diffs. Since timings depend on the machine, regenerate the
+baseline whenever the reference machine changes.
+'''
+import argparse
+import json
+from pathlib import Path
+import sys
+
+BASELINE_PATH = Path(__file__).parent / 'baseline.json'
+# How much slower than the baseline a benchmark may get, as a fraction
+DEFAULT_TOLERANCE = 0.25
+
+
+def load_medians(results_path):
+    results = json.loads(Path(results_path).read_text())
+    return {
+        benchmark['fullname']: benchmark['stats']['median']
+        for benchmark in results['benchmarks']
+    }
+
+
+def compare(medians, baseline, tolerance):
+    '''
+    Returns a line of report for every benchmark along with whether any of
+    them regressed past the tolerance.
+    '''
+    lines = []
+    regressed = False
+    for name in sorted(set(medians) | set(baseline)):
+        if name not in baseline:
+            lines.append('NEW      {}'.format(name))
+            continue
+        if name not in medians:
+            lines.append('MISSING  {}'.format(name))
+            continue
+
+        change = medians[name] / baseline[name] - 1
+        if change > tolerance:
+            status = 'SLOWER'
+            regressed = True
+        elif change < -tolerance:
+            status = 'FASTER'
+        else:
+            status = 'OK'
+        lines.append('{:<8} {} {:+.1%} ({:.6f}s vs {:.6f}s)'.format(
+            status, name, change, medians[name], baseline[name]))
+    return lines, regressed
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('results', help='JSON saved by --benchmark-json')
+    parser.add_argument('--tolerance', type=float,
+                        default=DEFAULT_TOLERANCE,
+                        help='Allowed slowdown as a fraction of the '
+                             'baseline (default: %(default)s)')
+    parser.add_argument('--update', action='store_true',
+                        help='Replace the baseline with the results')
+    args = parser.parse_args(argv)
+
+    medians = load_medians(args.results)
+
+    if args.update:
+        BASELINE_PATH.write_text(
+            json.dumps(medians, indent=2, sort_keys=True) + '\n')
+        print('Baseline updated with {} benchmarks'.format(len(medians)))
+        return 0
+
+    baseline = json.loads(BASELINE_PATH.read_text())
+    lines, regressed = compare(medians, baseline, args.tolerance)
+    print('\n'.join(lines))
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,187 @@
+from base64 import b64encode
+import copy
+import sys
+
+import pytest
+
+sys.path.append('src')
+import domain
+
+sys.path.append('test/bench')
+from generators import (
+    build_alertmanager_config_dict,
+    build_dict_tree,
+    build_secrets_dict,
+)
+import yaml
+
+NODES = 20000
+
+
+# The implementations these benchmarks were written to replace, kept here
+# so that the gains stay measurable.
+
+def recursive_merge(a, b, path=None):
+    if path is None:
+        path = []
+    for key in b:
+        if key in a:
+            if isinstance(a[key], dict) and isinstance(b[key], dict):
+                recursive_merge(a[key], b[key], path + [str(key)])
+            elif a[key] == b[key]:
+                pass
+            else:
+                a[key] = b[key]
+        else:
+            a[key] = b[key]
+    return a
+
+
+def deepcopy_to_dict(spec):
+    return copy.deepcopy(spec)
+
+
+def iterative_merge(a, b):
+    return domain.AlertManagerConfigFile(None)._merge(a, b)
+
+
+@pytest.mark.parametrize('merge', [
+    pytest.param(recursive_merge, id='recursive'),
+    pytest.param(iterative_merge, id='iterative'),
+])
+def test__merge_large_config(benchmark, merge):
+    benchmark.group = 'merge {} nodes'.format(NODES)
+
+    def setup():
+        config_dict = build_dict_tree(NODES, leaf='config')
+        secrets_dict = build_dict_tree(NODES, leaf='secret')
+        return (config_dict, secrets_dict), {}
+
+    merged = benchmark.pedantic(merge, setup=setup, rounds=20)
+
+    assert merged == build_dict_tree(NODES, leaf='secret')
+
+
+@pytest.fixture(scope='module')
+def large_pod_spec():
+    # The embedded alertmanager.yml alone is roughly 2 MB
+    config_file = domain.AlertManagerConfigFile(
+        build_alertmanager_config_dict(routes=3500,
+                                       receivers=3500,
+                                       inhibit_rules=3500))
+    return domain.AlertManagerJujuPodSpec(
+        app_name='alertmanager',
+        image_path='prom/alertmanager:v0.20.0',
+        repo_username='',
+        repo_password='',
+        advertised_port=9093,
+        alertmanager_config=config_file)
+
+
+@pytest.mark.parametrize('to_dict', [
+    pytest.param(lambda spec, spec_dict: deepcopy_to_dict(spec_dict),
+                 id='deepcopy'),
+    pytest.param(lambda spec, spec_dict: spec.to_dict(), id='rebuild'),
+])
+def test__pod_spec_to_dict(benchmark, to_dict, large_pod_spec):
+    benchmark.group = 'pod spec to_dict'
+    spec_dict = large_pod_spec.to_dict()
+
+    result = benchmark(to_dict, large_pod_spec, spec_dict)
+
+    assert result == spec_dict
+
+
+RECEIVERS = 5000
+
+
+def scanning_keyed_merge(a, b):
+    # Finds each receiver's counterpart with a linear scan
+    for b_receiver in b['receivers']:
+        for a_receiver in a['receivers']:
+            if a_receiver['name'] == b_receiver['name']:
+                recursive_merge(a_receiver, b_receiver)
+                break
+        else:
+            a['receivers'].append(b_receiver)
+    return a
+
+
+def indexed_keyed_merge(a, b):
+    config_file = domain.AlertManagerConfigFile(a)
+    config_file.update(b, mode=domain.MERGE_KEYED)
+    return config_file.config_dict
+
+
+@pytest.mark.parametrize('merge', [
+    pytest.param(scanning_keyed_merge, id='scanning'),
+    pytest.param(indexed_keyed_merge, id='indexed'),
+])
+def test__keyed_merge_of_receivers(benchmark, merge):
+    benchmark.group = 'keyed merge {} receivers'.format(RECEIVERS)
+
+    def setup():
+        config_dict = build_alertmanager_config_dict(routes=1,
+                                                     receivers=RECEIVERS,
+                                                     inhibit_rules=1)
+        # Sparse secrets for every receiver
+        secrets_dict = {'receivers': [
+            {'name': receiver['name'], 'auth_password': 's3cr3t'}
+            for receiver in reversed(config_dict['receivers'])
+        ]}
+        return (config_dict, secrets_dict), {}
+
+    merged = benchmark.pedantic(merge, setup=setup, rounds=5)
+
+    assert len(merged['receivers']) == RECEIVERS
+    assert all(r['auth_password'] == 's3cr3t' for r in merged['receivers'])
+
+
+OVERLAY_RECEIVERS = 1000
+
+
+@pytest.fixture(scope='module')
+def config_and_secrets_yaml():
+    config_dict = build_alertmanager_config_dict(
+        routes=OVERLAY_RECEIVERS,
+        receivers=OVERLAY_RECEIVERS,
+        inhibit_rules=OVERLAY_RECEIVERS)
+    secrets_dict = build_secrets_dict(receivers=OVERLAY_RECEIVERS, depth=50)
+    return tuple(
+        b64encode(yaml.dump(d, Dumper=yaml.SafeDumper).encode('utf-8'))
+        for d in (config_dict, secrets_dict))
+
+
+@pytest.mark.parametrize('secrets_merge_mode', domain.MERGE_MODES)
+def test__build_alertmanager_config_with_secrets(
+        benchmark, config_and_secrets_yaml, secrets_merge_mode):
+    benchmark.group = 'build config with {} receivers of ' \
+        'secrets'.format(OVERLAY_RECEIVERS)
+    base64_config_yaml, base64_secrets_yaml = config_and_secrets_yaml
+
+    config_file = benchmark.pedantic(
+        domain.build_alertmanager_config,
+        args=(base64_config_yaml, base64_secrets_yaml),
+        kwargs={'secrets_merge_mode': secrets_merge_mode},
+        rounds=5)
+
+    receivers = config_file.config_dict['receivers']
+    assert len(receivers) == OVERLAY_RECEIVERS
+    assert receivers[-1]['pagerduty_configs'][0]['service_key'] == \
+        'secret-key-{}'.format(OVERLAY_RECEIVERS - 1)
+
+
+def test__config_file_yaml_dump(benchmark, config_and_secrets_yaml):
+    benchmark.group = 'build config with {} receivers of ' \
+        'secrets'.format(OVERLAY_RECEIVERS)
+    config_dict = domain.build_alertmanager_config(
+        *config_and_secrets_yaml).config_dict
+
+    def setup():
+        # The dump is memoized, so every round needs a new instance
+        return (domain.AlertManagerConfigFile(config_dict),), {}
+
+    config_yaml = benchmark.pedantic(
+        domain.AlertManagerConfigFile.yaml_dump, setup=setup, rounds=5)
+
+    assert yaml.safe_load(config_yaml) == config_dict
@@ -0,0 +1,175 @@
+'''
+Synthetic data generators for the benchmarks in this directory. The shapes
+mirror what the charm sees in production so that sizes and parse costs are
+representative.
+'''
+
+
+def build_pod(juju_app, index, ready=True):
+    name = '{}-{}'.format(juju_app, index)
+    return {
+        'metadata': {
+            'name': name,
+            'namespace': 'lma',
+            'uid': '00000000-0000-0000-0000-{:012d}'.format(index),
+            'resourceVersion': str(1000 + index),
+            'labels': {
+                'juju-app': juju_app,
+                'controller-revision-hash': '{}-5d8b7c9f4'.format(juju_app),
+                'statefulset.kubernetes.io/pod-name': name,
+            },
+            'annotations': {
+                'juju.io/unit': '{}/{}'.format(juju_app, index),
+                'juju.io/controller': '2ee7ad8b-3c6e-4d71-8d6a-5f7d1c5e1d3a',
+                'juju.io/model': '0b1ad6a1-4b5c-4a43-8a1b-3e8c2f3a9b7d',
+            },
+        },
+        'spec': {
+            'containers': [{
+                'name': juju_app,
+                'image': 'prom/alertmanager:v0.20.0',
+                'args': [
+                    '--config.file=/etc/alertmanager/alertmanager.yml',
+                    '--storage.path=/alertmanager',
+                ],
+                'ports': [
+                    {'name': 'web', 'containerPort': 9093,
+                     'protocol': 'TCP'},
+                    {'name': 'peering-tcp', 'containerPort': 9094,
+                     'protocol': 'TCP'},
+                ],
+            }],
+            'nodeName': 'node-{}'.format(index % 50),
+        },
+        'status': {
+            'phase': 'Running' if ready else 'Pending',
+            'podIP': '10.1.{}.{}'.format(index // 250, index % 250),
+            'conditions': [
+                {'type': 'Initialized', 'status': 'True'},
+                {'type': 'Ready', 'status': str(ready)},
+                {'type': 'ContainersReady', 'status': str(ready)},
+                {'type': 'PodScheduled', 'status': 'True'},
+            ],
+        },
+    }
+
+
+def build_pods(juju_app, count):
+    return [build_pod(juju_app, i) for i in range(count)]
+
+
+def build_alertmanager_config_dict(routes=100,
+                                   receivers=100,
+                                   inhibit_rules=100):
+    receiver_names = ['team-{}-pager'.format(i) for i in range(receivers)]
+
+    return {
+        'global': {
+            'smtp_smarthost': 'localhost:25',
+            'smtp_from': 'alertmanager@example.org',
+            'resolve_timeout': '5m',
+        },
+        'templates': ['/etc/alertmanager/template/*.tmpl'],
+        'route': {
+            'group_by': ['alertname', 'cluster', 'service'],
+            'group_wait': '30s',
+            'group_interval': '5m',
+            'repeat_interval': '3h',
+            'receiver': receiver_names[0],
+            'routes': [
+                {
+                    'match': {
+                        'service': 'service-{}'.format(i),
+                    },
+                    'receiver': receiver_names[i % receivers],
+                    'group_by': ['alertname', 'instance'],
+                    'routes': [{
+                        'match': {'severity': 'critical'},
+                        'receiver': receiver_names[(i + 1) % receivers],
+                        'continue': True,
+                    }],
+                }
+                for i in range(routes)
+            ],
+        },
+        'inhibit_rules': [
+            {
+                'source_match': {'severity': 'critical',
+                                 'service': 'service-{}'.format(i)},
+                'target_match': {'severity': 'warning'},
+                'equal': ['alertname', 'cluster', 'service'],
+            }
+            for i in range(inhibit_rules)
+        ],
+        'receivers': [
+            {
+                'name': name,
+                'email_configs': [{
+                    'to': '{}@example.org'.format(name),
+                    'send_resolved': True,
+                }],
+                'pagerduty_configs': [{
+                    'service_key': '<{}-key>'.format(name),
+                    'description': 'Paging {} about {{{{ .GroupLabels }}}}'
+                                   .format(name),
+                }],
+            }
+            for name in receiver_names
+        ],
+    }
+
+
+def build_dict_tree(nodes, fanout=10, leaf='value'):
+    '''
+    Builds a tree of nested dicts with roughly the given number of nodes,
+    breadth first, so that its keys overlap with any other tree built with
+    the same fanout.
+    '''
+    root = {}
+    frontier = [root]
+    count = 1
+    while count < nodes:
+        next_frontier = []
+        for node in frontier:
+            for i in range(fanout):
+                if count >= nodes:
+                    node['leaf-{}'.format(i)] = leaf
+                    continue
+                child = node['node-{}'.format(i)] = {}
+                next_frontier.append(child)
+                count += 1
+        frontier = next_frontier
+    for node in frontier:
+        node['leaf'] = leaf
+    return root
+
+
+def build_secrets_dict(receivers=100, depth=50):
+    '''
+    Builds the kind of secrets overlay operators keep apart from the config:
+    the credentials of every receiver built by
+    build_alertmanager_config_dict along with a deeply nested tree of
+    global overrides.
+    '''
+    overrides = 'secret'
+    for level in reversed(range(depth)):
+        overrides = {
+            'level-{}'.format(level): overrides,
+            'password-{}'.format(level): 'secret-{}'.format(level),
+        }
+
+    return {
+        'global': {
+            'smtp_auth_password': 'secret',
+            'http_config': overrides,
+        },
+        'receivers': [
+            {
+                'name': 'team-{}-pager'.format(i),
+                'pagerduty_configs': [{
+                    'service_key': 'secret-key-{}'.format(i),
+                }],
+            }
+            for i in range(receivers)
+        ],
+    }
@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# What importing charm.py may cost on top of the ops framework, which every
+# hook needs no matter what. Before the heavy modules were loaded lazily it
+# was around 60ms.
+IMPORT_BUDGET_US = 25000
+RUNS = 5
+
+# Modules that only some hooks need and that must therefore not be loaded
+# just by importing the charm.
+DEFERRED_MODULES = [
+    'adapters.alertmanager',
+    'adapters.cache',
+    'adapters.k8s',
+    'adapters.profiler',
+    'cProfile',
+    'domain',
+    'http.client',
+    'ssl',
+]
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 7),
+                                reason='-X importtime needs Python 3.7')
+
+
+def import_charm():
+    '''
+    Imports charm.py in a fresh interpreter, as Juju does on each hook, and
+    returns the -X importtime report for it as a list of
+    (module_name, depth, cumulative_us) tuples in the order they were
+    printed, that is, each module after the modules it imported.
+    '''
+    # Keep pytest-cov from measuring the child process
+    env = {key: value for key, value in os.environ.items()
+           if not key.startswith('COV_CORE_')}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import charm'],
+        cwd='src', env=env, check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+
+    report = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        report.append((name.strip(), depth, int(cumulative)))
+
+    # Everything printed before the previous top level module was imported
+    # by the interpreter itself, not by the charm.
+    charm_index = next(i for i, (name, depth, _) in enumerate(report)
+                       if name == 'charm' and depth == 0)
+    start = max(i for i, (_, depth, _) in enumerate(report[:charm_index])
+                if depth == 0) + 1
+    return report[start:charm_index + 1]
+
+
+def charm_overhead_us(report):
+    charm_us = report[-1][2]
+    ops_us = sum(cumulative for name, depth, cumulative in report
+                 if depth == 1 and name.split('.')[0] == 'ops')
+    return charm_us - ops_us
+
+
+def test__heavy_modules_are_not_imported_with_the_charm():
+    imported = [name for name, _, _ in import_charm()]
+
+    assert [name for name in DEFERRED_MODULES if name in imported] == []
+
+
+def test__charm_import_time_is_within_budget():
+    # The fastest run is the one least disturbed by whatever else the
+    # machine is doing.
+    overhead_us = min(charm_overhead_us(import_charm())
+                      for _ in range(RUNS))
+
+    assert overhead_us <= IMPORT_BUDGET_US, \
+        "Importing charm.py took {}us on top of ops, over the {}us " \
+        "budget".format(overhead_us, IMPORT_BUDGET_US)
@@ -0,0 +1,59 @@
+import sys
+
+import pytest
+
+sys.path.append('src')
+from adapters import k8s
+
+sys.path.append('test/bench')
+from generators import (
+    build_pod,
+    build_pods,
+)
+
+JUJU_APP = 'alertmanager'
+POD_COUNT = 2000
+
+
+@pytest.fixture
+def pods_api_server(fake_api_server):
+    fake_api_server.pods = build_pods(JUJU_APP, POD_COUNT)
+    # A pod whose name is taken by that of another unit, which makes
+    # get_pod_status page through every pod of the app to find it
+    renamed_pod = build_pod(JUJU_APP, POD_COUNT)
+    renamed_pod['metadata']['name'] = 'renamed'
+    impostor_pod = build_pod(JUJU_APP, POD_COUNT + 1)
+    impostor_pod['metadata']['name'] = '{}-{}'.format(JUJU_APP, POD_COUNT)
+    fake_api_server.pods.extend([renamed_pod, impostor_pod])
+    return fake_api_server
+
+
+@pytest.mark.parametrize('unit_index', [
+    pytest.param(POD_COUNT - 1, id='by-name'),
+    pytest.param(POD_COUNT, id='listing'),
+])
+def test__get_pod_status(benchmark, pods_api_server, unit_index):
+    benchmark.group = 'get_pod_status among {} pods'.format(POD_COUNT)
+    juju_unit = '{}/{}'.format(JUJU_APP, unit_index)
+
+    pod_status = benchmark(k8s.get_pod_status,
+                           juju_model='lma',
+                           juju_app=JUJU_APP,
+                           juju_unit=juju_unit)
+
+    assert pod_status.is_ready
+
+
+def test__pod_status_properties(benchmark):
+    benchmark.group = 'PodStatus'
+    status_dict = build_pod(JUJU_APP, 0)
+
+    def read_properties():
+        pod_status = k8s.PodStatus(status_dict)
+        return (pod_status.is_ready,
+                pod_status.is_running,
+                pod_status.is_unknown)
+
+    properties = benchmark(read_properties)
+
+    assert properties == (True, True, False)
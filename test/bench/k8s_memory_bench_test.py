@@ -0,0 +1,95 @@
+import json
+import sys
+import tracemalloc
+import unittest
+from urllib.parse import (
+    parse_qs,
+    urlparse,
+)
+
+sys.path.append('src')
+from adapters import k8s
+
+sys.path.append('test')
+from fake_apiserver import FakeAPIServer
+
+sys.path.append('test/bench')
+from generators import build_pods
+
+
+class PreEncodedAPIServer:
+    '''
+    Answers pod list requests with responses that were serialized up front
+    so that the measurement only includes what the client allocates: the
+    raw response body and the objects decoded from it.
+    '''
+
+    def __init__(self, pods):
+        self._fake = FakeAPIServer(pods=pods)
+        self._responses = {}
+
+    def encode(self, limit=None):
+        continue_token = None
+        while True:
+            page = self._fake.list_pods('', limit=limit,
+                                        continue_token=continue_token)
+            key = (str(limit) if limit else None, continue_token)
+            self._responses[key] = json.dumps(page).encode('utf-8')
+            continue_token = page['metadata'].get('continue')
+            if not continue_token:
+                return
+
+    def get(self, path):
+        query = parse_qs(urlparse(path).query)
+        key = (query.get('limit', [None])[0], query.get('continue', [None])[0])
+        # Copy the body as reading it off the socket would
+        body = bytes(bytearray(self._responses[key]))
+        return json.loads(body)
+
+
+def measure_peak_memory(func):
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+class PodListPeakMemoryBenchmark(unittest.TestCase):
+
+    pod_count = 5000
+    page_size = 100
+
+    def setUp(self):
+        self.juju_app = 'alertmanager'
+        pods = build_pods(self.juju_app, self.pod_count)
+        # The worst case: the unit's pod is the very last one in the list
+        self.juju_unit = pods[-1]['metadata']['annotations']['juju.io/unit']
+
+        self.api_server = PreEncodedAPIServer(pods)
+        self.api_server.encode()
+        self.api_server.encode(limit=self.page_size)
+
+    def find_in_full_list(self):
+        # How get_pod_status used to do it: one request for the whole list
+        response = self.api_server.get('/api/v1/namespaces/lma/pods?')
+        return k8s._find_unit_pod(response['items'], self.juju_unit)
+
+    def find_in_pages(self):
+        pods = k8s.PodPager(self.api_server, 'lma', page_size=self.page_size)
+        return k8s._find_unit_pod(pods, self.juju_unit)
+
+    def test__paging_bounds_peak_memory(self):
+        # Exercise
+        full_pod, full_peak = measure_peak_memory(self.find_in_full_list)
+        paged_pod, paged_peak = measure_peak_memory(self.find_in_pages)
+
+        # Assert
+        assert full_pod == paged_pod
+        assert paged_peak * 10 < full_peak, \
+            "Peak memory for {} pods: full list {} KiB, " \
+            "paged {} KiB".format(self.pod_count,
+                                  full_peak // 1024,
+                                  paged_peak // 1024)
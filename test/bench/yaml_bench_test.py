@@ -0,0 +1,75 @@
+from base64 import b64encode
+import sys
+
+import pytest
+import yaml
+
+sys.path.append('src')
+import domain
+
+sys.path.append('test/bench')
+from generators import build_alertmanager_config_dict
+
+IMPLEMENTATIONS = [
+    pytest.param((yaml.SafeLoader, yaml.SafeDumper), id='pure-python'),
+    pytest.param(
+        (getattr(yaml, 'CSafeLoader', None),
+         getattr(yaml, 'CSafeDumper', None)),
+        id='libyaml',
+        marks=pytest.mark.skipif(not yaml.__with_libyaml__,
+                                 reason='PyYAML was built without libyaml')
+    ),
+]
+
+
+@pytest.fixture(scope='module')
+def large_config():
+    # Renders to a roughly 2 MB alertmanager.yml
+    return build_alertmanager_config_dict(routes=3500,
+                                          receivers=3500,
+                                          inhibit_rules=3500)
+
+
+@pytest.fixture(scope='module')
+def large_config_yaml(large_config):
+    # The reference output is always produced by the pure-Python dumper
+    return yaml.dump(large_config, Dumper=yaml.SafeDumper)
+
+
+@pytest.mark.parametrize('implementation', IMPLEMENTATIONS)
+def test__load_large_config(benchmark,
+                            implementation,
+                            large_config,
+                            large_config_yaml):
+    loader, _ = implementation
+    benchmark.group = 'yaml load'
+
+    config_dict = benchmark(yaml.load, large_config_yaml, Loader=loader)
+
+    assert config_dict == large_config
+
+
+@pytest.mark.parametrize('implementation', IMPLEMENTATIONS)
+def test__dump_large_config(benchmark,
+                            implementation,
+                            large_config,
+                            large_config_yaml):
+    _, dumper = implementation
+    benchmark.group = 'yaml dump'
+
+    config_yaml = benchmark(yaml.dump, large_config, Dumper=dumper)
+
+    assert config_yaml == large_config_yaml
+
+
+def test__build_alertmanager_config(benchmark, large_config_yaml):
+    base64_config_yaml = b64encode(large_config_yaml.encode('utf-8'))
+    benchmark.group = 'domain'
+
+    def build():
+        return domain.build_alertmanager_config(base64_config_yaml, '')\
+            .yaml_dump()
+
+    config_yaml = benchmark(build)
+
+    assert config_yaml == large_config_yaml
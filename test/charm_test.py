@@ -1,6 +1,13 @@
+from base64 import b64decode
+from functools import partial
+import os
+from pathlib import Path
+import shutil
 import sys
+import tempfile
 import unittest
 from unittest.mock import (
+    ANY,
     call,
     create_autospec,
     MagicMock,
@@ -9,11 +16,15 @@ from unittest.mock import (
 from uuid import uuid4
 
 sys.path.append('lib')
+from ops.charm import (
+    ActionEvent,
+)
 from ops.framework import (
     EventBase,
 )
 from ops.model import (
     ActiveStatus,
+    BlockedStatus,
     MaintenanceStatus,
 )
 from ops.testing import (
@@ -22,16 +33,111 @@ from ops.testing import (
 
 sys.path.append('src')
 from adapters import (
+    alertmanager,
     framework,
+    k8s,
+    metrics,
 )
 import charm
 import domain
+from interface_prometheus import NewPrometheusRelationEvent
+
+sys.path.append('test')
+from fake_alertmanager import FakeAlertManager
 
 
 class CharmTest(unittest.TestCase):
 
+    @patch('charm.set_juju_pod_spec', spec_set=True, autospec=True)
+    def test__pod_spec_is_reconciled_once_per_dispatch(
+            self,
+            mock_set_juju_pod_spec_func):
+        # Setup
+        mock_set_juju_pod_spec_func.return_value = False
+        harness = Harness(charm.Charm)
+        harness.begin()
+
+        # Exercise
+        harness.charm.on.start.emit()
+        harness.charm.on.upgrade_charm.emit()
+        harness.charm.on.config_changed.emit()
+        harness.framework.commit()
+
+        # Assert
+        assert mock_set_juju_pod_spec_func.call_count == 1
+
+    @patch('charm.check_unit_status', spec_set=True, autospec=True)
+    @patch('charm.set_juju_pod_spec', spec_set=True, autospec=True)
+    def test__pod_readiness_is_checked_once_per_hook_while_pending(
+            self,
+            mock_set_juju_pod_spec_func,
+            mock_check_unit_status_func):
+        # Setup
+        mock_set_juju_pod_spec_func.return_value = True
+        mock_check_unit_status_func.return_value = False
+        harness = Harness(charm.Charm)
+        harness.begin()
+
+        # Exercise
+        for _ in range(3):
+            harness.framework.reemit()
+            harness.charm.on.config_changed.emit()
+            harness.framework.commit()
+
+        # Assert
+        assert mock_set_juju_pod_spec_func.call_count == 3
+        assert mock_check_unit_status_func.call_count == 3
+
+    @patch.dict(os.environ, {'JUJU_MODEL_NAME': 'lma',
+                             'JUJU_UNIT_NAME': 'alertmanager/0'})
     @patch('charm.k8s', spec_set=True, autospec=True)
-    @patch('charm.build_juju_unit_status', spec_set=True, autospec=True)
+    @patch('domain.build_juju_unit_status', spec_set=True, autospec=True)
+    def test__fixing_the_config_unblocks_the_unit(
+            self,
+            mock_build_juju_unit_status_func,
+            mock_k8s_mod):
+        # Setup
+        tmpdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for name, value in (
+            ('get_charm_dir', tmpdir),
+            ('get_image_meta', framework.ImageMeta({
+                'registrypath': str(uuid4()),
+                'username': str(uuid4()),
+                'password': str(uuid4()),
+            })),
+        ):
+            patcher = patch.object(framework.FrameworkAdapter, name,
+                                   return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        mock_build_juju_unit_status_func.return_value = ActiveStatus()
+
+        harness = Harness(charm.Charm)
+        harness.begin()
+        harness.set_leader(True)
+        harness.update_config({
+            'alertmanager-config': '',
+            'alertmanager-secrets': '',
+            'alertmanager-secrets-merge': 'replace',
+            'tuning-profile': str(uuid4()),
+        })
+        harness.framework.commit()
+        harness.charm.on.update_status.emit()
+        blocked_status = harness.charm.unit.status
+
+        # Exercise
+        harness.update_config({'tuning-profile': 'default'})
+        harness.framework.commit()
+
+        # Assert
+        assert isinstance(blocked_status, BlockedStatus)
+        assert 'tuning-profile' in blocked_status.message
+        assert harness.charm.unit.status == ActiveStatus()
+        assert mock_k8s_mod.get_pod_status.call_count == 1
+
+    @patch('charm.k8s', spec_set=True, autospec=True)
+    @patch('domain.build_juju_unit_status', spec_set=True, autospec=True)
     def test__init__starts_up_without_a_hitch(
         self,
         mock_build_juju_unit_status_func,
@@ -41,28 +147,320 @@ class CharmTest(unittest.TestCase):
         harness = Harness(charm.Charm)
         harness.begin()
 
+    @patch('charm.set_juju_pod_spec', spec_set=True, autospec=True)
+    def test__handlers_are_profiled_when_profile_hooks_is_set(
+            self,
+            mock_set_juju_pod_spec_func):
+        # Setup
+        tmpdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmpdir)
+        patcher = patch.object(framework.FrameworkAdapter, 'get_charm_dir',
+                               return_value=tmpdir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        mock_set_juju_pod_spec_func.return_value = False
+        harness = Harness(charm.Charm)
+        harness.update_config({'profile-hooks': True})
+        harness.begin()
+
+        # Exercise
+        with self.assertLogs(level='INFO'):
+            harness.charm.on.start.emit()
+            harness.framework.commit()
+
+        # Assert
+        names = [path.name for path in
+                 (tmpdir / charm.profiler.PROFILE_DIR).iterdir()]
+        assert sorted(name.split('-', 2)[2] for name in names) == [
+            'on_pre_commit.pstats',
+            'on_start.pstats',
+        ]
+        assert mock_set_juju_pod_spec_func.call_count == 1
+
+    @patch('charm.check_unit_status', spec_set=True, autospec=True)
+    @patch('charm.set_juju_pod_spec', spec_set=True, autospec=True)
+    def test__handlers_run_by_other_handlers_are_profiled_with_them(
+            self,
+            mock_set_juju_pod_spec_func,
+            mock_check_unit_status_func):
+        # Setup
+        tmpdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmpdir)
+        patcher = patch.object(framework.FrameworkAdapter, 'get_charm_dir',
+                               return_value=tmpdir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # The pod readiness check is emitted from within on_pre_commit
+        mock_set_juju_pod_spec_func.return_value = True
+        mock_check_unit_status_func.return_value = True
+        harness = Harness(charm.Charm)
+        harness.update_config({'profile-hooks': True})
+        harness.begin()
+
+        # Exercise
+        with self.assertLogs(level='INFO') as logs:
+            harness.charm.on.start.emit()
+            harness.framework.commit()
+
+        # Assert
+        names = [path.name for path in
+                 (tmpdir / charm.profiler.PROFILE_DIR).iterdir()]
+        assert sorted(name.split('-', 2)[2] for name in names) == [
+            'on_pre_commit.pstats',
+            'on_start.pstats',
+        ]
+        assert mock_check_unit_status_func.call_count == 1
+        assert not [line for line in logs.output
+                    if line.startswith('WARNING')]
+
+    def test__handlers_are_timed_and_metrics_written_on_commit(self):
+        # Setup
+        tmpdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.addCleanup(metrics._samples.clear)
+        patcher = patch.object(framework.FrameworkAdapter, 'get_charm_dir',
+                               return_value=tmpdir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        harness = Harness(charm.Charm)
+        harness.update_config({'metrics-textfile': 'metrics/charm.prom'})
+        harness.begin()
+
+        # Exercise
+        harness.charm.on.stop.emit()
+        harness.framework.commit()
+
+        # Assert
+        textfile = (tmpdir / 'metrics' / 'charm.prom').read_text()
+        assert 'alertmanager_charm_handler_duration_seconds_count' \
+            '{handler="on_stop"} 1.0' in textfile
+        assert 'on_pre_commit' in textfile
+        assert metrics._samples == {}
+
+
+class OnGetProfilesActionHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+        self.mock_fw_adapter = \
+            create_autospec(framework.FrameworkAdapter, spec_set=True)
+        self.mock_fw_adapter.get_charm_dir.return_value = self.tmpdir
+
+        self.mock_event = create_autospec(ActionEvent)
+        self.mock_event.params = {'count': 1}
+
+    def test__it_returns_the_latest_profiles(self):
+        # Setup
+        hook_profiler = charm.build_hook_profiler(self.mock_fw_adapter,
+                                                  enabled=True)
+        with self.assertLogs(level='INFO'):
+            hook_profiler.wrap(str)('first')
+        with self.assertLogs(level='INFO'):
+            hook_profiler.wrap(repr)('second')
+        latest_path = hook_profiler.latest_profiles(count=1)[0]
+
+        # Exercise
+        charm.on_get_profiles_action_handler(self.mock_event,
+                                             self.mock_fw_adapter)
+
+        # Assert
+        assert self.mock_event.set_results.call_count == 1
+        results = self.mock_event.set_results.call_args[0][0]
+        assert list(results) == ['profile-1']
+        assert results['profile-1']['name'] == latest_path.name
+        assert 'function calls' in results['profile-1']['summary']
+        assert b64decode(results['profile-1']['pstats']) == \
+            latest_path.read_bytes()
+
+    def test__it_fails_if_there_are_no_profiles(self):
+        # Exercise
+        charm.on_get_profiles_action_handler(self.mock_event,
+                                             self.mock_fw_adapter)
+
+        # Assert
+        assert self.mock_event.fail.call_count == 1
+        assert self.mock_event.set_results.call_count == 0
+
 
 class OnConfigChangedHandlerTest(unittest.TestCase):
 
-    # We are mocking the time module here so that we don't actually wait
-    # 1 second per loop during test exectution.
-    @patch('charm.build_juju_unit_status', spec_set=True, autospec=True)
     @patch('charm.k8s', spec_set=True, autospec=True)
-    @patch('charm.time', spec_set=True, autospec=True)
-    @patch('charm.build_juju_pod_spec', spec_set=True, autospec=True)
     @patch('charm.set_juju_pod_spec', spec_set=True, autospec=True)
-    def test__it_blocks_until_pod_is_ready(
+    @patch('charm.publish_alerting_config', spec_set=True, autospec=True)
+    def test__it_marks_the_pod_spec_dirty_and_republishes(
             self,
-            mock_pod_spec,
-            mock_juju_pod_spec,
-            mock_time,
-            mock_k8s_mod,
-            mock_build_juju_unit_status_func):
+            mock_publish_alerting_config_func,
+            mock_set_juju_pod_spec_func,
+            mock_k8s_mod):
+        # Setup
+        mock_reconciler = create_autospec(charm.PodSpecReconciler,
+                                          instance=True)
+        mock_fw_adapter = \
+            create_autospec(framework.FrameworkAdapter, spec_set=True)
+
+        mock_state = MagicMock()
+
+        mock_event_cls = create_autospec(EventBase, spec_set=True)
+        mock_event = mock_event_cls.return_value
+
+        # Exercise
+        charm.on_config_changed_handler(mock_event,
+                                        mock_reconciler,
+                                        mock_fw_adapter,
+                                        mock_state,
+                                        'prometheus')
+
+        # Assert
+        assert mock_reconciler.mark_dirty.call_count == 1
+        assert mock_set_juju_pod_spec_func.call_count == 0
+        assert mock_k8s_mod.get_pod_status.call_count == 0
+        assert mock_publish_alerting_config_func.call_args == \
+            call(mock_reconciler,
+                 mock_fw_adapter,
+                 mock_state,
+                 mock_fw_adapter.get_relations.return_value)
+
+
+class OnClusterChangedHandlerTest(unittest.TestCase):
+
+    @patch('charm.publish_alerting_config', spec_set=True, autospec=True)
+    def test__it_republishes_the_static_targets(
+            self,
+            mock_publish_alerting_config_func):
         # Setup
+        mock_reconciler = create_autospec(charm.PodSpecReconciler,
+                                          instance=True)
+        mock_fw_adapter = \
+            create_autospec(framework.FrameworkAdapter, spec_set=True)
+
+        for discovery, publish_count in [('kubernetes', 0), ('static', 1)]:
+            mock_fw_adapter.get_config.return_value = {
+                'prometheus-discovery': discovery,
+            }
+            mock_publish_alerting_config_func.reset_mock()
+
+            # Exercise
+            charm.on_cluster_changed_handler(create_autospec(EventBase),
+                                             mock_reconciler,
+                                             mock_fw_adapter,
+                                             MagicMock(),
+                                             'prometheus')
+
+            # Assert
+            assert mock_publish_alerting_config_func.call_count == \
+                publish_count
+
+
+class PodSpecReconcilerTest(unittest.TestCase):
+
+    def setUp(self):
         mock_fw_adapter_cls = \
             create_autospec(framework.FrameworkAdapter, spec_set=True)
-        mock_fw_adapter = mock_fw_adapter_cls.return_value
+        self.mock_fw_adapter = mock_fw_adapter_cls.return_value
+        self.mock_state = MagicMock()
+        self.mock_state.readiness_check_pending = False
+        self.mock_check_pod_readiness = MagicMock()
+        self.reconciler = charm.PodSpecReconciler(
+            self.mock_fw_adapter,
+            self.mock_state,
+            self.mock_check_pod_readiness)
 
+    @patch('charm.set_juju_pod_spec', spec_set=True, autospec=True)
+    def test__it_sets_the_pod_spec_once_however_often_marked_dirty(
+            self,
+            mock_set_juju_pod_spec_func):
+        # Setup
+        mock_set_juju_pod_spec_func.return_value = True
+
+        # Exercise
+        for _ in range(3):
+            self.reconciler.mark_dirty()
+        self.reconciler.reconcile()
+        self.reconciler.reconcile()
+
+        # Assert
+        assert mock_set_juju_pod_spec_func.call_count == 1
+        assert mock_set_juju_pod_spec_func.call_args == \
+            call(self.mock_fw_adapter, self.mock_state)
+        assert self.mock_check_pod_readiness.emit.call_count == 1
+
+    @patch('charm.set_juju_pod_spec', spec_set=True, autospec=True)
+    def test__it_does_nothing_unless_marked_dirty(
+            self,
+            mock_set_juju_pod_spec_func):
+        # Exercise
+        self.reconciler.reconcile()
+
+        # Assert
+        assert mock_set_juju_pod_spec_func.call_count == 0
+        assert self.mock_check_pod_readiness.emit.call_count == 0
+
+    @patch('charm.set_juju_pod_spec', spec_set=True, autospec=True)
+    def test__it_does_not_check_the_pod_if_the_pod_spec_is_unchanged(
+            self,
+            mock_set_juju_pod_spec_func):
+        # Setup
+        mock_set_juju_pod_spec_func.return_value = False
+
+        # Exercise
+        self.reconciler.mark_dirty()
+        self.reconciler.reconcile()
+
+        # Assert
+        assert self.mock_check_pod_readiness.emit.call_count == 0
+        assert self.mock_fw_adapter.set_unit_status.call_count == 0
+
+    @patch('charm.set_juju_pod_spec', spec_set=True, autospec=True)
+    def test__it_does_not_check_the_pod_again_while_a_check_is_pending(
+            self,
+            mock_set_juju_pod_spec_func):
+        # Setup
+        mock_set_juju_pod_spec_func.return_value = True
+
+        # Exercise
+        for _ in range(3):
+            self.reconciler.mark_dirty()
+            self.reconciler.reconcile()
+
+        # Assert
+        assert mock_set_juju_pod_spec_func.call_count == 3
+        assert self.mock_check_pod_readiness.emit.call_count == 1
+        assert self.mock_state.readiness_check_pending is True
+
+
+class OnCheckPodReadinessHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        mock_fw_adapter_cls = \
+            create_autospec(framework.FrameworkAdapter, spec_set=True)
+        self.mock_fw_adapter = mock_fw_adapter_cls.return_value
+        self.mock_fw_adapter.get_unit_status.return_value = \
+            MaintenanceStatus("Configuring pod")
+
+        self.mock_event = create_autospec(charm.CheckPodReadinessEvent)
+        self.mock_event.started_at = None
+
+        self.mock_reconciler = create_autospec(charm.PodSpecReconciler,
+                                               instance=True)
+        self.mock_state = MagicMock()
+        self.mock_state.readiness_check_pending = True
+        self.mock_state.config_reload_hash = None
+        self.mock_state.config_errors = {}
+
+        self.addCleanup(metrics._samples.clear)
+
+    @patch('domain.build_juju_unit_status', spec_set=True, autospec=True)
+    @patch('charm.k8s', spec_set=True, autospec=True)
+    def test__it_checks_once_and_defers_until_the_pod_is_ready(
+            self,
+            mock_k8s_mod,
+            mock_build_juju_unit_status_func):
+        # Setup
         mock_juju_unit_states = [
             MaintenanceStatus(str(uuid4())),
             MaintenanceStatus(str(uuid4())),
@@ -70,28 +468,193 @@ class OnConfigChangedHandlerTest(unittest.TestCase):
         ]
         mock_build_juju_unit_status_func.side_effect = mock_juju_unit_states
 
-        mock_event_cls = create_autospec(EventBase, spec_set=True)
-        mock_event = mock_event_cls.return_value
-
         # Exercise
-        charm.on_config_changed_handler(mock_event, mock_fw_adapter)
+        for _ in mock_juju_unit_states:
+            charm.on_check_pod_readiness_handler(self.mock_event,
+                                                 self.mock_reconciler,
+                                                 self.mock_fw_adapter,
+                                                 self.mock_state)
 
         # Assert
-        assert mock_fw_adapter.set_unit_status.call_count == \
-            len(mock_juju_unit_states)
-        assert mock_fw_adapter.set_unit_status.call_args_list == [
+        assert mock_k8s_mod.get_pod_status.call_count == 3
+        assert self.mock_event.defer.call_count == 2
+        assert self.mock_fw_adapter.set_unit_status.call_args_list == [
             call(status) for status in mock_juju_unit_states
         ]
+        assert self.mock_state.readiness_check_pending is False
+
+    @patch('charm.time', spec_set=True, autospec=True)
+    @patch('domain.build_juju_unit_status', spec_set=True, autospec=True)
+    @patch('charm.k8s', spec_set=True, autospec=True)
+    def test__it_records_how_long_the_pod_took_to_become_ready(
+            self,
+            mock_k8s_mod,
+            mock_build_juju_unit_status_func,
+            mock_time_mod):
+        # Setup
+        mock_build_juju_unit_status_func.return_value = ActiveStatus()
+        self.mock_event.started_at = 1000.0
+        mock_time_mod.time.return_value = 1042.5
+
+        # Exercise
+        charm.on_check_pod_readiness_handler(self.mock_event,
+                                             self.mock_reconciler,
+                                             self.mock_fw_adapter,
+                                             self.mock_state)
+
+        # Assert
+        assert metrics._samples == {('pod_readiness_wait_seconds', ()): 42.5}
+
+    @patch('charm.k8s', spec_set=True, autospec=True)
+    def test__it_defers_if_the_api_server_cannot_be_reached(
+            self,
+            mock_k8s_mod):
+        # Setup
+        mock_k8s_mod.APIError = k8s.APIError
+        mock_k8s_mod.get_pod_status.side_effect = \
+            ConnectionRefusedError(str(uuid4()))
+
+        # Exercise
+        charm.on_check_pod_readiness_handler(self.mock_event,
+                                             self.mock_reconciler,
+                                             self.mock_fw_adapter,
+                                             self.mock_state)
+
+        # Assert
+        assert self.mock_event.defer.call_count == 1
+        assert self.mock_fw_adapter.set_unit_status.call_count == 0
+        assert self.mock_state.readiness_check_pending is True
+
+    @patch('charm.check_config_reload', spec_set=True, autospec=True)
+    @patch('charm.k8s', spec_set=True, autospec=True)
+    def test__it_defers_until_the_config_is_reloaded(
+            self,
+            mock_k8s_mod,
+            mock_check_config_reload_func):
+        # Setup
+        mock_check_config_reload_func.return_value = False
+
+        # Exercise
+        charm.on_check_pod_readiness_handler(self.mock_event,
+                                             self.mock_reconciler,
+                                             self.mock_fw_adapter,
+                                             self.mock_state)
+
+        # Assert
+        assert mock_check_config_reload_func.call_args == call(
+            self.mock_reconciler, self.mock_fw_adapter, self.mock_state)
+        assert mock_k8s_mod.get_pod_status.call_count == 0
+        assert self.mock_event.defer.call_count == 1
+        assert self.mock_state.readiness_check_pending is True
+
+    @patch('charm.k8s', spec_set=True, autospec=True)
+    def test__it_keeps_the_unit_blocked_while_the_config_is_invalid(
+            self,
+            mock_k8s_mod):
+        # Setup
+        error = str(uuid4())
+        self.mock_state.config_errors = {'pod-spec': error}
+
+        # Exercise
+        charm.on_check_pod_readiness_handler(self.mock_event,
+                                             self.mock_reconciler,
+                                             self.mock_fw_adapter,
+                                             self.mock_state)
+
+        # Assert
+        assert mock_k8s_mod.get_pod_status.call_count == 0
+        assert self.mock_event.defer.call_count == 0
+        assert self.mock_fw_adapter.set_unit_status.call_args_list == [
+            call(BlockedStatus(error))
+        ]
+        assert self.mock_state.readiness_check_pending is False
+
+
+class GetUnitCountTest(unittest.TestCase):
+
+    def test__it_counts_this_unit_and_its_peers(self):
+        # Setup
+        mock_fw_adapter_cls = \
+            create_autospec(framework.FrameworkAdapter, spec_set=True)
+        mock_fw = mock_fw_adapter_cls.return_value
+        mock_relation = MagicMock()
+        mock_relation.units = {MagicMock(), MagicMock(), MagicMock()}
+        mock_fw.get_relations.return_value = [mock_relation]
+
+        # Exercise
+        unit_count = charm.get_unit_count(mock_fw)
+
+        # Assert
+        assert unit_count == 4
+        assert mock_fw.get_relations.call_args == \
+            call(charm.CLUSTER_RELATION_NAME)
+
+    def test__it_counts_this_unit_before_the_peer_relation_exists(self):
+        # Setup
+        mock_fw_adapter_cls = \
+            create_autospec(framework.FrameworkAdapter, spec_set=True)
+        mock_fw = mock_fw_adapter_cls.return_value
+        mock_fw.get_relations.return_value = []
+
+        # Exercise
+        unit_count = charm.get_unit_count(mock_fw)
+
+        # Assert
+        assert unit_count == 1
 
 
 class OnNewPromRelHandlerTest(unittest.TestCase):
 
-    @patch('charm.PrometheusAlertingConfig', spec_set=True, autospec=True)
+    def setUp(self):
+        self.mock_reconciler = create_autospec(charm.PodSpecReconciler,
+                                               instance=True)
+        self.mock_state = MagicMock()
+        self.mock_state.config_errors = {}
+
+    @patch.dict(os.environ, {'JUJU_MODEL_NAME': 'lma'})
+    def test__it_only_writes_relations_whose_data_is_stale(self):
+        # Setup
+        harness = Harness(charm.Charm)
+        relation_ids = []
+        for index in range(3):
+            relation_id = harness.add_relation(
+                'prometheus', 'prometheus-{}'.format(index))
+            harness.add_relation_unit(relation_id,
+                                      'prometheus-{}/0'.format(index))
+            relation_ids.append(relation_id)
+        harness.begin()
+
+        patcher = patch.object(harness._backend, 'relation_set',
+                               wraps=harness._backend.relation_set)
+        mock_relation_set_func = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Exercise
+        # A redeploying Prometheus fleet updating its own data
+        for value in ('bar', 'baz'):
+            for index, relation_id in enumerate(relation_ids):
+                harness.update_relation_data(relation_id,
+                                             'prometheus-{}/0'.format(index),
+                                             {'foo': value})
+
+        # Assert
+        assert mock_relation_set_func.call_count == 3
+        alerting_configs = {
+            harness.get_relation_data(relation_id,
+                                      harness.model.unit.name)[
+                'alerting_config']
+            for relation_id in relation_ids
+        }
+        assert len(alerting_configs) == 1
+
+    @patch('domain.build_prometheus_alerting_config',
+           spec_set=True, autospec=True)
     def test__it_sets_the_relation_data_correctly(
             self,
-            mock_prometheus_alerting_config_cls):
+            mock_build_prometheus_alerting_config_func):
         # Setup
-        mock_alerting_conf = mock_prometheus_alerting_config_cls.return_value
+        mock_alerting_conf = \
+            mock_build_prometheus_alerting_config_func.return_value
         mock_fw_adapter_cls = \
             create_autospec(framework.FrameworkAdapter,
                             spec_set=True)
@@ -101,9 +664,6 @@ class OnNewPromRelHandlerTest(unittest.TestCase):
         mock_fw_adapter.get_app_name.return_value = str(uuid4())
 
         mock_relation1 = MagicMock()
-        mock_data_bag = MagicMock()
-        mock_relation1.data = \
-            {mock_fw_adapter.get_unit.return_value: mock_data_bag}
 
         relations = MagicMock()
         relations.__iter__.return_value = [
@@ -111,26 +671,145 @@ class OnNewPromRelHandlerTest(unittest.TestCase):
         ]
         mock_fw_adapter.get_relations.return_value = relations
 
-        mock_event_cls = create_autospec(EventBase, spec_set=True)
-        mock_event = mock_event_cls.return_value
+        mock_event = create_autospec(NewPrometheusRelationEvent)
+        mock_event.relation_id = None
 
         mock_rel_name = str(uuid4())
 
         # Exercise
         charm.on_new_prom_rel_handler(mock_event,
+                                      self.mock_reconciler,
                                       mock_fw_adapter,
+                                      self.mock_state,
                                       mock_rel_name)
 
         # Assert
-        assert mock_data_bag.update.call_count == 1
-        assert mock_data_bag.update.call_args == \
-            call({'alerting_config': mock_alerting_conf.to_json.return_value})
+        assert mock_fw_adapter.set_relation_data.call_count == 1
+        assert mock_fw_adapter.set_relation_data.call_args == \
+            call(mock_relation1,
+                 {'alerting_config': mock_alerting_conf.to_json.return_value})
+
+    def test__it_only_updates_the_relation_the_event_is_about(self):
+        # Setup
+        mock_fw_adapter = \
+            create_autospec(framework.FrameworkAdapter, spec_set=True)
+        mock_fw_adapter.get_model_name.return_value = str(uuid4())
+        mock_fw_adapter.get_app_name.return_value = str(uuid4())
+
+        mock_fw_adapter.get_config.return_value = {}
+
+        mock_event = create_autospec(NewPrometheusRelationEvent)
+        mock_event.relation_id = 7
+
+        # Exercise
+        charm.on_new_prom_rel_handler(mock_event,
+                                      self.mock_reconciler,
+                                      mock_fw_adapter,
+                                      self.mock_state,
+                                      'prometheus')
+
+        # Assert
+        assert mock_fw_adapter.get_relation.call_args == \
+            call('prometheus', 7)
+        assert call('prometheus') not in \
+            mock_fw_adapter.get_relations.call_args_list
+        assert mock_fw_adapter.set_relation_data.call_args_list == [
+            call(mock_fw_adapter.get_relation.return_value, ANY),
+        ]
+
+    def test__it_blocks_the_unit_on_an_unknown_discovery_mode(self):
+        # Setup
+        mock_fw_adapter = \
+            create_autospec(framework.FrameworkAdapter, spec_set=True)
+        mock_fw_adapter.get_model_name.return_value = str(uuid4())
+        mock_fw_adapter.get_app_name.return_value = str(uuid4())
+        mock_fw_adapter.get_config.return_value = {
+            'prometheus-discovery': 'dns',
+        }
 
+        mock_event = create_autospec(NewPrometheusRelationEvent)
+        mock_event.relation_id = 7
 
-class OnStartHandlerTest(unittest.TestCase):
+        # Exercise
+        charm.on_new_prom_rel_handler(mock_event,
+                                      self.mock_reconciler,
+                                      mock_fw_adapter,
+                                      self.mock_state,
+                                      'prometheus')
 
-    @patch('charm.build_juju_pod_spec', spec_set=True, autospec=True)
-    @patch('charm.build_alertmanager_config', spec_set=True, autospec=True)
+        # Assert
+        assert mock_fw_adapter.set_relation_data.call_count == 0
+        assert isinstance(mock_fw_adapter.set_unit_status.call_args[0][0],
+                          BlockedStatus)
+        assert list(self.mock_state.config_errors) == ['alerting-config']
+        assert self.mock_reconciler.check_readiness.call_count == 0
+
+    def test__it_unblocks_the_unit_once_the_discovery_mode_is_fixed(self):
+        # Setup
+        mock_fw_adapter = \
+            create_autospec(framework.FrameworkAdapter, spec_set=True)
+        mock_fw_adapter.get_model_name.return_value = str(uuid4())
+        mock_fw_adapter.get_app_name.return_value = str(uuid4())
+        mock_fw_adapter.get_config.return_value = {
+            'prometheus-discovery': 'static',
+        }
+        self.mock_state.config_errors = {'alerting-config': str(uuid4())}
+
+        mock_event = create_autospec(NewPrometheusRelationEvent)
+        mock_event.relation_id = 7
+
+        # Exercise
+        charm.on_new_prom_rel_handler(mock_event,
+                                      self.mock_reconciler,
+                                      mock_fw_adapter,
+                                      self.mock_state,
+                                      'prometheus')
+
+        # Assert
+        assert mock_fw_adapter.set_relation_data.call_count == 1
+        assert mock_fw_adapter.set_unit_status.call_args == \
+            call(MaintenanceStatus("Checking pod readiness"))
+        assert self.mock_state.config_errors == {}
+        assert self.mock_reconciler.check_readiness.call_count == 1
+
+    @patch.dict(os.environ, {'JUJU_MODEL_NAME': 'lma',
+                             'JUJU_UNIT_NAME': 'alertmanager/0'})
+    @patch('charm.k8s', spec_set=True, autospec=True)
+    @patch('domain.build_juju_unit_status', spec_set=True, autospec=True)
+    @patch('charm.set_juju_pod_spec', spec_set=True, autospec=True)
+    def test__fixing_the_discovery_mode_unblocks_the_unit(
+            self,
+            mock_set_juju_pod_spec_func,
+            mock_build_juju_unit_status_func,
+            mock_k8s_mod):
+        # Setup
+        mock_set_juju_pod_spec_func.return_value = False
+        mock_build_juju_unit_status_func.return_value = ActiveStatus()
+        harness = Harness(charm.Charm)
+        relation_id = harness.add_relation('prometheus', 'prometheus')
+        harness.add_relation_unit(relation_id, 'prometheus/0')
+        harness.begin()
+        harness.update_config({'prometheus-discovery': str(uuid4())})
+        harness.framework.commit()
+        harness.charm.on.update_status.emit()
+        blocked_status = harness.charm.unit.status
+
+        # Exercise
+        harness.update_config({'prometheus-discovery': 'static'})
+        harness.framework.commit()
+
+        # Assert
+        assert isinstance(blocked_status, BlockedStatus)
+        assert 'prometheus-discovery' in blocked_status.message
+        assert harness.charm.unit.status == ActiveStatus()
+        assert 'alerting_config' in harness.get_relation_data(
+            relation_id, harness.model.unit.name)
+
+
+class SetJujuPodSpecTest(unittest.TestCase):
+
+    @patch('domain.build_juju_pod_spec', spec_set=True, autospec=True)
+    @patch('domain.build_alertmanager_config', spec_set=True, autospec=True)
     def test__it_updates_the_juju_pod_spec(self,
                                            mock_build_am_config_func,
                                            mock_build_juju_pod_spec_func):
@@ -141,14 +820,13 @@ class OnStartHandlerTest(unittest.TestCase):
         mock_fw = mock_fw_adapter_cls.return_value
         mock_fw.am_i_leader.return_value = True
 
-        mock_event_cls = create_autospec(EventBase, spec_set=True)
-        mock_event = mock_event_cls.return_value
-
         mock_juju_pod_spec = create_autospec(domain.AlertManagerJujuPodSpec)
         mock_build_juju_pod_spec_func.return_value = mock_juju_pod_spec
 
+        mock_state = MagicMock()
+
         # Exercise
-        charm.on_start_handler(mock_event, mock_fw)
+        charm.set_juju_pod_spec(mock_fw, mock_state)
 
         # Assert
         assert mock_build_juju_pod_spec_func.call_count == 1
@@ -156,7 +834,8 @@ class OnStartHandlerTest(unittest.TestCase):
             call(app_name=mock_fw.get_app_name.return_value,
                  charm_config=mock_fw.get_config.return_value,
                  image_meta=mock_fw.get_image_meta.return_value,
-                 alertmanager_config=mock_build_am_config_func.return_value)
+                 alertmanager_config=mock_build_am_config_func.return_value,
+                 unit_count=1)
 
         assert mock_fw.set_pod_spec.call_count == 1
         assert mock_fw.set_pod_spec.call_args == \
@@ -165,3 +844,330 @@ class OnStartHandlerTest(unittest.TestCase):
         assert mock_fw.set_unit_status.call_count == 1
         args, kwargs = mock_fw.set_unit_status.call_args_list[0]
         assert type(args[0]) == MaintenanceStatus
+
+        assert mock_state.pod_spec_hash == \
+            mock_juju_pod_spec.content_hash.return_value
+
+    @patch('domain.build_juju_pod_spec', spec_set=True, autospec=True)
+    @patch('domain.build_alertmanager_config', spec_set=True, autospec=True)
+    def test__it_skips_the_update_if_the_pod_spec_is_unchanged(
+            self,
+            mock_build_am_config_func,
+            mock_build_juju_pod_spec_func):
+        # Setup
+        mock_fw_adapter_cls = \
+            create_autospec(framework.FrameworkAdapter,
+                            spec_set=True)
+        mock_fw = mock_fw_adapter_cls.return_value
+        mock_fw.am_i_leader.return_value = True
+
+        mock_juju_pod_spec = create_autospec(domain.AlertManagerJujuPodSpec)
+        mock_build_juju_pod_spec_func.return_value = mock_juju_pod_spec
+
+        mock_state = MagicMock()
+        mock_state.pod_spec_hash = mock_juju_pod_spec.content_hash()
+
+        # Exercise
+        charm.set_juju_pod_spec(mock_fw, mock_state)
+
+        # Assert
+        assert mock_fw.set_pod_spec.call_count == 0
+        assert mock_fw.set_unit_status.call_count == 0
+
+    @patch('charm.k8s', spec_set=True, autospec=True)
+    @patch('domain.build_juju_pod_spec', spec_set=True, autospec=True)
+    @patch('domain.build_alertmanager_config', spec_set=True, autospec=True)
+    def test__it_sets_the_pod_spec_again_after_losing_leadership(
+            self,
+            mock_build_am_config_func,
+            mock_build_juju_pod_spec_func,
+            mock_k8s_mod):
+        # Setup
+        mock_fw_adapter_cls = \
+            create_autospec(framework.FrameworkAdapter,
+                            spec_set=True)
+        mock_fw = mock_fw_adapter_cls.return_value
+
+        mock_juju_pod_spec = create_autospec(domain.AlertManagerJujuPodSpec)
+        mock_build_juju_pod_spec_func.return_value = mock_juju_pod_spec
+
+        mock_state = MagicMock()
+        mock_state.config_errors = {}
+
+        # Exercise
+        # Another unit sets its own pod spec while this one is not the
+        # leader, then this unit is elected again with the same config.
+        for is_leader in (True, False, True):
+            mock_fw.am_i_leader.return_value = is_leader
+            charm.set_juju_pod_spec(mock_fw, mock_state)
+
+        # Assert
+        assert mock_fw.set_pod_spec.call_count == 2
+        assert mock_k8s_mod.update_mounted_file.call_count == 0
+        assert mock_state.pod_spec_hash == \
+            mock_juju_pod_spec.content_hash.return_value
+
+
+class ReloadAlertManagerConfigTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake_alertmanager = FakeAlertManager().start()
+        self.addCleanup(self.fake_alertmanager.stop)
+
+        patcher = patch(
+            'adapters.alertmanager.AlertManagerAPI',
+            partial(alertmanager.AlertManagerAPI,
+                    port=self.fake_alertmanager.port)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        mock_fw_adapter_cls = \
+            create_autospec(framework.FrameworkAdapter, spec_set=True)
+        self.mock_fw = mock_fw_adapter_cls.return_value
+        self.mock_fw.am_i_leader.return_value = True
+        self.mock_fw.get_config.return_value = {
+            'alertmanager-config': '',
+            'alertmanager-secrets': '',
+            'alertmanager-secrets-merge': 'replace',
+        }
+        self.mock_fw.get_app_name.return_value = 'alertmanager'
+        self.mock_fw.get_charm_dir.return_value = \
+            Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree,
+                        self.mock_fw.get_charm_dir.return_value)
+        self.mock_fw.get_image_meta.return_value = framework.ImageMeta({
+            'registrypath': str(uuid4()),
+            'username': str(uuid4()),
+            'password': str(uuid4()),
+        })
+
+    def build_state_for_previous_config(self):
+        previous_spec = domain.build_juju_pod_spec(
+            app_name='alertmanager',
+            charm_config={},
+            image_meta=self.mock_fw.get_image_meta.return_value,
+            alertmanager_config=domain.AlertManagerConfigFile({'a': 'b'}))
+        self.fake_alertmanager.config_file = \
+            previous_spec.config_file_content
+        self.fake_alertmanager.loaded_config = \
+            previous_spec.config_file_content
+
+        return MagicMock(pod_spec_hash=previous_spec.content_hash(),
+                         pod_layout_hash=previous_spec.layout_hash(),
+                         config_reload_hash=None,
+                         config_reload_deadline=None,
+                         config_errors={})
+
+    def build_new_pod_spec(self):
+        return domain.build_juju_pod_spec(
+            app_name='alertmanager',
+            charm_config={},
+            image_meta=self.mock_fw.get_image_meta.return_value,
+            alertmanager_config=domain.build_alertmanager_config('', ''))
+
+    @patch('charm.time', spec_set=True, autospec=True)
+    @patch('charm.k8s', spec_set=True, autospec=True)
+    def test__it_reloads_instead_of_restarting_on_config_only_changes(
+            self,
+            mock_k8s_mod,
+            mock_time):
+        # Setup
+        mock_state = self.build_state_for_previous_config()
+        mock_time.time.return_value = 1000.0
+        mock_k8s_mod.get_pod_ips.return_value = ['127.0.0.1']
+        mock_reconciler = create_autospec(charm.PodSpecReconciler,
+                                          instance=True)
+
+        def deliver_file(**kwargs):
+            self.fake_alertmanager.config_file = kwargs['content']
+        mock_k8s_mod.update_mounted_file.side_effect = deliver_file
+
+        # Exercise
+        is_changed = charm.set_juju_pod_spec(self.mock_fw, mock_state)
+        is_reloaded = charm.check_config_reload(mock_reconciler,
+                                                self.mock_fw,
+                                                mock_state)
+
+        # Assert
+        new_spec = self.build_new_pod_spec()
+        assert is_changed
+        assert is_reloaded
+        assert self.fake_alertmanager.reloads == 1
+        assert self.fake_alertmanager.loaded_config == \
+            new_spec.config_file_content
+        assert self.mock_fw.set_pod_spec.call_count == 0
+        assert self.mock_fw.set_unit_status.call_args == \
+            call(MaintenanceStatus("Reloading AlertManager config"))
+        assert mock_state.pod_spec_hash is None
+        assert mock_state.pod_layout_hash == new_spec.layout_hash()
+        assert mock_state.config_reload_hash is None
+        assert mock_reconciler.mark_dirty.call_count == 0
+
+    @patch('charm.time', spec_set=True, autospec=True)
+    @patch('charm.k8s', spec_set=True, autospec=True)
+    def test__it_delivers_the_config_again_if_juju_reverts_it(
+            self,
+            mock_k8s_mod,
+            mock_time):
+        # Setup
+        mock_state = self.build_state_for_previous_config()
+        previous_config = self.fake_alertmanager.config_file
+        mock_time.time.return_value = 1000.0
+        mock_k8s_mod.get_pod_ips.return_value = ['127.0.0.1']
+        mock_reconciler = create_autospec(charm.PodSpecReconciler,
+                                          instance=True)
+
+        def deliver_file(**kwargs):
+            self.fake_alertmanager.config_file = kwargs['content']
+        mock_k8s_mod.update_mounted_file.side_effect = deliver_file
+
+        charm.set_juju_pod_spec(self.mock_fw, mock_state)
+        charm.check_config_reload(mock_reconciler, self.mock_fw, mock_state)
+
+        # Exercise
+        # Juju re-applies the pod spec it holds, with the previous file
+        self.fake_alertmanager.config_file = previous_config
+        self.fake_alertmanager.reload()
+        is_changed = charm.set_juju_pod_spec(self.mock_fw, mock_state)
+        is_reloaded = charm.check_config_reload(mock_reconciler,
+                                                self.mock_fw,
+                                                mock_state)
+
+        # Assert
+        assert is_changed
+        assert is_reloaded
+        assert mock_k8s_mod.update_mounted_file.call_count == 2
+        assert self.fake_alertmanager.loaded_config == \
+            self.build_new_pod_spec().config_file_content
+        assert self.mock_fw.set_pod_spec.call_count == 0
+
+    def test__it_blocks_the_unit_on_an_invalid_config(self):
+        # Setup
+        mock_state = self.build_state_for_previous_config()
+        self.mock_fw.get_config.return_value['tuning-profile'] = 'large'
+        self.mock_fw.get_config.return_value['data-retention'] = '5m'
+
+        # Exercise
+        is_changed = charm.set_juju_pod_spec(self.mock_fw, mock_state)
+
+        # Assert
+        assert not is_changed
+        assert self.mock_fw.set_pod_spec.call_count == 0
+        assert self.mock_fw.set_unit_status.call_count == 1
+        args, kwargs = self.mock_fw.set_unit_status.call_args
+        assert isinstance(args[0], BlockedStatus)
+        assert 'data-retention' in args[0].message
+        assert mock_state.config_errors == {'pod-spec': args[0].message}
+
+    def test__it_unblocks_the_unit_once_the_config_is_fixed(self):
+        # Setup
+        mock_state = self.build_state_for_previous_config()
+        mock_state.pod_spec_hash = self.build_new_pod_spec().content_hash()
+        mock_state.config_errors = {'pod-spec': str(uuid4())}
+
+        # Exercise
+        is_changed = charm.set_juju_pod_spec(self.mock_fw, mock_state)
+
+        # Assert
+        assert is_changed
+        assert self.mock_fw.set_pod_spec.call_count == 0
+        assert self.mock_fw.set_unit_status.call_args == \
+            call(MaintenanceStatus("Checking pod readiness"))
+        assert mock_state.config_errors == {}
+
+    @patch('charm.time', spec_set=True, autospec=True)
+    @patch('charm.k8s', spec_set=True, autospec=True)
+    def test__it_asks_again_until_the_replicas_pick_up_the_config(
+            self,
+            mock_k8s_mod,
+            mock_time):
+        # Setup
+        mock_state = self.build_state_for_previous_config()
+        mock_time.time.return_value = 1000.0
+        mock_k8s_mod.get_pod_ips.return_value = ['127.0.0.1']
+        mock_reconciler = create_autospec(charm.PodSpecReconciler,
+                                          instance=True)
+        charm.set_juju_pod_spec(self.mock_fw, mock_state)
+
+        # Exercise
+        is_reloaded_before_sync = charm.check_config_reload(
+            mock_reconciler, self.mock_fw, mock_state)
+        self.fake_alertmanager.config_file = \
+            mock_k8s_mod.update_mounted_file.call_args[1]['content']
+        is_reloaded_after_sync = charm.check_config_reload(
+            mock_reconciler, self.mock_fw, mock_state)
+
+        # Assert
+        assert not is_reloaded_before_sync
+        assert is_reloaded_after_sync
+        assert self.fake_alertmanager.reloads == 2
+        assert self.mock_fw.set_pod_spec.call_count == 0
+        assert mock_reconciler.mark_dirty.call_count == 0
+
+    @patch('charm.time', spec_set=True, autospec=True)
+    @patch('charm.k8s', spec_set=True, autospec=True)
+    def test__it_restarts_if_the_replicas_do_not_pick_up_the_config(
+            self,
+            mock_k8s_mod,
+            mock_time):
+        # Setup
+        mock_state = self.build_state_for_previous_config()
+        previous_config = self.fake_alertmanager.loaded_config
+        mock_time.time.return_value = 1000.0
+        mock_k8s_mod.get_pod_ips.return_value = ['127.0.0.1']
+        mock_reconciler = create_autospec(charm.PodSpecReconciler,
+                                          instance=True)
+        charm.set_juju_pod_spec(self.mock_fw, mock_state)
+
+        # Exercise
+        mock_time.time.return_value += charm.CONFIG_RELOAD_TIMEOUT
+        is_reloaded = charm.check_config_reload(mock_reconciler,
+                                                self.mock_fw,
+                                                mock_state)
+        charm.set_juju_pod_spec(self.mock_fw, mock_state)
+
+        # Assert
+        assert not is_reloaded
+        assert self.fake_alertmanager.reloads == 1
+        assert self.fake_alertmanager.loaded_config == previous_config
+        assert mock_reconciler.mark_dirty.call_count == 1
+        assert self.mock_fw.set_pod_spec.call_count == 1
+        assert mock_state.config_reload_hash is None
+
+    @patch('charm.k8s', spec_set=True, autospec=True)
+    def test__it_restarts_if_the_config_cannot_be_delivered(
+            self,
+            mock_k8s_mod):
+        # Setup
+        mock_state = self.build_state_for_previous_config()
+        mock_k8s_mod.APIError = k8s.APIError
+        mock_k8s_mod.update_mounted_file.side_effect = \
+            k8s.APIError(str(uuid4()))
+
+        # Exercise
+        is_changed = charm.set_juju_pod_spec(self.mock_fw, mock_state)
+
+        # Assert
+        assert is_changed
+        assert self.fake_alertmanager.reloads == 0
+        assert self.mock_fw.set_pod_spec.call_count == 1
+        assert mock_state.config_reload_hash is None
+
+    @patch('charm.k8s', spec_set=True, autospec=True)
+    def test__it_restarts_if_more_than_the_config_changed(
+            self,
+            mock_k8s_mod):
+        # Setup
+        mock_state = self.build_state_for_previous_config()
+        mock_state.pod_layout_hash = str(uuid4())
+
+        # Exercise
+        is_changed = charm.set_juju_pod_spec(self.mock_fw, mock_state)
+
+        # Assert
+        assert is_changed
+        assert self.fake_alertmanager.reloads == 0
+        assert mock_k8s_mod.update_mounted_file.call_count == 0
+        assert self.mock_fw.set_pod_spec.call_count == 1
+        assert mock_state.config_reload_hash is None
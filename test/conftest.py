@@ -0,0 +1,25 @@
+import shutil
+import sys
+
+import pytest
+
+sys.path.append('src')
+sys.path.append('test')
+from fake_apiserver import FakeAPIServer
+
+
+@pytest.fixture
+def fake_api_server():
+    '''
+    A FakeAPIServer that adapters.k8s talks to for the duration of the
+    test. unittest test cases use fake_apiserver.start_fake_api_server.
+    '''
+    if not shutil.which('openssl'):
+        pytest.skip('openssl is required')
+
+    fake = FakeAPIServer().start()
+    try:
+        with fake.patch_k8s():
+            yield fake
+    finally:
+        fake.stop()
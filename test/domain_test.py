@@ -2,6 +2,9 @@ from base64 import b64encode
 import json
 import sys
 import unittest
+from unittest.mock import (
+    patch,
+)
 from uuid import uuid4
 import yaml
 
@@ -110,6 +113,312 @@ class BuildAlertManagerConfig(unittest.TestCase):
         assert yaml.safe_load(config.yaml_dump()) == expected_config
 
 
+class AlertManagerConfigFileTest(unittest.TestCase):
+
+    def test__yaml_dump_is_identical_to_the_pure_python_dumper(self):
+        # Setup
+        with open('templates/alertmanager-config-default.yml') as am_yaml:
+            config_dict = yaml.load(am_yaml, Loader=yaml.SafeLoader)
+        config_dict['unicode'] = 'h\u00e9llo \u2713 \U0001F600'
+        config_dict['multiline'] = 'line 1\nline 2\n'
+        config_dict['long'] = ' '.join(str(uuid4()) for _ in range(20))
+        config_dict['ambiguous'] = ['yes', '012', '1e3', '', None, 2.5]
+        expected_yaml = yaml.dump(config_dict, Dumper=yaml.Dumper)
+
+        # Exercise
+        config_yaml = domain.AlertManagerConfigFile(config_dict).yaml_dump()
+
+        # Assert
+        assert config_yaml == expected_yaml
+
+    def test__update_merges_nested_dicts_and_lets_the_update_win(self):
+        # Setup
+        config_file = domain.AlertManagerConfigFile({
+            'global': {'resolve_timeout': '5m', 'smtp_from': 'a@b'},
+            'receivers': [{'name': 'a'}],
+            'templates': ['x.tmpl'],
+        })
+
+        # Exercise
+        config_file.update({
+            'global': {'smtp_from': 'c@d', 'smtp_auth_password': 's3cr3t'},
+            'receivers': [{'name': 'b'}],
+        })
+
+        # Assert
+        assert config_file.config_dict == {
+            'global': {
+                'resolve_timeout': '5m',
+                'smtp_from': 'c@d',
+                'smtp_auth_password': 's3cr3t',
+            },
+            'receivers': [{'name': 'b'}],
+            'templates': ['x.tmpl'],
+        }
+
+    def test__update_handles_nesting_deeper_than_the_recursion_limit(self):
+        # Setup
+        depth = sys.getrecursionlimit() * 2
+        config_dict = {}
+        secrets_dict = {}
+        config_node = config_dict
+        secrets_node = secrets_dict
+        for _ in range(depth):
+            config_node['keep'] = 'config'
+            config_node = config_node.setdefault('child', {})
+            secrets_node = secrets_node.setdefault('child', {})
+        secrets_node['leaf'] = 'secret'
+
+        config_file = domain.AlertManagerConfigFile(config_dict)
+
+        # Exercise
+        config_file.update(secrets_dict)
+
+        # Assert
+        node = config_file.config_dict
+        for _ in range(depth):
+            assert node['keep'] == 'config'
+            node = node['child']
+        assert node == {'leaf': 'secret'}
+
+
+class AlertManagerConfigFileKeyedMergeTest(unittest.TestCase):
+
+    def build_config_file(self):
+        return domain.AlertManagerConfigFile({
+            'route': {
+                'receiver': 'team-X-mails',
+                'routes': [
+                    {'match': {'service': 'foo'}, 'receiver': 'team-X-mails'},
+                    {
+                        'match': {'service': 'bar'},
+                        'receiver': 'team-Y-pager',
+                        'routes': [{'match': {'severity': 'critical'}}],
+                    },
+                ],
+            },
+            'receivers': [
+                {
+                    'name': 'team-X-mails',
+                    'email_configs': [
+                        {'to': 'team-X@example.org'},
+                        {'to': 'team-X-oncall@example.org'},
+                    ],
+                },
+                {
+                    'name': 'team-Y-pager',
+                    'pagerduty_configs': [{'service_key': ''}],
+                },
+            ],
+        })
+
+    def test__receivers_are_matched_by_name(self):
+        # Setup
+        config_file = self.build_config_file()
+
+        # Exercise
+        config_file.update({
+            'receivers': [{
+                'name': 'team-Y-pager',
+                'pagerduty_configs': [{'service_key': 's3cr3t'}],
+            }],
+        }, mode=domain.MERGE_KEYED)
+
+        # Assert
+        receivers = config_file.config_dict['receivers']
+        assert [r['name'] for r in receivers] == \
+            ['team-X-mails', 'team-Y-pager']
+        assert receivers[1]['pagerduty_configs'] == \
+            [{'service_key': 's3cr3t'}]
+        assert receivers[0] == self.build_config_file().config_dict[
+            'receivers'][0]
+
+    def test__configs_of_a_receiver_are_matched_by_position(self):
+        # Setup
+        config_file = self.build_config_file()
+
+        # Exercise
+        config_file.update({
+            'receivers': [{
+                'name': 'team-X-mails',
+                'email_configs': [
+                    {'auth_password': 'one'},
+                    {'auth_password': 'two'},
+                ],
+            }],
+        }, mode=domain.MERGE_KEYED)
+
+        # Assert
+        assert config_file.config_dict['receivers'][0]['email_configs'] == [
+            {'to': 'team-X@example.org', 'auth_password': 'one'},
+            {'to': 'team-X-oncall@example.org', 'auth_password': 'two'},
+        ]
+
+    def test__nested_routes_are_matched_by_position(self):
+        # Setup
+        config_file = self.build_config_file()
+
+        # Exercise
+        config_file.update({
+            'route': {
+                'routes': [
+                    {},
+                    {'routes': [{'receiver': 'team-X-mails'}]},
+                ],
+            },
+        }, mode=domain.MERGE_KEYED)
+
+        # Assert
+        routes = config_file.config_dict['route']['routes']
+        assert routes[0] == {'match': {'service': 'foo'},
+                             'receiver': 'team-X-mails'}
+        assert routes[1]['routes'] == [{'match': {'severity': 'critical'},
+                                        'receiver': 'team-X-mails'}]
+
+    def test__unmatched_entries_are_appended(self):
+        # Setup
+        config_file = self.build_config_file()
+        new_receiver = {'name': str(uuid4())}
+
+        # Exercise
+        config_file.update({'receivers': [new_receiver]},
+                           mode=domain.MERGE_KEYED)
+
+        # Assert
+        receivers = config_file.config_dict['receivers']
+        assert len(receivers) == 3
+        assert receivers[-1] == new_receiver
+
+    def test__other_lists_are_still_replaced(self):
+        # Setup
+        config_file = domain.AlertManagerConfigFile({
+            'templates': ['a.tmpl', 'b.tmpl'],
+        })
+
+        # Exercise
+        config_file.update({'templates': ['c.tmpl']},
+                           mode=domain.MERGE_KEYED)
+
+        # Assert
+        assert config_file.config_dict['templates'] == ['c.tmpl']
+
+    def test__lists_are_replaced_by_default(self):
+        # Setup
+        config_file = self.build_config_file()
+        receivers = [{'name': 'team-Y-pager'}]
+
+        # Exercise
+        config_file.update({'receivers': receivers})
+
+        # Assert
+        assert config_file.config_dict['receivers'] == receivers
+
+    def test__an_unknown_mode_is_rejected(self):
+        # Setup
+        config_file = self.build_config_file()
+
+        # Exercise and Assert
+        with self.assertRaises(ValueError):
+            config_file.update({}, mode=str(uuid4()))
+
+
+class BuildAlertManagerConfigCacheTest(unittest.TestCase):
+
+    class DictCache:
+
+        def __init__(self):
+            self.entries = {}
+
+        def get(self, key):
+            return self.entries.get(key)
+
+        def put(self, key, text):
+            self.entries[key] = text
+
+    def setUp(self):
+        self.config = b64encode(bytes(yaml.dump({
+            str(uuid4()): str(uuid4()),
+        }), 'utf-8'))
+        self.secrets = b64encode(bytes(yaml.dump({
+            str(uuid4()): str(uuid4()),
+        }), 'utf-8'))
+
+    def test__a_repeat_build_skips_decoding_and_parsing(self):
+        # Setup
+        cache = self.DictCache()
+        expected = domain.build_alertmanager_config(self.config,
+                                                    self.secrets,
+                                                    cache=cache)
+
+        # Exercise
+        with patch('domain.yaml.load') as mock_yaml_load, \
+                patch('domain.b64decode') as mock_b64decode:
+            config = domain.build_alertmanager_config(self.config,
+                                                      self.secrets,
+                                                      cache=cache)
+
+        # Assert
+        assert mock_yaml_load.call_count == 0
+        assert mock_b64decode.call_count == 0
+        assert config.yaml_dump() == expected.yaml_dump()
+
+    def test__different_inputs_do_not_share_an_entry(self):
+        # Setup
+        cache = self.DictCache()
+
+        # Exercise
+        config = domain.build_alertmanager_config(self.config,
+                                                  "",
+                                                  cache=cache)
+        other_config = domain.build_alertmanager_config(self.config,
+                                                        self.secrets,
+                                                        cache=cache)
+
+        # Assert
+        assert len(cache.entries) == 2
+        assert config.yaml_dump() != other_config.yaml_dump()
+
+    def test__merge_modes_do_not_share_an_entry(self):
+        # Setup
+        cache = self.DictCache()
+
+        # Exercise
+        for mode in domain.MERGE_MODES:
+            domain.build_alertmanager_config(self.config,
+                                             self.secrets,
+                                             cache=cache,
+                                             secrets_merge_mode=mode)
+
+        # Assert
+        assert len(cache.entries) == len(domain.MERGE_MODES)
+
+    def test__an_unknown_merge_mode_is_rejected_without_secrets(self):
+        # Setup
+        cache = self.DictCache()
+        domain.build_alertmanager_config(self.config, "", cache=cache)
+
+        # Exercise and assert
+        with self.assertRaises(domain.InvalidConfigError):
+            domain.build_alertmanager_config(self.config,
+                                             "",
+                                             cache=cache,
+                                             secrets_merge_mode='keyd')
+
+    def test__a_cached_config_can_still_be_updated(self):
+        # Setup
+        cache = self.DictCache()
+        domain.build_alertmanager_config(self.config, "", cache=cache)
+        config = domain.build_alertmanager_config(self.config, "",
+                                                  cache=cache)
+        key = str(uuid4())
+
+        # Exercise
+        config.update({key: 'value'})
+
+        # Assert
+        assert yaml.safe_load(config.yaml_dump())[key] == 'value'
+
+
 class BuildJujuPodSpecTest(unittest.TestCase):
 
     def test__pod_spec_is_generated(self):
@@ -155,7 +464,11 @@ class BuildJujuPodSpecTest(unittest.TestCase):
                 '--config.file=/etc/alertmanager/alertmanager.yml',
                 '--storage.path=/alertmanager',
                 '--cluster.listen-address=0.0.0.0:9094',
-                '--cluster.peer=alertmanager-0.alertmanager-endpoints:9094'
+                '--cluster.peer={0}-0.{0}-endpoints:9094'.format(
+                    mock_app_name),
+                '--cluster.gossip-interval=200ms',
+                '--cluster.pushpull-interval=60s',
+                '--cluster.settle-timeout=60s',
             ],
             'ports': [
                 {
@@ -200,6 +513,347 @@ class BuildJujuPodSpecTest(unittest.TestCase):
         }]}
 
 
+class AlertManagerJujuPodSpecTest(unittest.TestCase):
+
+    def build_spec(self, app_name, config_dict):
+        return domain.AlertManagerJujuPodSpec(
+            app_name=app_name,
+            image_path='prom/alertmanager:v0.20.0',
+            repo_username='',
+            repo_password='',
+            advertised_port=9093,
+            alertmanager_config=domain.AlertManagerConfigFile(config_dict))
+
+    def test__content_hash_is_stable_for_the_same_content(self):
+        # Setup
+        app_name = str(uuid4())
+        config_dict = {str(uuid4()): str(uuid4()) for _ in range(10)}
+        reversed_config_dict = dict(reversed(list(config_dict.items())))
+
+        # Exercise
+        spec_hash = self.build_spec(app_name, config_dict).content_hash()
+        other_hash = \
+            self.build_spec(app_name, reversed_config_dict).content_hash()
+
+        # Assert
+        assert spec_hash == other_hash
+
+    def test__content_hash_changes_with_the_content(self):
+        # Setup
+        app_name = str(uuid4())
+
+        # Exercise
+        spec_hash = self.build_spec(app_name, {'a': 'b'}).content_hash()
+        other_hash = self.build_spec(app_name, {'a': 'c'}).content_hash()
+
+        # Assert
+        assert spec_hash != other_hash
+
+    def test__the_tuning_profile_is_rendered_into_the_spec(self):
+        # Setup
+        profile = domain.TUNING_PROFILES['large']._replace(gomaxprocs=3)
+
+        # Exercise
+        container = domain.AlertManagerJujuPodSpec(
+            app_name='alertmanager',
+            image_path='prom/alertmanager:v0.20.0',
+            repo_username='',
+            repo_password='',
+            advertised_port=9093,
+            alertmanager_config=domain.AlertManagerConfigFile({}),
+            tuning_profile=profile).to_dict()['containers'][0]
+
+        # Assert
+        # Juju takes resource limits from constraints, not the pod spec
+        assert 'resources' not in container
+        assert container['config'] == {'GOMAXPROCS': '3'}
+        assert '--data.retention=72h' in container['args']
+        assert '--alerts.gc-interval=10m' in container['args']
+        assert container['readinessProbe']['initialDelaySeconds'] == 15
+        assert container['livenessProbe']['initialDelaySeconds'] == 60
+        assert container['livenessProbe']['timeoutSeconds'] == 30
+
+    def test__the_default_tuning_profile_adds_nothing_to_the_spec(self):
+        # Exercise
+        container = self.build_spec('alertmanager', {}).to_dict()[
+            'containers'][0]
+
+        # Assert
+        assert 'resources' not in container
+        assert 'config' not in container
+        assert not any(arg.startswith(('--data.', '--alerts.'))
+                       for arg in container['args'])
+
+    def test__to_dict_returns_a_new_dict_every_time(self):
+        # Setup
+        spec = self.build_spec(str(uuid4()), {'a': 'b'})
+        spec_dict = spec.to_dict()
+
+        # Exercise
+        spec_dict['containers'][0]['args'].append('--log.level=debug')
+        spec_dict['containers'][0]['files'][0]['files'].clear()
+
+        # Assert
+        container = spec.to_dict()['containers'][0]
+        assert '--log.level=debug' not in container['args']
+        assert container['files'][0]['files'] != {}
+        assert spec.config_file_content == 'a: b\n'
+
+
+class BuildClusterPeersTest(unittest.TestCase):
+
+    def test__there_is_a_peer_per_unit_up_to_the_maximum(self):
+        # Setup
+        app_name = str(uuid4())
+
+        # Exercise
+        peers = [domain.build_cluster_peers(app_name, unit_count)
+                 for unit_count in range(1, 10)]
+
+        # Assert
+        assert [len(p) for p in peers] == [1, 2, 3, 3, 3, 3, 3, 3, 3]
+        assert peers[-1] == [
+            '{0}-{1}.{0}-endpoints:9094'.format(app_name, index)
+            for index in range(domain.MAX_BOOTSTRAP_PEERS)
+        ]
+
+    def test__there_is_always_at_least_one_peer(self):
+        # Exercise
+        peers = domain.build_cluster_peers('alertmanager', 0)
+
+        # Assert
+        assert peers == ['alertmanager-0.alertmanager-endpoints:9094']
+
+
+class BuildGossipTuningTest(unittest.TestCase):
+
+    def test__small_clusters_get_the_alertmanager_defaults(self):
+        # Exercise
+        tunings = {domain.build_gossip_tuning(n) for n in (1, 2)}
+
+        # Assert
+        assert tunings == {domain.GossipTuning(gossip_interval='200ms',
+                                               pushpull_interval='60s',
+                                               settle_timeout='60s')}
+
+    def test__timings_only_change_at_powers_of_two(self):
+        # Exercise
+        tunings = [domain.build_gossip_tuning(n) for n in range(3, 10)]
+
+        # Assert
+        assert len(set(tunings[0:2])) == 1
+        assert len(set(tunings[2:6])) == 1
+        assert tunings[0] != tunings[2] != tunings[6]
+
+    def test__larger_clusters_sync_less_often_and_settle_longer(self):
+        # Exercise
+        small = domain.build_gossip_tuning(3)
+        large = domain.build_gossip_tuning(9)
+
+        # Assert
+        assert large.gossip_interval == small.gossip_interval
+        assert int(large.pushpull_interval[:-1]) > \
+            int(small.pushpull_interval[:-1])
+        assert int(large.settle_timeout[:-1]) > \
+            int(small.settle_timeout[:-1])
+
+
+class BuildTuningProfileTest(unittest.TestCase):
+
+    def test__the_default_profile_keeps_the_previous_pod_spec(self):
+        # Exercise
+        profile = domain.build_tuning_profile({})
+
+        # Assert
+        assert profile == domain.TUNING_PROFILES['default']
+        assert profile.gomaxprocs is None
+        assert profile.data_retention is None
+
+    def test__options_override_the_profile(self):
+        # Exercise
+        profile = domain.build_tuning_profile({
+            'tuning-profile': 'medium',
+            'gomaxprocs': 2,
+            'data-retention': '',
+            'probe-timeout': 0,
+            'liveness-probe-initial-delay': 90,
+        })
+
+        # Assert
+        assert profile == domain.TUNING_PROFILES['medium']._replace(
+            gomaxprocs=2,
+            liveness_initial_delay=90)
+
+    def test__it_rejects_invalid_configs(self):
+        invalid_configs = [
+            {'tuning-profile': str(uuid4())},
+            {'gomaxprocs': -2},
+            {'data-retention': '5 days'},
+            {'probe-timeout': -1},
+            # Each value is valid but they do not work together
+            {'tuning-profile': 'large', 'data-retention': '5m'},
+            {'data-retention': '1h', 'alerts-gc-interval': '90m'},
+        ]
+
+        for charm_config in invalid_configs:
+            with self.subTest(charm_config=charm_config):
+                # Exercise and Assert
+                with self.assertRaises(domain.InvalidConfigError):
+                    domain.build_tuning_profile(charm_config)
+
+    def test__it_parses_go_durations(self):
+        # Assert
+        assert domain.parse_duration('1h30m') == 5400
+        assert domain.parse_duration('200ms') == 0.2
+
+
+class PrometheusAlertingConfigTest(unittest.TestCase):
+
+    def test__to_json__is_canonical(self):
+        # Setup
+        alerting_config = domain.PrometheusAlertingConfig(
+            namespace='lma',
+            label_selector='juju-app=alertmanager')
+
+        # Exercise
+        alerting_json = alerting_config.to_json()
+
+        # Assert
+        assert alerting_json == json.dumps(alerting_config.config_dict,
+                                           sort_keys=True,
+                                           separators=(',', ':'))
+        assert ' ' not in alerting_json
+
+
+class BuildPrometheusAlertingConfigTest(unittest.TestCase):
+
+    def test__it_defaults_to_kubernetes_service_discovery(self):
+        # Exercise
+        alerting_config = domain.build_prometheus_alerting_config(
+            app_name='alertmanager',
+            namespace='lma',
+            charm_config={})
+
+        # Assert
+        alertmanager = alerting_config.config_dict['alertmanagers'][0]
+        assert alertmanager['kubernetes_sd_configs'][0]['namespaces'] == \
+            {'names': ['lma']}
+        assert 'static_configs' not in alertmanager
+
+    def test__it_lists_one_static_target_per_unit(self):
+        # Exercise
+        alerting_config = domain.build_prometheus_alerting_config(
+            app_name='alertmanager',
+            namespace='lma',
+            charm_config={'prometheus-discovery': 'static'},
+            unit_count=2)
+
+        # Assert
+        alertmanager = json.loads(
+            alerting_config.to_json())['alertmanagers'][0]
+        assert alertmanager['static_configs'] == [{
+            'targets': [
+                'alertmanager-0.alertmanager-endpoints.lma.svc:9093',
+                'alertmanager-1.alertmanager-endpoints.lma.svc:9093',
+            ]
+        }]
+        assert 'kubernetes_sd_configs' not in alertmanager
+
+    def test__it_keeps_only_the_web_port_of_discovered_pods(self):
+        # Exercise
+        alerting_config = domain.build_prometheus_alerting_config(
+            app_name='alertmanager',
+            namespace='lma',
+            charm_config={})
+
+        # Assert
+        alertmanager = alerting_config.config_dict['alertmanagers'][0]
+        assert alertmanager['relabel_configs'] == [{
+            'source_labels': ['__meta_kubernetes_pod_container_port_number'],
+            'regex': '9093',
+            'action': 'keep',
+        }]
+
+    def test__it_sets_the_alerting_options(self):
+        # Setup
+        charm_config = {
+            'prometheus-alerting-timeout': '30s',
+            'prometheus-alerting-api-version': 'v2',
+            'prometheus-alerting-path-prefix': '/alertmanager',
+        }
+
+        for discovery in domain.DISCOVERY_MODES:
+            charm_config['prometheus-discovery'] = discovery
+
+            # Exercise
+            alerting_config = domain.build_prometheus_alerting_config(
+                app_name='alertmanager',
+                namespace='lma',
+                charm_config=charm_config)
+
+            # Assert
+            alertmanager = alerting_config.config_dict['alertmanagers'][0]
+            assert alertmanager['timeout'] == '30s'
+            assert alertmanager['api_version'] == 'v2'
+            assert alertmanager['path_prefix'] == '/alertmanager'
+
+    def test__it_takes_any_prometheus_duration_as_the_alerting_timeout(self):
+        for timeout in ['1d', '2w', '1y', '1h30m', '500ms', '0s']:
+            with self.subTest(timeout=timeout):
+                # Exercise
+                alerting_config = domain.build_prometheus_alerting_config(
+                    app_name='alertmanager',
+                    namespace='lma',
+                    charm_config={'prometheus-alerting-timeout': timeout})
+
+                # Assert
+                alertmanager = \
+                    alerting_config.config_dict['alertmanagers'][0]
+                assert alertmanager['timeout'] == timeout
+
+    def test__it_rejects_go_only_durations_as_the_alerting_timeout(self):
+        for timeout in ['1.5s', '500us', '10ns', '1m1h', '30']:
+            with self.subTest(timeout=timeout):
+                # Exercise and assert
+                with self.assertRaises(domain.InvalidConfigError):
+                    domain.build_prometheus_alerting_config(
+                        app_name='alertmanager',
+                        namespace='lma',
+                        charm_config={'prometheus-alerting-timeout': timeout})
+
+    def test__it_leaves_unset_alerting_options_out(self):
+        # Exercise
+        alerting_config = domain.build_prometheus_alerting_config(
+            app_name='alertmanager',
+            namespace='lma',
+            charm_config={'prometheus-alerting-timeout': ''})
+
+        # Assert
+        alertmanager = alerting_config.config_dict['alertmanagers'][0]
+        assert not {'timeout', 'api_version', 'path_prefix'} & \
+            set(alertmanager)
+
+    def test__it_rejects_invalid_alerting_options(self):
+        for option, value in [('prometheus-alerting-timeout', '30'),
+                              ('prometheus-alerting-api-version', 'v3'),
+                              ('prometheus-alerting-path-prefix', 'am')]:
+            with self.subTest(option=option):
+                # Exercise and assert
+                with self.assertRaises(domain.InvalidConfigError):
+                    domain.build_prometheus_alerting_config(
+                        app_name='alertmanager',
+                        namespace='lma',
+                        charm_config={option: value})
+
+    def test__it_rejects_an_unknown_discovery_mode(self):
+        # Exercise and assert
+        with self.assertRaises(domain.InvalidConfigError):
+            domain.build_prometheus_alerting_config(
+                app_name='alertmanager',
+                namespace='lma',
+                charm_config={'prometheus-discovery': 'dns'})
+
+
 class BuildJujuUnitStatusTest(unittest.TestCase):
 
     def test_returns_maintenance_status_if_pod_status_cannot_be_fetched(self):
@@ -0,0 +1,108 @@
+from decimal import Decimal
+import hashlib
+from http.server import BaseHTTPRequestHandler
+import json
+import struct
+import threading
+
+from fake_apiserver import ThreadingHTTPServer
+
+
+class FakeAlertManager:
+    '''
+    An in-process stand-in for the HTTP API of an AlertManager replica.
+    config_file plays the role of the file on disk: it only becomes the
+    loaded config once a reload is requested, just like the real thing.
+    Setting config_file to None makes the next reload fail.
+    '''
+
+    def __init__(self, config_file=''):
+        self.config_file = config_file
+        self.loaded_config = config_file
+        self.last_reload_successful = True
+        self.reloads = 0
+
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._httpd.fake = self
+
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def reload(self):
+        self.reloads += 1
+        self.last_reload_successful = self.config_file is not None
+        if self.last_reload_successful:
+            self.loaded_config = self.config_file
+        return self.last_reload_successful
+
+
+def _config_hash(config_file):
+    # Mirrors md5HashAsMetricValue in AlertManager's config package
+    digest = hashlib.md5(config_file.encode('utf-8')).digest()
+    return float(struct.unpack('<Q', digest[:6] + bytes(2))[0])
+
+
+def _format_go_float(value):
+    # The way Go's strconv formats it in the metrics, e.g. 1.23456789e+14
+    return '{:e}'.format(Decimal(repr(value)).normalize())
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        fake = self.server.fake
+        if self.path == '/metrics':
+            lines = [
+                '# HELP alertmanager_config_hash Hash of the currently '
+                'loaded alertmanager configuration.',
+                '# TYPE alertmanager_config_hash gauge',
+                'alertmanager_config_hash {}'.format(
+                    _format_go_float(_config_hash(fake.loaded_config))),
+                '# TYPE alertmanager_config_last_reload_successful gauge',
+                'alertmanager_config_last_reload_successful {}'.format(
+                    int(fake.last_reload_successful)),
+                'alertmanager_alerts{state="active"} 0',
+            ]
+            self._send(200, 'text/plain; version=0.0.4',
+                       '\n'.join(lines) + '\n')
+        else:
+            self._send_json(404, {})
+
+    def do_POST(self):
+        fake = self.server.fake
+        if self.path == '/-/reload':
+            if fake.reload():
+                self._send_json(200, {})
+            else:
+                self._send(500, 'text/plain', 'failed to reload config')
+        else:
+            self._send_json(404, {})
+
+    def _send_json(self, status, body_dict):
+        self._send(status, 'application/json', json.dumps(body_dict))
+
+    def _send(self, status, content_type, text):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,384 @@
+from contextlib import contextmanager
+from functools import partial
+from http.server import (
+    BaseHTTPRequestHandler,
+    HTTPServer,
+)
+import json
+from pathlib import Path
+import re
+import shutil
+from socketserver import ThreadingMixIn
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+from urllib.parse import (
+    parse_qs,
+    urlparse,
+)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server only has its own from Python 3.7
+    daemon_threads = True
+
+
+class FakeAPIServer:
+    '''
+    An in-process, TLS-enabled stand-in for the Kubernetes API server. It
+    serves the pod list endpoint from an in-memory list of pod dicts and
+    counts TLS handshakes so that tests can assert on connection reuse.
+    Requests that do not carry token are answered with a 401. Setting
+    token without set_token revokes the one in token_path that clients
+    read.
+
+    Pods are filtered by the equality and set-based label selectors and by
+    field selectors on any field, e.g. status.phase. Those whose
+    metadata.namespace is set are only listed in that namespace.
+
+    Watch requests are answered by streaming watch_events as chunked JSON
+    lines. When drop_watches is set, the stream is cut off before it is
+    properly terminated, as an API server or proxy dropping it would.
+
+    Each request first takes the next entry off faults, if any. An entry
+    is a dict that may hold a delay in seconds to wait before responding
+    and a status to respond with instead of handling the request, along
+    with a retry_after value for the Retry-After header. See fail_next and
+    slow_down.
+    '''
+
+    def __init__(self, pods=None):
+        self.pods = pods or []
+        self.handshakes = 0
+        self.requests = []
+        self.drop_connection_after_response = False
+        self.watch_events = []
+        self.drop_watches = False
+        self.config_maps = {}
+        self.faults = []
+        self.token = None
+
+        self._tmpdir = None
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    @property
+    def token_path(self):
+        return str(self._tmpdir / 'token')
+
+    @property
+    def ca_path(self):
+        return str(self._tmpdir / 'ca.crt')
+
+    def api_server_kwargs(self):
+        return {
+            'host': '127.0.0.1',
+            'port': self.port,
+            'token_path': self.token_path,
+            'ca_path': self.ca_path,
+        }
+
+    def set_token(self, token):
+        self.token = token
+        Path(self.token_path).write_text(token)
+
+    def fail_next(self, status, times=1, retry_after=None):
+        fault = {'status': status, 'retry_after': retry_after}
+        self.faults.extend([fault] * times)
+
+    def slow_down(self, delay, times=1):
+        self.faults.extend([{'delay': delay}] * times)
+
+    @contextmanager
+    def patch_k8s(self, **api_server_kwargs):
+        '''
+        Points every APIServer that adapters.k8s creates at this server and
+        resets the connections, credentials and circuit breakers that the
+        module keeps once done.
+        '''
+        from adapters import k8s
+        api_server_cls = partial(k8s.APIServer,
+                                 **dict(self.api_server_kwargs(),
+                                        **api_server_kwargs))
+        try:
+            with patch('adapters.k8s.APIServer', api_server_cls):
+                yield self
+        finally:
+            k8s._pool.close()
+            k8s._credentials.clear()
+            k8s._breakers.clear()
+
+    def start(self):
+        self._tmpdir = Path(tempfile.mkdtemp())
+        key_path = str(self._tmpdir / 'tls.key')
+        subprocess.run(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+             '-days', '1', '-subj', '/CN=kubernetes.default.svc',
+             # The client checks the name it connects to, here the IP
+             '-addext',
+             'subjectAltName=DNS:kubernetes.default.svc,IP:127.0.0.1',
+             '-keyout', key_path, '-out', self.ca_path],
+            check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        self.set_token('fake-token')
+
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(self.ca_path, key_path)
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._httpd.fake = self
+        # Clients that time out hang up on purpose. Don't print about it.
+        self._httpd.handle_error = lambda request, client_address: None
+        self._httpd.socket = ssl_context.wrap_socket(self._httpd.socket,
+                                                     server_side=True)
+
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+        shutil.rmtree(self._tmpdir)
+
+    def list_pods(self, label_selector, field_selector='',
+                  limit=None, continue_token=None, namespace=None):
+        pods = [p for p in self.pods
+                if all((_in_namespace(p, namespace),
+                        _matches_labels(p, label_selector),
+                        _matches_fields(p, field_selector)))]
+
+        metadata = {
+            'resourceVersion': self.list_resource_version()
+        }
+        if limit:
+            # The continue token is simply the offset of the next page
+            start = int(continue_token or 0)
+            end = start + int(limit)
+            if end < len(pods):
+                metadata['continue'] = str(end)
+            pods = pods[start:end]
+
+        return {
+            'kind': 'PodList',
+            'apiVersion': 'v1',
+            'metadata': metadata,
+            'items': pods,
+        }
+
+    def list_resource_version(self):
+        return str(len(self.requests))
+
+    def is_authorized(self, authorization):
+        return authorization == 'Bearer {}'.format(self.token)
+
+
+# A requirement of a label selector, e.g. app=foo, tier!=db, env in (a,b)
+# or !canary
+_LABEL_REQUIREMENT_RE = re.compile(
+    r'\s*(?:(!?)([\w./-]+)\s*(?:(==|=|!=)\s*([\w./-]*)|'
+    r'\s(in|notin)\s*\(([^)]*)\))?)\s*(?:,|$)')
+
+
+def _in_namespace(pod, namespace):
+    pod_namespace = pod['metadata'].get('namespace')
+    return namespace is None or pod_namespace in (None, namespace)
+
+
+def _matches_labels(pod, label_selector):
+    labels = pod['metadata'].get('labels', {})
+    position = 0
+    while position < len(label_selector):
+        match = _LABEL_REQUIREMENT_RE.match(label_selector, position)
+        if not match or match.end() == position:
+            raise ValueError(
+                "Invalid label selector {!r}".format(label_selector))
+        position = match.end()
+
+        negated, key, operator, value, set_operator, values = match.groups()
+        if operator in ('=', '=='):
+            matches = labels.get(key) == value
+        elif operator == '!=':
+            matches = labels.get(key) != value
+        elif set_operator:
+            matches = (labels.get(key) in
+                       [v.strip() for v in values.split(',')]) == \
+                (set_operator == 'in')
+        else:
+            matches = (key in labels) != bool(negated)
+        if not matches:
+            return False
+    return True
+
+
+def _matches_fields(pod, field_selector):
+    for requirement in filter(None, field_selector.split(',')):
+        field, operator, value = re.match(r'([\w.]+)(==|=|!=)(.*)$',
+                                          requirement).groups()
+        actual = pod
+        for key in field.split('.'):
+            actual = actual.get(key, {}) if isinstance(actual, dict) else {}
+        if (actual == value) == (operator == '!='):
+            return False
+    return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # One connection accepted over TLS is one handshake
+        self.server.fake.handshakes += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        fake.requests.append({
+            'path': url.path,
+            'query': query,
+            'authorization': self.headers.get('Authorization'),
+        })
+
+        if self._inject_fault() or not self._authorize():
+            return
+
+        segments = url.path.strip('/').split('/')
+        if segments[:3] == ['api', 'v1', 'namespaces'] and \
+                len(segments) == 5 and segments[4] == 'pods':
+            label_selector = query.get('labelSelector', [''])[0]
+            if query.get('watch', [''])[0] == 'true':
+                events = [e for e in fake.watch_events
+                          if _matches_labels(e['object'], label_selector)]
+                self._send_watch(events, fake.drop_watches)
+                return
+
+            field_selector = query.get('fieldSelector', [''])[0]
+            self._send_json(200, fake.list_pods(
+                label_selector,
+                field_selector,
+                limit=query.get('limit', [None])[0],
+                continue_token=query.get('continue', [None])[0],
+                namespace=segments[3],
+            ))
+        else:
+            self._send_json(404, {'kind': 'Status', 'code': 404})
+
+        if fake.drop_connection_after_response:
+            # Simulate the server silently closing an idle keep-alive
+            # connection without having announced it to the client.
+            fake.drop_connection_after_response = False
+            self.close_connection = True
+
+    def do_PATCH(self):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        body = json.loads(
+            self.rfile.read(int(self.headers['Content-Length'])))
+        fake.requests.append({
+            'method': 'PATCH',
+            'path': url.path,
+            'body': body,
+            'authorization': self.headers.get('Authorization'),
+        })
+
+        if self._inject_fault() or not self._authorize():
+            return
+
+        segments = url.path.strip('/').split('/')
+        name = segments[-1]
+        if segments[:3] == ['api', 'v1', 'namespaces'] and \
+                len(segments) == 6 and segments[4] == 'configmaps' and \
+                name in fake.config_maps:
+            fake.config_maps[name]['data'].update(body.get('data', {}))
+            self._send_json(200, dict(fake.config_maps[name],
+                                      kind='ConfigMap'))
+        else:
+            self._send_json(404, {'kind': 'Status', 'code': 404,
+                                  'message': 'not found'})
+
+    def _inject_fault(self):
+        fake = self.server.fake
+        if not fake.faults:
+            return False
+
+        fault = fake.faults.pop(0)
+        if fault.get('delay'):
+            time.sleep(fault['delay'])
+        if not fault.get('status'):
+            return False
+
+        headers = {}
+        if fault.get('retry_after') is not None:
+            headers['Retry-After'] = str(fault['retry_after'])
+        self._send_json(fault['status'], {
+            'kind': 'Status',
+            'code': fault['status'],
+            'message': 'injected fault',
+        }, headers)
+        return True
+
+    def _authorize(self):
+        if self.server.fake.is_authorized(self.headers.get('Authorization')):
+            return True
+
+        self._send_json(401, {
+            'kind': 'Status',
+            'code': 401,
+            'reason': 'Unauthorized',
+            'message': 'Unauthorized',
+        })
+        return False
+
+    def _send_json(self, status, body_dict, headers=None):
+        body = json.dumps(body_dict).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_watch(self, events, drop):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        if drop:
+            self.wfile.write(b'5\r\n{"ty')
+            self.close_connection = True
+            return
+
+        for event in events:
+            line = json.dumps(event).encode('utf-8') + b'\n'
+            self.wfile.write('{:x}\r\n'.format(len(line)).encode('ascii'))
+            self.wfile.write(line + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+
+def start_fake_api_server(test_case, **api_server_kwargs):
+    '''
+    Starts a FakeAPIServer that adapters.k8s talks to until test_case is
+    done. api_server_kwargs are passed on to every APIServer it creates.
+    '''
+    fake = FakeAPIServer().start()
+    test_case.addCleanup(fake.stop)
+    patcher = fake.patch_k8s(**api_server_kwargs)
+    patcher.__enter__()
+    test_case.addCleanup(patcher.__exit__, None, None, None)
+    return fake
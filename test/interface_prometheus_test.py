@@ -0,0 +1,62 @@
+import sys
+import unittest
+from unittest.mock import patch
+
+sys.path.append('lib')
+from ops.testing import (
+    Harness,
+)
+
+sys.path.append('src')
+import charm
+
+
+class PrometheusInterfaceTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('charm.on_new_prom_rel_handler',
+                        spec_set=True, autospec=True)
+        self.mock_on_new_prom_rel_handler_func = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.harness = Harness(charm.Charm)
+        self.harness.begin()
+        self.relation_id = self.harness.add_relation('prometheus',
+                                                     'prometheus')
+
+    def join(self, unit_name):
+        # Juju always follows relation-joined with relation-changed
+        self.harness.add_relation_unit(self.relation_id, unit_name)
+        self.harness.update_relation_data(self.relation_id, unit_name,
+                                          {'joined': 'true'})
+
+    def emitted_relation_ids(self):
+        return [args[0].relation_id for args, _ in
+                self.mock_on_new_prom_rel_handler_func.call_args_list]
+
+    def test__it_only_emits_when_the_related_units_change(self):
+        # Exercise
+        self.join('prometheus/0')
+        for value in ('a', 'b', 'c'):
+            self.harness.update_relation_data(self.relation_id,
+                                              'prometheus/0',
+                                              {'foo': value})
+        self.join('prometheus/1')
+
+        # Assert
+        assert self.emitted_relation_ids() == [self.relation_id] * 2
+
+    def test__it_emits_again_once_the_relation_is_recreated(self):
+        # Setup
+        self.join('prometheus/0')
+        relation = self.harness.model.get_relation('prometheus',
+                                                   self.relation_id)
+
+        # Exercise
+        self.harness.charm.on['prometheus'].relation_broken.emit(relation)
+        self.harness.update_relation_data(self.relation_id,
+                                          'prometheus/0',
+                                          {'foo': 'bar'})
+
+        # Assert
+        assert self.emitted_relation_ids() == [self.relation_id] * 2